@@ -1,10 +1,19 @@
 import csv
+import sys
 from datetime import datetime
+from pathlib import Path
+
+# Shared allocation kernel lives with the backend
+sys.path.insert(0, str(Path(__file__).parent / 'backend'))
+
+from allocation_core import OrderRecord, allocate
+from allocation_zones import allocate_zoned
 
 # === CONFIG (adjust once) ===
 MAX_PER_CUSTOMER = 1000
 REMOTE_ZONES = {"East", "West"}  # Add your remote zones if needed
-# (Remote reserve logic can be added later—MVP skips it for speed)
+ZONED = False  # Split supply into per-zone budgets (needs a zone column in customers.csv)
+REMOTE_RESERVE_PCT = 10  # Share of supply reserved for REMOTE_ZONES when ZONED
 
 def load_supply():
     with open('supply.txt') as f:
@@ -21,49 +30,33 @@ def load_customers():
             customers.append(row)
     return customers
 
+def _rotation_score(c):
+    """Kernel score reproducing the CLI's per-tier ordering"""
+    if c['tier'] == 'Loyal':
+        # Oldest last_fulfilled_date first (fair rotation)
+        return -c['last_fulfilled_date'].toordinal()
+    # Contract and New: first in CSV order
+    return 0
+
 def allocate_chicks(supply, customers):
-    remaining = supply
-    allocated = []
-    waitlisted = []
-    
-    # 1. Contract farms (fulfill 100% up to MAX_PER_CUSTOMER)
-    contract_customers = [c for c in customers if c['tier'] == 'Contract']
-    for c in contract_customers:
-        qty = min(c['order_qty'], MAX_PER_CUSTOMER)
-        if remaining >= qty:
-            c['allocated'] = qty
-            allocated.append(c)
-            remaining -= qty
-        else:
-            c['allocated'] = 0
-            waitlisted.append(c)
+    records = [
+        OrderRecord(i, c['customer_id'], c['tier'], c['order_qty'], _rotation_score(c),
+                    ref=c, zone=c.get('zone'))
+        for i, c in enumerate(customers)
+    ]
     
-    # 2. Loyal: sort by oldest last_fulfilled_date (fair rotation)
-    loyal_customers = [c for c in customers if c['tier'] == 'Loyal']
-    loyal_customers.sort(key=lambda x: x['last_fulfilled_date'])
-    for c in loyal_customers:
-        qty = min(c['order_qty'], MAX_PER_CUSTOMER)
-        if remaining >= qty:
-            c['allocated'] = qty
-            allocated.append(c)
-            remaining -= qty
-        else:
-            c['allocated'] = 0
-            waitlisted.append(c)
+    # Contract farms (100% up to MAX_PER_CUSTOMER), then Loyal, then New
+    if ZONED:
+        allocated, waitlisted, remaining = allocate_zoned(
+            records, supply, MAX_PER_CUSTOMER, REMOTE_ZONES, REMOTE_RESERVE_PCT
+        )
+    else:
+        allocated, waitlisted, remaining = allocate(records, supply, MAX_PER_CUSTOMER)
     
-    # 3. New customers: first in CSV order
-    new_customers = [c for c in customers if c['tier'] == 'New']
-    for c in new_customers:
-        qty = min(c['order_qty'], MAX_PER_CUSTOMER)
-        if remaining >= qty:
-            c['allocated'] = qty
-            allocated.append(c)
-            remaining -= qty
-        else:
-            c['allocated'] = 0
-            waitlisted.append(c)
+    for r in allocated + waitlisted:
+        r.ref['allocated'] = r.allocated_qty
     
-    return allocated, waitlisted, remaining
+    return [r.ref for r in allocated], [r.ref for r in waitlisted], remaining
 
 def save_results(allocated, waitlisted):
     # Dispatch list for warehouse
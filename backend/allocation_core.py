@@ -0,0 +1,179 @@
+"""ORM-free allocation kernel shared by the Flask engine, the CLI and simulations
+
+Works on compact ``OrderRecord`` objects so sorting and the tier passes
+never touch SQLAlchemy attribute instrumentation or lazy loads.
+"""
+from bisect import bisect_right
+from datetime import date, datetime
+from operator import attrgetter
+from typing import Iterable, List, Optional, Tuple
+
+# Tiers in allocation order
+TIER_ORDER = ('Contract', 'Loyal', 'New')
+
+# Base score per tier
+TIER_SCORES = {'Contract': 100, 'Loyal': 50, 'New': 10}
+
+# Allocation strategies understood by ``allocate``
+STRATEGIES = ('greedy', 'best_fit')
+
+
+class OrderRecord:
+    """Minimal order view used by the allocation kernel"""
+
+    __slots__ = ('order_id', 'customer_id', 'tier', 'order_qty',
+                 'priority_score', 'allocated_qty', 'waitlist_qty', 'ref', 'zone')
+
+    def __init__(self, order_id, customer_id, tier: str, order_qty: int,
+                 priority_score: float = 0.0, ref=None, zone: str = None):
+        self.order_id = order_id
+        self.customer_id = customer_id
+        self.tier = tier
+        self.order_qty = order_qty
+        # Delivery zone, only used by zone-partitioned allocation
+        self.zone = zone
+        self.priority_score = priority_score
+        self.allocated_qty = 0
+        # Remainder put back on the waitlist when an order is split
+        self.waitlist_qty = 0
+        # Caller's original object (ORM order, CSV row, ...), never read here
+        self.ref = ref
+
+    def __repr__(self):
+        return (f"OrderRecord(order_id={self.order_id!r}, tier={self.tier!r}, "
+                f"order_qty={self.order_qty}, priority_score={self.priority_score})")
+
+
+def priority_score(tier: str, last_fulfilled_date: Optional[datetime],
+                   order_date: datetime, priority_level: int,
+                   waitlist_count: int, today: date) -> float:
+    """Priority score of an order as of ``today``"""
+    score = 0.0
+
+    # Tier-based base score
+    score += TIER_SCORES.get(tier, 0)
+
+    # Time since last fulfillment
+    if last_fulfilled_date:
+        days_since = (today - last_fulfilled_date.date()).days
+        score += min(days_since * 2, 100)  # Cap at 100
+    else:
+        score += 30  # New customers get baseline
+
+    # Waiting time for this specific order
+    days_waiting = (today - order_date.date()).days
+    score += days_waiting * 5
+
+    # Priority level from order
+    score += priority_level * 10
+
+    # Outstanding waitlist entries for the customer
+    score += waitlist_count * 20
+
+    return score
+
+
+def allocate(records: Iterable[OrderRecord], supply: int, max_per_customer: int,
+             strategy: str = 'greedy', allow_partial: bool = False,
+             min_partial_qty: int = 1) -> Tuple[List[OrderRecord], List[OrderRecord], int]:
+    """Tier-ordered allocation
+
+    Tiers are served in ``TIER_ORDER``; within a tier, records are taken in
+    descending ``priority_score`` (ties keep input order) and each is
+    allocated ``min(order_qty, max_per_customer)``. Records with an unknown
+    tier are left out of both lists.
+
+    ``'greedy'`` waitlists any record that no longer fits and moves on.
+    ``'best_fit'`` stops the priority pass at the first record that does
+    not fit and packs the rest of that tier largest-fitting-first.
+
+    With ``allow_partial``, supply still stranded after all tiers (at least
+    ``min_partial_qty``) goes to the first waitlisted record: it moves to
+    the allocated list with the leftover as ``allocated_qty`` and the rest
+    of its order, up to ``max_per_customer``, as ``waitlist_qty``.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown allocation strategy: {strategy}")
+
+    by_tier = {tier: [] for tier in TIER_ORDER}
+    for record in records:
+        bucket = by_tier.get(record.tier)
+        if bucket is not None:
+            bucket.append(record)
+
+    allocated = []
+    waitlisted = []
+    remaining = supply
+    by_score = attrgetter('priority_score')
+    fill_tier = _fill_best_fit if strategy == 'best_fit' else _fill_greedy
+
+    for tier in TIER_ORDER:
+        bucket = by_tier[tier]
+        bucket.sort(key=by_score, reverse=True)
+        remaining = fill_tier(bucket, remaining, max_per_customer, allocated, waitlisted)
+
+    if allow_partial and waitlisted and remaining >= max(min_partial_qty, 1):
+        record = waitlisted.pop(0)
+        record.allocated_qty = remaining
+        record.waitlist_qty = min(record.order_qty, max_per_customer) - remaining
+        allocated.append(record)
+        remaining = 0
+
+    return allocated, waitlisted, remaining
+
+
+def _fill_greedy(bucket: List[OrderRecord], remaining: int, max_per_customer: int,
+                 allocated: List[OrderRecord], waitlisted: List[OrderRecord]) -> int:
+    """Take records in priority order, skipping any that no longer fit"""
+    for record in bucket:
+        qty = min(record.order_qty, max_per_customer)
+        if remaining >= qty:
+            record.allocated_qty = qty
+            allocated.append(record)
+            remaining -= qty
+        else:
+            record.allocated_qty = 0
+            waitlisted.append(record)
+    return remaining
+
+
+def _fill_best_fit(bucket: List[OrderRecord], remaining: int, max_per_customer: int,
+                   allocated: List[OrderRecord], waitlisted: List[OrderRecord]) -> int:
+    """Take the priority prefix that fits, then pack the tier's tail best-fit
+
+    The tail is kept sorted by ``(qty, -position)`` so a bisect finds the
+    largest quantity that still fits, preferring the higher-priority record
+    among equal quantities. The tail only starts once less than one capped
+    order of supply is left, so it sees few picks even on very large days.
+    """
+    position = 0
+    for record in bucket:
+        qty = min(record.order_qty, max_per_customer)
+        if remaining < qty:
+            break
+        record.allocated_qty = qty
+        allocated.append(record)
+        remaining -= qty
+        position += 1
+
+    tail = bucket[position:]
+    keys = sorted((min(r.order_qty, max_per_customer), -i) for i, r in enumerate(tail))
+    taken = [False] * len(tail)
+
+    while keys:
+        index = bisect_right(keys, (remaining, 1)) - 1
+        if index < 0:
+            break
+        qty, negative_position = keys.pop(index)
+        record = tail[-negative_position]
+        record.allocated_qty = qty
+        allocated.append(record)
+        taken[-negative_position] = True
+        remaining -= qty
+
+    for record, was_taken in zip(tail, taken):
+        if not was_taken:
+            record.allocated_qty = 0
+            waitlisted.append(record)
+
+    return remaining
@@ -1,7 +1,143 @@
+import json
+import time
 from datetime import datetime, timedelta, date
-from typing import List, Tuple, Dict
-from models import db, Order, Customer, Inventory, Allocation, Waitlist
+from typing import Callable, List, Tuple, Dict
+from sqlalchemy import and_, func, insert, or_, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import aliased, joinedload
+from models import db, Order, Customer, Inventory, Allocation, Waitlist, AllocationRun
 from config import Config
+from clock import local_to_utc
+import allocation_core
+import allocation_sql
+import allocation_vectorized
+import allocation_zones
+from allocation_core import OrderRecord
+from allocation_vectorized import NUMPY_AVAILABLE
+from notifications import (Recipient, allocation_messages, enqueue, waitlist_expired_messages,
+                           waitlist_messages)
+
+# Strategies accepted by the engine: the kernel's plus zone-partitioned
+STRATEGIES = allocation_core.STRATEGIES + (allocation_zones.ZONED,)
+
+
+class AllocationInProgress(RuntimeError):
+    """Another allocation or waitlist run holds the date's lock"""
+
+
+# Queries on the engine's hot paths; query_plans.py checks their plans
+
+def pending_orders_query(allocation_date: date, order_ids: List[int] = None):
+    """The date's pending orders with their customers, in id order"""
+    query = Order.query.options(joinedload(Order.customer)).filter(
+        Order.requested_delivery_date == allocation_date,
+        Order.status == 'pending'
+    )
+    if order_ids is not None:
+        query = query.filter(Order.id.in_(order_ids))
+    return query.order_by(Order.id)
+
+
+def pending_order_rows_query(allocation_date: date):
+    """The date's pending orders as column tuples, with the customer's waiting count"""
+    waiting = db.session.query(
+        Waitlist.customer_id.label('customer_id'),
+        func.count(Waitlist.id).label('waiting')
+    ).filter(Waitlist.status == 'waiting').group_by(Waitlist.customer_id).subquery()
+    
+    return db.session.query(
+        Order.id, Order.order_number, Order.customer_id, Order.order_qty,
+        Order.order_date, func.coalesce(Order.priority_level, 0),
+        Customer.farm_name, Customer.phone, Customer.zone, Customer.tier,
+        Customer.last_fulfilled_date,
+        func.coalesce(waiting.c.waiting, 0)
+    ).join(Customer, Order.customer_id == Customer.id).outerjoin(
+        waiting, waiting.c.customer_id == Order.customer_id
+    ).filter(
+        Order.requested_delivery_date == allocation_date,
+        Order.status == 'pending'
+    ).order_by(Order.id)
+
+
+def waiting_counts_query(allocation_date: date):
+    """``(customer_id, waiting entries)`` for customers with pending orders on the date"""
+    pending_customers = db.session.query(Order.customer_id).filter(
+        Order.requested_delivery_date == allocation_date,
+        Order.status == 'pending'
+    )
+    return db.session.query(
+        Waitlist.customer_id,
+        func.count(Waitlist.id)
+    ).filter(
+        Waitlist.status == 'waiting',
+        Waitlist.customer_id.in_(pending_customers)
+    ).group_by(Waitlist.customer_id)
+
+
+def busy_run_query(allocation_date: date):
+    """The date's running allocation run, if any"""
+    return AllocationRun.query.filter_by(allocation_date=allocation_date, status='running')
+
+
+def eligible_waitlist_query():
+    """Waiting entries whose order has not been cancelled"""
+    return db.session.query(Waitlist).join(Order, Waitlist.order_id == Order.id).filter(
+        Waitlist.status == 'waiting',
+        Order.status != 'cancelled'
+    )
+
+
+def smallest_waiting_qty_query():
+    """Smallest quantity any waiting entry asks for, read off ``ix_waitlist_status_qty``"""
+    return db.session.query(func.min(Waitlist.requested_qty)).filter(
+        Waitlist.status == 'waiting'
+    )
+
+
+def waitlist_page_query(page_size: int, last_key: Tuple = None):
+    """Next page of eligible entries in fulfilment order, after ``(score, id)``"""
+    page = eligible_waitlist_query().with_entities(
+        Waitlist.id, Waitlist.order_id, Waitlist.customer_id,
+        Waitlist.requested_qty, Waitlist.queue_score.label('score')
+    )
+    if last_key is not None:
+        score, entry_id = last_key
+        page = page.filter(or_(
+            Waitlist.queue_score < score,
+            and_(Waitlist.queue_score == score, Waitlist.id > entry_id)
+        ))
+    return page.order_by(Waitlist.queue_score.desc(), Waitlist.id.asc()).limit(page_size)
+
+
+def late_order_dates_query(today: date):
+    """Allocated dates from ``today`` on that still have pending orders"""
+    return db.session.query(Order.requested_delivery_date).join(
+        Inventory, Inventory.date == Order.requested_delivery_date
+    ).filter(
+        Order.requested_delivery_date >= today,
+        Order.status == 'pending',
+        Inventory.allocated_at.isnot(None)
+    ).distinct().order_by(Order.requested_delivery_date)
+
+
+def overdue_dates_query(now: datetime):
+    """Dates with allocations past their pickup deadline"""
+    return db.session.query(Allocation.allocation_date).filter(
+        Allocation.status.in_(('pending', 'confirmed')),
+        Allocation.pickup_deadline < now
+    ).distinct().order_by(Allocation.allocation_date)
+
+
+def overdue_allocations_query(allocation_date: date, now: datetime):
+    """``(id, order_id, allocated_qty)`` of the date's allocations past their deadline"""
+    return db.session.query(
+        Allocation.id, Allocation.order_id, Allocation.allocated_qty
+    ).filter(
+        Allocation.allocation_date == allocation_date,
+        Allocation.status.in_(('pending', 'confirmed')),
+        Allocation.pickup_deadline < now
+    )
+
 
 class AllocationEngine:
     """Enhanced allocation engine with comprehensive date and priority handling"""
@@ -11,10 +147,72 @@ class AllocationEngine:
         self.max_per_customer = self.config.MAX_PER_CUSTOMER
         self.waiting_period_days = self.config.WAITING_PERIOD_DAYS
         self.pickup_deadline_hour = self.config.PICKUP_DEADLINE_HOUR
+        self.business_timezone = self.config.BUSINESS_TIMEZONE
+        self.write_mode = self.config.ALLOCATION_WRITE_MODE
+        self.write_chunk_size = self.config.ALLOCATION_WRITE_CHUNK_SIZE
+        self.engine = self.config.ALLOCATION_ENGINE
+        self.strategy = self.config.ALLOCATION_STRATEGY
+        self.allow_partial = self.config.ALLOCATION_ALLOW_PARTIAL
+        self.min_partial_qty = self.config.ALLOCATION_MIN_PARTIAL_QTY
+        self.lock_wait_seconds = self.config.ALLOCATION_LOCK_WAIT_SECONDS
+        self.lock_ttl_seconds = self.config.ALLOCATION_LOCK_TTL_SECONDS
+        self.waitlist_page_size = self.config.WAITLIST_PAGE_SIZE
+        self.reallocation_pickup_hours = self.config.REALLOCATION_PICKUP_HOURS
+        self.remote_zones = self.config.REMOTE_ZONES
+        self.remote_reserve_pct = self.config.REMOTE_ZONE_RESERVE_PCT
+        self.zone_workers = self.config.ALLOCATION_ZONE_WORKERS
+        self.zone_parallel_min_orders = self.config.ALLOCATION_ZONE_PARALLEL_MIN_ORDERS
     
-    def allocate_for_date(self, allocation_date: date) -> Dict:
-        """Main allocation function for a specific date"""
+    def allocate_for_date(self, allocation_date: date, write_mode: str = None,
+                          engine: str = None, strategy: str = None,
+                          allow_partial: bool = None, idempotency_key: str = None) -> Dict:
+        """Main allocation function for a specific date
+        
+        ``write_mode`` overrides ``Config.ALLOCATION_WRITE_MODE``: ``'orm'``
+        flushes everything in one unit of work, ``'bulk'`` writes in chunks
+        with executemany inserts and set-based updates.
         
+        ``engine`` overrides ``Config.ALLOCATION_ENGINE``: ``'python'`` scores
+        loaded ORM orders with the allocation kernel, ``'numpy'`` scores and
+        allocates column arrays and always writes in bulk mode, ``'sql'``
+        ranks, allocates and writes inside the database in one transaction.
+        
+        ``strategy`` and ``allow_partial`` override ``ALLOCATION_STRATEGY`` and
+        ``ALLOCATION_ALLOW_PARTIAL`` (see ``allocation_core.allocate``);
+        ``'zoned'`` splits supply into per-zone budgets with reserves for
+        ``REMOTE_ZONES`` (see ``allocation_zones``). Only the python engine
+        supports anything but plain greedy. The response
+        reports ``supply`` and ``utilization`` so strategies can be compared.
+        
+        Runs hold the date's run lock (see ``_run_exclusive``); a repeated
+        ``idempotency_key`` returns the stored result with ``replayed`` set.
+        """
+        write_mode = write_mode or self.write_mode
+        if write_mode not in ('orm', 'bulk'):
+            raise ValueError(f"Unknown allocation write mode: {write_mode}")
+        
+        engine = engine or self.engine
+        if engine not in ('python', 'numpy', 'sql'):
+            raise ValueError(f"Unknown allocation engine: {engine}")
+        if engine == 'numpy' and not NUMPY_AVAILABLE:
+            raise ValueError("The numpy allocation engine requires numpy")
+        
+        strategy = strategy or self.strategy
+        allow_partial = self.allow_partial if allow_partial is None else allow_partial
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown allocation strategy: {strategy}")
+        if engine != 'python' and (strategy != 'greedy' or allow_partial):
+            raise ValueError(f"The {engine} allocation engine only supports greedy allocation")
+        
+        return self._run_exclusive(
+            allocation_date, 'allocation', idempotency_key,
+            lambda: self._allocate_for_date(allocation_date, write_mode, engine,
+                                            strategy, allow_partial)
+        )
+    
+    def _allocate_for_date(self, allocation_date: date, write_mode: str, engine: str,
+                           strategy: str, allow_partial: bool) -> Dict:
+        """Allocate a date under its run lock"""
         # Get inventory for the date
         inventory = Inventory.query.filter_by(date=allocation_date).first()
         if not inventory:
@@ -22,39 +220,402 @@ class AllocationEngine:
         
         supply = inventory.actual_supply or inventory.expected_supply
         
-        # Get pending orders for this date
-        orders = Order.query.filter(
-            Order.requested_delivery_date == allocation_date,
-            Order.status == 'pending'
-        ).all()
+        # A date that has already been allocated only places what is still pending
+        if inventory.allocated_at:
+            return self._allocate_incremental(allocation_date, None, write_mode,
+                                              strategy, allow_partial)
+        
+        # Single reference time for scoring and fulfilment stamps
+        as_of = datetime.utcnow()
+        
+        if engine == 'numpy':
+            return self._allocate_vectorized(inventory.id, supply, allocation_date, as_of)
+        
+        if engine == 'sql':
+            allocated, waitlisted, remaining, total_orders = allocation_sql.allocate_in_database(
+                db.session, inventory.id, supply, allocation_date, as_of,
+                self.max_per_customer, self._pickup_deadline(allocation_date, as_of)
+            )
+            if not total_orders:
+                self._bulk_update_inventory(inventory.id, 0, supply, as_of)
+            messages = self._notification_messages(
+                allocated, waitlisted, self._pickup_deadline(allocation_date, as_of))
+            enqueue(message for order_messages in messages.values() for message in order_messages)
+            db.session.commit()
+            
+            return self._allocation_result(allocation_date, supply, allocated, waitlisted,
+                                           remaining, total_orders, strategy)
+        
+        return self._allocate_pending(inventory, supply, 0, supply, allocation_date, as_of,
+                                      write_mode, strategy, allow_partial)
+    
+    def allocate_incremental(self, allocation_date: date, order_ids: List[int] = None,
+                             write_mode: str = None, strategy: str = None,
+                             allow_partial: bool = None, idempotency_key: str = None,
+                             lock_wait: float = None) -> Dict:
+        """Allocate late or changed orders against an already-allocated date
+        
+        Only orders still ``pending`` for the date (optionally restricted to
+        ``order_ids``) are scored and placed against ``Inventory.remaining``;
+        orders handled by earlier runs are not touched, so the cost tracks
+        the delta rather than the whole day. ``lock_wait`` overrides
+        ``ALLOCATION_LOCK_WAIT_SECONDS`` (0 to give up at once if busy).
+        """
+        write_mode = write_mode or self.write_mode
+        if write_mode not in ('orm', 'bulk'):
+            raise ValueError(f"Unknown allocation write mode: {write_mode}")
+        
+        strategy = strategy or self.strategy
+        allow_partial = self.allow_partial if allow_partial is None else allow_partial
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown allocation strategy: {strategy}")
+        
+        return self._run_exclusive(
+            allocation_date, 'incremental', idempotency_key,
+            lambda: self._allocate_incremental(allocation_date, order_ids, write_mode,
+                                               strategy, allow_partial),
+            lock_wait
+        )
+    
+    def _allocate_incremental(self, allocation_date: date, order_ids: List[int],
+                              write_mode: str, strategy: str, allow_partial: bool) -> Dict:
+        """Allocate pending orders of an allocated date under its run lock"""
+        inventory = Inventory.query.filter_by(date=allocation_date).first()
+        if not inventory:
+            raise ValueError(f"No inventory found for {allocation_date}")
+        if not inventory.allocated_at:
+            raise ValueError(f"Allocation has not run for {allocation_date}")
+        
+        supply = inventory.actual_supply or inventory.expected_supply
+        
+        return self._allocate_pending(
+            inventory, supply, inventory.allocated or 0, inventory.remaining or 0,
+            allocation_date, datetime.utcnow(), write_mode, strategy, allow_partial,
+            order_ids
+        )
+    
+    def _run_exclusive(self, allocation_date: date, kind: str, idempotency_key: str,
+                       run: Callable[[], Dict], lock_wait: float = None) -> Dict:
+        """Run ``run`` while holding the date's run lock
+        
+        The lock is an ``AllocationRun`` row in status ``running``, claimed in
+        a short transaction that first locks the date's inventory row, so it
+        survives the chunked commits of bulk writes. Contending runs wait up
+        to ``lock_wait`` (default ``ALLOCATION_LOCK_WAIT_SECONDS``) in total,
+        database locks included; a claim whose last heartbeat (renewed with
+        every committed chunk) is older than ``ALLOCATION_LOCK_TTL_SECONDS``
+        is treated as abandoned.
+        """
+        claim = self._claim_run(allocation_date, kind, idempotency_key, lock_wait)
+        if claim.status == 'completed':
+            result = json.loads(claim.result)
+            result['replayed'] = True
+            return result
+        
+        run_id = claim.id
+        try:
+            result = run()
+        except Exception as e:
+            db.session.rollback()
+            self._finish_run(run_id, 'failed', error_message=str(e))
+            raise
+        
+        self._finish_run(run_id, 'completed', result=json.dumps(result))
+        return result
+    
+    def _claim_run(self, allocation_date: date, kind: str, idempotency_key: str,
+                   lock_wait: float = None) -> AllocationRun:
+        """Claim the date's run lock, or return the completed run for the key"""
+        if lock_wait is None:
+            lock_wait = self.lock_wait_seconds
+        deadline = time.monotonic() + lock_wait
+        
+        while True:
+            if not self._lock_inventory_row(allocation_date, max(0.0, deadline - time.monotonic())):
+                raise AllocationInProgress(f"The run lock for {allocation_date} is busy")
+            now = datetime.utcnow()
+            
+            claim = None
+            if idempotency_key:
+                claim = AllocationRun.query.filter_by(idempotency_key=idempotency_key).first()
+                if claim and (claim.allocation_date != allocation_date or claim.kind != kind):
+                    db.session.rollback()
+                    raise ValueError("Idempotency key was already used for a different run")
+                if claim and claim.status == 'completed':
+                    db.session.commit()
+                    return claim
+            
+            stale_before = now - timedelta(seconds=self.lock_ttl_seconds)
+            db.session.execute(
+                update(AllocationRun).where(
+                    AllocationRun.allocation_date == allocation_date,
+                    AllocationRun.status == 'running',
+                    func.coalesce(AllocationRun.heartbeat_at, AllocationRun.started_at) < stale_before
+                ).values(status='failed', error_message='Abandoned', finished_at=now),
+                execution_options={'synchronize_session': False}
+            )
+            busy = busy_run_query(allocation_date).first()
+            
+            if busy is None:
+                if claim is None:
+                    claim = AllocationRun(allocation_date=allocation_date, kind=kind,
+                                          idempotency_key=idempotency_key)
+                    db.session.add(claim)
+                # A failed run retried with the same key starts over
+                claim.status = 'running'
+                claim.started_at = now
+                claim.heartbeat_at = now
+                claim.error_message = None
+                db.session.commit()
+                return claim
+            
+            db.session.rollback()
+            if time.monotonic() >= deadline:
+                raise AllocationInProgress(
+                    f"Another {busy.kind} run is in progress for {allocation_date}"
+                )
+            time.sleep(0.1)
+    
+    def _lock_inventory_row(self, allocation_date: date, wait: float) -> bool:
+        """Lock the date's inventory row until the current transaction ends
+        
+        ``SELECT ... FOR UPDATE`` where supported; SQLite has no row locks,
+        so a no-op UPDATE takes its database write lock instead. Either waits
+        at most ``wait`` seconds for the lock (not the connection's own busy
+        or lock timeout) and returns False, rolled back, if it stays taken.
+        """
+        dialect = db.session.get_bind().dialect.name
+        wait_ms = int(wait * 1000)
+        try:
+            if dialect == 'sqlite':
+                connection = db.session.connection()
+                busy_timeout = connection.exec_driver_sql('PRAGMA busy_timeout').scalar()
+                connection.exec_driver_sql(f'PRAGMA busy_timeout = {wait_ms}')
+                try:
+                    locked = db.session.execute(
+                        update(Inventory).where(Inventory.date == allocation_date).values(
+                            updated_at=Inventory.updated_at
+                        ),
+                        execution_options={'synchronize_session': False}
+                    ).rowcount
+                finally:
+                    connection.exec_driver_sql(f'PRAGMA busy_timeout = {busy_timeout}')
+            else:
+                if dialect == 'postgresql':
+                    db.session.execute(text(f"SET LOCAL lock_timeout = '{max(wait_ms, 1)}ms'"))
+                locked = db.session.query(Inventory.id).filter(
+                    Inventory.date == allocation_date
+                ).with_for_update().first() is not None
+        except OperationalError:
+            db.session.rollback()
+            return False
+        
+        if not locked:
+            db.session.rollback()
+            raise ValueError(f"No inventory found for {allocation_date}")
+        return True
+    
+    def _finish_run(self, run_id: int, status: str, result: str = None,
+                    error_message: str = None):
+        """Release the date's run lock, keeping the outcome"""
+        db.session.execute(
+            update(AllocationRun).where(AllocationRun.id == run_id).values(
+                status=status, result=result, error_message=error_message,
+                finished_at=datetime.utcnow()
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+    
+    def _commit_chunk(self, allocation_date: date):
+        """Commit a chunk of a locked run, renewing the run lock's heartbeat"""
+        db.session.execute(
+            update(AllocationRun).where(
+                AllocationRun.allocation_date == allocation_date,
+                AllocationRun.status == 'running'
+            ).values(heartbeat_at=datetime.utcnow()),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+    
+    def _allocate_pending(self, inventory: Inventory, supply: int, allocated_before: int,
+                          available: int, allocation_date: date, as_of: datetime,
+                          write_mode: str, strategy: str, allow_partial: bool,
+                          order_ids: List[int] = None) -> Dict:
+        """Score and place the date's pending orders against ``available`` supply"""
+        # Get pending orders for this date, with their customers in the same query
+        orders = pending_orders_query(allocation_date, order_ids).all()
         
         if not orders:
-            return {
-                'allocated': [],
-                'waitlisted': [],
-                'remaining': supply,
-                'total_orders': 0,
-                'allocation_date': allocation_date.isoformat()
-            }
+            self._bulk_update_inventory(inventory.id, allocated_before, available, as_of)
+            db.session.commit()
+            return self._allocation_result(allocation_date, supply, [], [], available, 0, strategy)
         
         # Calculate priority scores for all orders
-        scored_orders = self._calculate_priority_scores(orders)
+        waitlist_counts = self._waiting_counts_for_date(allocation_date)
+        records = self._calculate_priority_scores(orders, as_of, waitlist_counts)
         
         # Allocate by tier and priority
-        allocated, waitlisted, remaining = self._allocate_by_tiers(
-            scored_orders, supply, allocation_date
+        allocated, waitlisted, remaining = self._allocate_records(
+            records, available, strategy, allow_partial
         )
         
+        # Build the response before commit expires the loaded orders
+        result = self._allocation_result(
+            allocation_date, supply,
+            [self._record_to_allocation_dict(r) for r in allocated],
+            [self._record_to_allocation_dict(r) for r in waitlisted],
+            remaining, len(orders), strategy
+        )
+        messages = self._notification_messages(result['allocated'], result['waitlisted'],
+                                               self._pickup_deadline(allocation_date, as_of))
+        
+        if write_mode == 'bulk':
+            self._persist_bulk(
+                inventory.id, allocated_before, available, allocation_date, as_of,
+                [(r.order_id, r.customer_id, r.allocated_qty) for r in allocated],
+                [(r.order_id, r.customer_id, r.order_qty, r.priority_score) for r in waitlisted],
+                [(r.order_id, r.customer_id, r.waitlist_qty, r.priority_score)
+                 for r in allocated if r.waitlist_qty],
+                messages
+            )
+        else:
+            self._persist_orm(inventory, allocated_before + available - remaining, remaining,
+                              allocation_date, as_of, allocated, waitlisted)
+            enqueue(message for order_messages in messages.values() for message in order_messages)
+            db.session.commit()
+        
+        return result
+    
+    def _allocate_records(self, records: List[OrderRecord], available: int, strategy: str,
+                          allow_partial: bool) -> Tuple[List[OrderRecord], List[OrderRecord], int]:
+        """Run the kernel, or its zone-partitioned variant, with engine settings"""
+        if strategy == allocation_zones.ZONED:
+            return allocation_zones.allocate_zoned(
+                records, available, self.max_per_customer,
+                self.remote_zones, self.remote_reserve_pct,
+                allow_partial=allow_partial, min_partial_qty=self.min_partial_qty,
+                workers=self.zone_workers, parallel_min_orders=self.zone_parallel_min_orders
+            )
+        
+        return allocation_core.allocate(
+            records, available, self.max_per_customer,
+            strategy, allow_partial, self.min_partial_qty
+        )
+    
+    def _allocate_vectorized(self, inventory_id: int, supply: int,
+                             allocation_date: date, as_of: datetime) -> Dict:
+        """Score and allocate the day's order book as NumPy arrays
+        
+        Orders are read as plain column tuples with their customer's waiting
+        count joined in, so no ORM objects are built; results are identical
+        to the kernel pass.
+        """
+        rows = pending_order_rows_query(allocation_date).all()
+        
+        if not rows:
+            self._bulk_update_inventory(inventory_id, 0, supply, as_of)
+            db.session.commit()
+            return self._allocation_result(allocation_date, supply, [], [], supply, 0, 'greedy')
+        
+        (order_ids, order_numbers, customer_ids, order_qty, order_dates, priority_levels,
+         farm_names, phones, zones, tiers, last_fulfilled, waiting_counts) = zip(*rows)
+        
+        tier_rank = allocation_vectorized.tier_ranks(tiers)
+        scores = allocation_vectorized.priority_scores(
+            tier_rank,
+            allocation_vectorized.to_days(last_fulfilled),
+            allocation_vectorized.to_days(order_dates),
+            priority_levels,
+            waiting_counts,
+            as_of.date()
+        )
+        allocated_idx, waitlisted_idx, allocated_qty, remaining = allocation_vectorized.allocate(
+            tier_rank, order_qty, scores, supply, self.max_per_customer
+        )
+        
+        scores = scores.tolist()
+        allocated_qty = allocated_qty.tolist()
+        allocated_idx = allocated_idx.tolist()
+        waitlisted_idx = waitlisted_idx.tolist()
+        
+        def to_dict(i, qty):
+            return {
+                'order_id': order_ids[i],
+                'order_number': order_numbers[i],
+                'customer_id': customer_ids[i],
+                'customer_name': farm_names[i],
+                'phone': phones[i],
+                'zone': zones[i],
+                'tier': tiers[i],
+                'requested_qty': order_qty[i],
+                'allocated_qty': qty,
+                'priority_score': scores[i]
+            }
+        
+        result = self._allocation_result(
+            allocation_date, supply,
+            [to_dict(i, qty) for i, qty in zip(allocated_idx, allocated_qty)],
+            [to_dict(i, 0) for i in waitlisted_idx],
+            remaining, len(rows), 'greedy'
+        )
+        
+        self._persist_bulk(
+            inventory_id, 0, supply, allocation_date, as_of,
+            [(order_ids[i], customer_ids[i], qty) for i, qty in zip(allocated_idx, allocated_qty)],
+            [(order_ids[i], customer_ids[i], order_qty[i], scores[i]) for i in waitlisted_idx],
+            messages=self._notification_messages(result['allocated'], result['waitlisted'],
+                                                 self._pickup_deadline(allocation_date, as_of))
+        )
+        
+        return result
+    
+    def _allocation_result(self, allocation_date: date, supply: int, allocated: List[Dict],
+                           waitlisted: List[Dict], remaining: int, total_orders: int,
+                           strategy: str) -> Dict:
+        """Response for an allocation run"""
+        return {
+            'allocated': allocated,
+            'waitlisted': waitlisted,
+            'remaining': remaining,
+            'total_orders': total_orders,
+            'allocation_date': allocation_date.isoformat(),
+            'supply': supply,
+            'utilization': round((supply - remaining) / supply * 100, 2) if supply else 0,
+            'strategy': strategy
+        }
+    
+    def _persist_orm(self, inventory: Inventory, allocated_total: int, remaining: int,
+                     allocation_date: date, as_of: datetime,
+                     allocated: List[OrderRecord], waitlisted: List[OrderRecord]):
+        """Stage allocation results on the session as ORM objects"""
         # Update inventory
-        inventory.allocated = supply - remaining
+        inventory.allocated = allocated_total
         inventory.remaining = remaining
+        inventory.allocated_at = as_of
         
         # Update order statuses
-        for order in allocated:
+        for record in allocated:
+            order = record.ref
             order.status = 'allocated'
             order.expected_delivery_date = allocation_date
+            self._create_allocation(order, record.allocated_qty, allocation_date, as_of)
+            
+            # Update customer's last fulfilled date
+            order.customer.last_fulfilled_date = as_of
+            
+            # Split order: the rest of it waits for the next batch
+            if record.waitlist_qty:
+                db.session.add(Waitlist(
+                    order_id=order.id,
+                    customer_id=order.customer_id,
+                    requested_qty=record.waitlist_qty,
+                    target_fulfillment_date=allocation_date + timedelta(days=1),
+                    priority_score=record.priority_score
+                ))
         
-        for order in waitlisted:
+        for record in waitlisted:
+            order = record.ref
             order.status = 'waitlisted'
             # Add to waitlist table
             waitlist_entry = Waitlist(
@@ -62,123 +623,186 @@ class AllocationEngine:
                 customer_id=order.customer_id,
                 requested_qty=order.order_qty,
                 target_fulfillment_date=allocation_date + timedelta(days=1),
-                priority_score=order.priority_score
+                priority_score=record.priority_score
             )
             db.session.add(waitlist_entry)
+    
+    def _persist_bulk(self, inventory_id: int, allocated_before: int, available: int,
+                      allocation_date: date, as_of: datetime, allocated: List[Tuple[int, int, int]],
+                      waitlisted: List[Tuple[int, int, int, float]],
+                      remainders: List[Tuple[int, int, int, float]] = (),
+                      messages: Dict[int, List[Dict]] = None):
+        """Write allocation results in chunks of executemany inserts and set-based updates
         
-        db.session.commit()
+        ``allocated`` holds ``(order_id, customer_id, qty)`` and ``waitlisted``
+        holds ``(order_id, customer_id, requested_qty, priority_score)``.
+        ``remainders`` has the same shape for split orders, which get a
+        waitlist entry but keep their allocated status. ``messages`` maps
+        order ids to outbox rows, queued with their order's chunk.
         
-        return {
-            'allocated': [self._order_to_allocation_dict(o) for o in allocated],
-            'waitlisted': [self._order_to_allocation_dict(o) for o in waitlisted],
-            'remaining': remaining,
-            'total_orders': len(orders),
-            'allocation_date': allocation_date.isoformat()
-        }
+        Inventory ends at ``allocated_before`` plus the allocated total, with
+        ``available`` less that total remaining. Each chunk commits on its
+        own, renewing the run lock's heartbeat, and inventory totals are
+        advanced with every allocation chunk so committed state is always
+        consistent.
+        """
+        messages = messages or {}
+        chunk_size = max(1, self.write_chunk_size)
+        pickup_deadline = self._pickup_deadline(allocation_date, as_of)
+        allocated_total = 0
+        
+        for start in range(0, len(allocated), chunk_size):
+            chunk = allocated[start:start + chunk_size]
+            order_ids = [order_id for order_id, _, _ in chunk]
+            customer_ids = list({customer_id for _, customer_id, _ in chunk})
+            allocated_total += sum(qty for _, _, qty in chunk)
+            
+            db.session.execute(insert(Allocation), [
+                {
+                    'order_id': order_id,
+                    'customer_id': customer_id,
+                    'allocation_date': allocation_date,
+                    'allocated_qty': qty,
+                    'pickup_deadline': pickup_deadline,
+                    'status': 'pending'
+                } for order_id, customer_id, qty in chunk
+            ])
+            db.session.execute(
+                update(Order).where(Order.id.in_(order_ids)).values(
+                    status='allocated', expected_delivery_date=allocation_date
+                ),
+                execution_options={'synchronize_session': False}
+            )
+            db.session.execute(
+                update(Customer).where(Customer.id.in_(customer_ids)).values(
+                    last_fulfilled_date=as_of
+                ),
+                execution_options={'synchronize_session': False}
+            )
+            self._bulk_update_inventory(inventory_id, allocated_before + allocated_total,
+                                        available - allocated_total, as_of)
+            enqueue(message for order_id in order_ids for message in messages.get(order_id, ()))
+            self._commit_chunk(allocation_date)
+        
+        if not allocated:
+            self._bulk_update_inventory(inventory_id, allocated_before, available, as_of)
+            self._commit_chunk(allocation_date)
+        
+        target_date = allocation_date + timedelta(days=1)
+        if remainders:
+            db.session.execute(insert(Waitlist), [
+                {
+                    'order_id': order_id,
+                    'customer_id': customer_id,
+                    'requested_qty': requested_qty,
+                    'target_fulfillment_date': target_date,
+                    'priority_score': score
+                } for order_id, customer_id, requested_qty, score in remainders
+            ])
+            self._commit_chunk(allocation_date)
+        
+        for start in range(0, len(waitlisted), chunk_size):
+            chunk = waitlisted[start:start + chunk_size]
+            
+            db.session.execute(insert(Waitlist), [
+                {
+                    'order_id': order_id,
+                    'customer_id': customer_id,
+                    'requested_qty': requested_qty,
+                    'target_fulfillment_date': target_date,
+                    'priority_score': score
+                } for order_id, customer_id, requested_qty, score in chunk
+            ])
+            db.session.execute(
+                update(Order).where(Order.id.in_([row[0] for row in chunk])).values(
+                    status='waitlisted'
+                ),
+                execution_options={'synchronize_session': False}
+            )
+            enqueue(message for row in chunk for message in messages.get(row[0], ()))
+            self._commit_chunk(allocation_date)
+    
+    def _notification_messages(self, allocated: List[Dict], waitlisted: List[Dict],
+                               pickup_deadline: datetime) -> Dict[int, List[Dict]]:
+        """Outbox rows per order id for a run's allocated and waitlisted orders"""
+        customer_ids = {entry['customer_id'] for entry in allocated + waitlisted}
+        emails = dict(db.session.query(Customer.id, Customer.email).filter(
+            Customer.id.in_(customer_ids),
+            Customer.email.isnot(None)
+        ).all()) if customer_ids else {}
+        
+        def recipient(entry):
+            return Recipient(entry['customer_id'], entry['customer_name'], entry['phone'],
+                             emails.get(entry['customer_id']))
+        
+        messages = {entry['order_id']: allocation_messages(
+                        recipient(entry), dict(entry, pickup_deadline=pickup_deadline))
+                    for entry in allocated}
+        messages.update((entry['order_id'], waitlist_messages(recipient(entry), entry))
+                        for entry in waitlisted)
+        return messages
+    
+    def _bulk_update_inventory(self, inventory_id: int, allocated: int, remaining: int,
+                               as_of: datetime):
+        """Set inventory totals and mark the date allocated with a single UPDATE"""
+        db.session.execute(
+            update(Inventory).where(Inventory.id == inventory_id).values(
+                allocated=allocated, remaining=remaining, allocated_at=as_of
+            ),
+            execution_options={'synchronize_session': False}
+        )
     
-    def _calculate_priority_scores(self, orders: List[Order]) -> List[Order]:
-        """Calculate priority scores for orders based on multiple factors"""
+    def _waiting_counts_for_date(self, allocation_date: date) -> Dict[int, int]:
+        """Count waiting waitlist entries per customer with pending orders on a date"""
+        return dict(waiting_counts_query(allocation_date).all())
+    
+    def _calculate_priority_scores(self, orders: List[Order], as_of: datetime = None,
+                                   waitlist_counts: Dict[int, int] = None) -> List[OrderRecord]:
+        """Score orders into kernel records based on multiple factors
+        
+        Expects ``order.customer`` to be loaded already and ``waitlist_counts``
+        to map customer ids to their waiting entries, so no queries are issued.
+        """
+        today = (as_of or datetime.utcnow()).date()
+        waitlist_counts = waitlist_counts or {}
+        records = []
+        
         for order in orders:
             customer = order.customer
-            score = 0.0
-            
-            # Tier-based base score
-            tier_scores = {'Contract': 100, 'Loyal': 50, 'New': 10}
-            score += tier_scores.get(customer.tier, 0)
-            
-            # Time since last fulfillment (for Loyal customers)
-            if customer.last_fulfilled_date:
-                days_since = (datetime.utcnow().date() - customer.last_fulfilled_date.date()).days
-                score += min(days_since * 2, 100)  # Cap at 100
-            else:
-                score += 30  # New customers get baseline
-            
-            # Waiting time for this specific order
-            days_waiting = (datetime.utcnow().date() - order.order_date.date()).days
-            score += days_waiting * 5
-            
-            # Priority level from order
-            score += order.priority_level * 10
-            
-            # Check if on waitlist previously
-            previous_waitlist = Waitlist.query.filter_by(
-                customer_id=customer.id,
-                status='waiting'
-            ).count()
-            score += previous_waitlist * 20
-            
-            order.priority_score = score
-        
-        return orders
-    
-    def _allocate_by_tiers(self, orders: List[Order], supply: int, 
-                          allocation_date: date) -> Tuple[List[Order], List[Order], int]:
-        """Allocate supply based on tiers and priority scores"""
-        
-        allocated = []
-        waitlisted = []
-        remaining = supply
-        
-        # Group by tier
-        contract_orders = [o for o in orders if o.customer.tier == 'Contract']
-        loyal_orders = [o for o in orders if o.customer.tier == 'Loyal']
-        new_orders = [o for o in orders if o.customer.tier == 'New']
-        
-        # Sort each tier by priority score
-        contract_orders.sort(key=lambda x: x.priority_score, reverse=True)
-        loyal_orders.sort(key=lambda x: x.priority_score, reverse=True)
-        new_orders.sort(key=lambda x: x.priority_score, reverse=True)
-        
-        # Allocate Contract farms first (100% fulfillment priority)
-        for order in contract_orders:
-            qty = min(order.order_qty, self.max_per_customer)
-            if remaining >= qty:
-                order.allocated_qty = qty
-                allocated.append(order)
-                remaining -= qty
-                
-                # Create allocation record
-                self._create_allocation(order, qty, allocation_date)
-                
-                # Update customer's last fulfilled date
-                order.customer.last_fulfilled_date = datetime.utcnow()
-            else:
-                waitlisted.append(order)
-        
-        # Allocate Loyal customers
-        for order in loyal_orders:
-            qty = min(order.order_qty, self.max_per_customer)
-            if remaining >= qty:
-                order.allocated_qty = qty
-                allocated.append(order)
-                remaining -= qty
-                
-                self._create_allocation(order, qty, allocation_date)
-                order.customer.last_fulfilled_date = datetime.utcnow()
-            else:
-                waitlisted.append(order)
-        
-        # Allocate New customers
-        for order in new_orders:
-            qty = min(order.order_qty, self.max_per_customer)
-            if remaining >= qty:
-                order.allocated_qty = qty
-                allocated.append(order)
-                remaining -= qty
-                
-                self._create_allocation(order, qty, allocation_date)
-                order.customer.last_fulfilled_date = datetime.utcnow()
-            else:
-                waitlisted.append(order)
+            score = allocation_core.priority_score(
+                customer.tier,
+                customer.last_fulfilled_date,
+                order.order_date,
+                order.priority_level or 0,
+                waitlist_counts.get(customer.id, 0),
+                today
+            )
+            records.append(OrderRecord(
+                order.id, order.customer_id, customer.tier, order.order_qty,
+                score, ref=order, zone=customer.zone
+            ))
+        
+        return records
+    
+    def _pickup_deadline(self, allocation_date: date, as_of: datetime = None) -> datetime:
+        """Pickup deadline (naive UTC) for allocations made at ``as_of`` for a date
         
-        return allocated, waitlisted, remaining
+        ``PICKUP_DEADLINE_HOUR`` in ``BUSINESS_TIMEZONE`` on the date. An
+        allocation made once that has passed (an afternoon run, a late order,
+        reclaimed supply) gets ``REALLOCATION_PICKUP_HOURS`` from ``as_of``
+        instead, so it is not overdue as soon as it exists.
+        """
+        now = as_of or datetime.utcnow()
+        deadline = local_to_utc(allocation_date, self.pickup_deadline_hour,
+                                self.business_timezone)
+        if now >= deadline:
+            return now + timedelta(hours=self.reallocation_pickup_hours)
+        return deadline
     
-    def _create_allocation(self, order: Order, qty: int, allocation_date: date):
+    def _create_allocation(self, order: Order, qty: int, allocation_date: date,
+                           as_of: datetime = None):
         """Create allocation record with pickup deadline"""
-        pickup_deadline = datetime.combine(
-            allocation_date, 
-            datetime.min.time()
-        ) + timedelta(hours=self.pickup_deadline_hour)
+        pickup_deadline = self._pickup_deadline(allocation_date, as_of)
         
         allocation = Allocation(
             order_id=order.id,
@@ -190,9 +814,10 @@ class AllocationEngine:
         )
         db.session.add(allocation)
     
-    def _order_to_allocation_dict(self, order: Order) -> Dict:
-        """Convert order to allocation dictionary"""
-        return {
+    def _record_to_allocation_dict(self, record: OrderRecord) -> Dict:
+        """Convert a scored order record to allocation dictionary"""
+        order = record.ref
+        result = {
             'order_id': order.id,
             'order_number': order.order_number,
             'customer_id': order.customer_id,
@@ -201,55 +826,398 @@ class AllocationEngine:
             'zone': order.customer.zone,
             'tier': order.customer.tier,
             'requested_qty': order.order_qty,
-            'allocated_qty': getattr(order, 'allocated_qty', 0),
-            'priority_score': getattr(order, 'priority_score', 0)
+            'allocated_qty': record.allocated_qty,
+            'priority_score': record.priority_score
         }
+        
+        # Split orders report the part left on the waitlist
+        if record.waitlist_qty:
+            result['waitlisted_qty'] = record.waitlist_qty
+        
+        return result
     
-    def process_waitlist_fulfillment(self, allocation_date: date) -> Dict:
+    def process_waitlist_fulfillment(self, allocation_date: date,
+                                     idempotency_key: str = None) -> Dict:
         """Process waitlist when new supply becomes available"""
+        if not Inventory.query.filter_by(date=allocation_date).first():
+            # Nothing to allocate from, so nothing to lock
+            return self._process_waitlist_fulfillment(allocation_date)
         
-        # Get waiting entries
-        waiting = Waitlist.query.filter_by(status='waiting').order_by(
-            Waitlist.priority_score.desc(),
-            Waitlist.added_date.asc()
-        ).all()
+        return self._run_exclusive(
+            allocation_date, 'waitlist', idempotency_key,
+            lambda: self._process_waitlist_fulfillment(allocation_date)
+        )
+    
+    def _process_waitlist_fulfillment(self, allocation_date: date) -> Dict:
+        """Fulfil waitlist entries from a date's remaining supply under its run lock
         
-        if not waiting:
-            return {'fulfilled': 0, 'remaining_waitlist': 0}
+        Entries are streamed in priority order (score descending, oldest
+        first) in keyset pages of ``WAITLIST_PAGE_SIZE`` as plain column rows,
+        and the pass stops once what is left is below the smallest quantity
+        any waiting entry asks for (an index lookup). Until then pages are
+        read even if nothing in them fits, so a small entry deep in the queue
+        keeps the pass going. Fulfilment is written with one bulk insert and
+        set-based updates. A fulfilled order's other waiting entries are
+        closed as ``merged`` so a later pass cannot fulfil it again.
+        """
+        waiting_count = db.session.query(func.count(Waitlist.id)).filter(
+            Waitlist.status == 'waiting'
+        )
         
         # Get available supply
         inventory = Inventory.query.filter_by(date=allocation_date).first()
         if not inventory or not inventory.remaining:
-            return {'fulfilled': 0, 'remaining_waitlist': len(waiting)}
+            return {'fulfilled': 0, 'remaining_waitlist': waiting_count.scalar()}
+        
+        # A lower bound: entries of cancelled orders count too, but the
+        # index answers without reading the queue
+        smallest = smallest_waiting_qty_query().scalar()
+        if smallest is None:
+            return {'fulfilled': 0, 'remaining_waitlist': waiting_count.scalar()}
+        smallest = min(smallest, self.max_per_customer)
         
         remaining = inventory.remaining
-        fulfilled_count = 0
+        fulfilled = []
+        fulfilled_orders = set()
+        last_key = None
         
-        for entry in waiting:
-            order = entry.order
-            qty = min(entry.requested_qty, self.max_per_customer)
+        while remaining >= smallest:
+            rows = waitlist_page_query(self.waitlist_page_size, last_key).all()
             
-            if remaining >= qty:
-                # Create allocation
-                self._create_allocation(order, qty, allocation_date)
-                
-                # Update order and waitlist entry
-                order.status = 'allocated'
-                order.expected_delivery_date = allocation_date
-                entry.status = 'fulfilled'
-                entry.actual_fulfillment_date = allocation_date
-                
-                # Update customer
-                order.customer.last_fulfilled_date = datetime.utcnow()
-                
-                remaining -= qty
-                fulfilled_count += 1
+            for entry_id, order_id, customer_id, requested_qty, score in rows:
+                qty = min(requested_qty, self.max_per_customer)
+                # Duplicate entries of one order are fulfilled once
+                if remaining >= qty and order_id not in fulfilled_orders:
+                    fulfilled.append((entry_id, order_id, customer_id, qty))
+                    fulfilled_orders.add(order_id)
+                    remaining -= qty
+                    if remaining < smallest:
+                        break
+            
+            if len(rows) < self.waitlist_page_size:
+                break
+            last_key = (rows[-1].score, rows[-1].id)
         
-        # Update inventory
-        inventory.remaining = remaining
+        if fulfilled:
+            self._persist_waitlist_fulfillment(inventory.id, allocation_date, fulfilled,
+                                               inventory.remaining - remaining)
+        db.session.commit()
+        
+        return {
+            'fulfilled': len(fulfilled),
+            'remaining_waitlist': waiting_count.scalar()
+        }
+    
+    def _persist_waitlist_fulfillment(self, inventory_id: int, allocation_date: date,
+                                      fulfilled: List[Tuple[int, int, int, int]],
+                                      fulfilled_qty: int):
+        """Write fulfilled ``(entry_id, order_id, customer_id, qty)`` entries in bulk
+        
+        Entries fulfilled after the date's pickup deadline (from reclaimed
+        supply) get ``REALLOCATION_PICKUP_HOURS`` from now to collect (see
+        ``_pickup_deadline``).
+        """
+        now = datetime.utcnow()
+        pickup_deadline = self._pickup_deadline(allocation_date, now)
+        
+        db.session.execute(insert(Allocation), [
+            {
+                'order_id': order_id,
+                'customer_id': customer_id,
+                'allocation_date': allocation_date,
+                'allocated_qty': qty,
+                'pickup_deadline': pickup_deadline,
+                'status': 'pending'
+            } for _, order_id, customer_id, qty in fulfilled
+        ])
+        db.session.execute(
+            update(Waitlist).where(Waitlist.id.in_([row[0] for row in fulfilled])).values(
+                status='fulfilled', actual_fulfillment_date=allocation_date
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        # Other waiting entries of the same orders must not be fulfilled again
+        db.session.execute(
+            update(Waitlist).where(
+                Waitlist.status == 'waiting',
+                Waitlist.order_id.in_({row[1] for row in fulfilled})
+            ).values(status='merged', updated_at=now),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.execute(
+            update(Order).where(Order.id.in_({row[1] for row in fulfilled})).values(
+                status='allocated', expected_delivery_date=allocation_date
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.execute(
+            update(Customer).where(Customer.id.in_({row[2] for row in fulfilled})).values(
+                last_fulfilled_date=now
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.execute(
+            update(Inventory).where(Inventory.id == inventory_id).values(
+                allocated=func.coalesce(Inventory.allocated, 0) + fulfilled_qty,
+                remaining=Inventory.remaining - fulfilled_qty
+            ),
+            execution_options={'synchronize_session': False}
+        )
+    
+    def sweep_waitlist(self, as_of: datetime = None) -> Dict:
+        """Compact the waiting set with set-based updates
+        
+        Duplicate waiting entries of one order are merged into the oldest
+        (status ``merged``), which keeps the group's best priority score, and
+        entries waiting longer than ``WAITING_PERIOD_DAYS`` are expired
+        (status ``expired``) and their still-waitlisted orders cancelled, with
+        a cancellation notice queued for each, in the same transaction. Safe
+        to run at any time and repeatedly.
+        """
+        now = as_of or datetime.utcnow()
+        
+        duplicates = select(
+            Waitlist.order_id,
+            func.min(Waitlist.id).label('keep_id')
+        ).where(Waitlist.status == 'waiting').group_by(Waitlist.order_id).having(
+            func.count(Waitlist.id) > 1
+        ).subquery()
+        
+        other = aliased(Waitlist)
+        best_score = select(func.max(other.priority_score)).where(
+            other.order_id == Waitlist.order_id,
+            other.status == 'waiting'
+        ).scalar_subquery()
+        db.session.execute(
+            update(Waitlist).where(
+                Waitlist.id.in_(select(duplicates.c.keep_id))
+            ).values(priority_score=best_score, updated_at=now),
+            execution_options={'synchronize_session': False}
+        )
+        merged = db.session.execute(
+            update(Waitlist).where(
+                Waitlist.status == 'waiting',
+                Waitlist.order_id.in_(select(duplicates.c.order_id)),
+                Waitlist.id.not_in(select(duplicates.c.keep_id))
+            ).values(status='merged', updated_at=now),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        
+        stale = db.session.query(Waitlist.id, Waitlist.order_id).filter(
+            Waitlist.status == 'waiting',
+            Waitlist.added_date < now - timedelta(days=self.waiting_period_days)
+        ).with_for_update().all()
+        
+        expired = len(stale)
+        cancelled = []
+        if stale:
+            db.session.execute(
+                update(Waitlist).where(Waitlist.id.in_([row[0] for row in stale])).values(
+                    status='expired', updated_at=now
+                ),
+                execution_options={'synchronize_session': False}
+            )
+            cancelled = db.session.execute(
+                update(Order).where(
+                    Order.id.in_({row[1] for row in stale}),
+                    Order.status == 'waitlisted'
+                ).values(status='cancelled', updated_at=now).returning(Order.id),
+                execution_options={'synchronize_session': False}
+            ).scalars().all()
+            if cancelled:
+                orders = Order.query.options(joinedload(Order.customer)).filter(
+                    Order.id.in_(cancelled)
+                ).all()
+                enqueue(message for order in orders
+                        for message in waitlist_expired_messages(order.customer, order))
+        db.session.commit()
+        
+        remaining = db.session.query(func.count(Waitlist.id)).filter(
+            Waitlist.status == 'waiting'
+        ).scalar()
+        
+        return {
+            'merged': merged,
+            'expired': expired,
+            'cancelled_orders': len(cancelled),
+            'remaining_waitlist': remaining,
+            'swept_at': now.isoformat()
+        }
+    
+    def recompute_waitlist_scores(self, as_of: datetime = None) -> Dict:
+        """Re-score every waiting entry as of now and store changed scores
+        
+        Scores use the allocation formula (tier, fulfilment recency, order
+        age, priority level, the customer's other waiting entries), computed
+        in one NumPy pass over column arrays when available, and changed
+        scores are written back as executemany UPDATEs by primary key so
+        the ``ix_waitlist_queue_score`` index stays in fulfilment order.
+        """
+        now = as_of or datetime.utcnow()
+        
+        waiting = db.session.query(
+            Waitlist.customer_id.label('customer_id'),
+            func.count(Waitlist.id).label('waiting')
+        ).filter(Waitlist.status == 'waiting').group_by(Waitlist.customer_id).subquery()
+        
+        rows = db.session.query(
+            Waitlist.id, Waitlist.priority_score,
+            Customer.tier, Customer.last_fulfilled_date,
+            Order.order_date, func.coalesce(Order.priority_level, 0),
+            waiting.c.waiting - 1
+        ).join(Order, Waitlist.order_id == Order.id).join(
+            Customer, Waitlist.customer_id == Customer.id
+        ).join(
+            waiting, waiting.c.customer_id == Waitlist.customer_id
+        ).filter(Waitlist.status == 'waiting').all()
+        
+        if not rows:
+            return {'rescored': 0, 'updated': 0, 'rescored_at': now.isoformat()}
+        
+        entry_ids, old_scores, tiers, last_fulfilled, order_dates, levels, others = zip(*rows)
+        
+        if NUMPY_AVAILABLE:
+            scores = allocation_vectorized.priority_scores(
+                allocation_vectorized.tier_ranks(tiers),
+                allocation_vectorized.to_days(last_fulfilled),
+                allocation_vectorized.to_days(order_dates),
+                levels,
+                others,
+                now.date()
+            ).tolist()
+        else:
+            scores = [
+                allocation_core.priority_score(*row, now.date())
+                for row in zip(tiers, last_fulfilled, order_dates, levels, others)
+            ]
+        
+        changed = [
+            {'id': entry_id, 'priority_score': score}
+            for entry_id, old, score in zip(entry_ids, old_scores, scores) if old != score
+        ]
+        
+        chunk_size = max(1, self.write_chunk_size)
+        for start in range(0, len(changed), chunk_size):
+            db.session.execute(update(Waitlist), changed[start:start + chunk_size])
+            db.session.commit()
+        
+        return {
+            'rescored': len(rows),
+            'updated': len(changed),
+            'rescored_at': now.isoformat()
+        }
+    
+    def allocate_late_orders(self, as_of: datetime = None) -> Dict:
+        """Incremental runs for allocated dates that still have pending orders
+        
+        Picks up late orders that could not be placed when they were saved
+        because another run held their date's lock. Dates still busy are
+        left for the next pass.
+        """
+        today = (as_of or datetime.utcnow()).date()
+        late_dates = [row[0] for row in late_order_dates_query(today).all()]
+        db.session.commit()
+        
+        dates, busy = [], []
+        for allocation_date in late_dates:
+            try:
+                dates.append(self.allocate_incremental(allocation_date))
+            except AllocationInProgress:
+                busy.append(allocation_date.isoformat())
+        
+        return {
+            'allocated': sum(len(d['allocated']) for d in dates),
+            'waitlisted': sum(len(d['waitlisted']) for d in dates),
+            'dates': dates,
+            'busy': busy
+        }
+    
+    def expire_overdue_allocations(self, as_of: datetime = None,
+                                   fulfil_waitlist: bool = None) -> Dict:
+        """Expire allocations not picked up by their deadline and reclaim the chicks
+        
+        Each affected date is handled under its run lock in one transaction:
+        overdue ``pending``/``confirmed`` allocations become ``expired``,
+        their orders ``cancelled``, and the quantity goes back to the date's
+        inventory. With ``fulfil_waitlist`` (default
+        ``PICKUP_EXPIRY_FULFIL_WAITLIST``) reclaimed supply for today or later
+        is offered to the waitlist straight away.
+        """
+        now = as_of or datetime.utcnow()
+        if fulfil_waitlist is None:
+            fulfil_waitlist = self.config.PICKUP_EXPIRY_FULFIL_WAITLIST
+        
+        overdue_dates = [row[0] for row in overdue_dates_query(now).all()]
+        db.session.commit()
+        
+        dates = []
+        for allocation_date in overdue_dates:
+            def expire(allocation_date=allocation_date):
+                result = self._expire_overdue_for_date(allocation_date, now)
+                if fulfil_waitlist and result['reclaimed_qty'] and allocation_date >= now.date():
+                    result['waitlist'] = self._process_waitlist_fulfillment(allocation_date)
+                return result
+            
+            if Inventory.query.filter_by(date=allocation_date).first():
+                dates.append(self._run_exclusive(allocation_date, 'expiry', None, expire))
+            else:
+                dates.append(expire())
+        
+        return {
+            'expired': sum(d['expired'] for d in dates),
+            'reclaimed_qty': sum(d['reclaimed_qty'] for d in dates),
+            'dates': dates,
+            'expired_at': now.isoformat()
+        }
+    
+    def _expire_overdue_for_date(self, allocation_date: date, now: datetime) -> Dict:
+        """Expire one date's overdue allocations and return their quantity to inventory
+        
+        An order is cancelled only once it has no live allocation left (a split
+        order may still hold one on another date), and the waitlist entries of
+        cancelled orders are expired with it.
+        """
+        overdue = overdue_allocations_query(allocation_date, now).with_for_update().all()
+        
+        reclaimed = sum(qty for _, _, qty in overdue)
+        if overdue:
+            db.session.execute(
+                update(Allocation).where(Allocation.id.in_([row[0] for row in overdue])).values(
+                    status='expired'
+                ),
+                execution_options={'synchronize_session': False}
+            )
+            live = select(Allocation.id).where(
+                Allocation.order_id == Order.id,
+                Allocation.status.in_(('pending', 'confirmed', 'picked_up'))
+            ).exists()
+            cancelled = db.session.execute(
+                update(Order).where(
+                    Order.id.in_({row[1] for row in overdue}),
+                    Order.status == 'allocated',
+                    ~live
+                ).values(status='cancelled', updated_at=now).returning(Order.id),
+                execution_options={'synchronize_session': False}
+            ).scalars().all()
+            if cancelled:
+                db.session.execute(
+                    update(Waitlist).where(
+                        Waitlist.order_id.in_(cancelled),
+                        Waitlist.status == 'waiting'
+                    ).values(status='expired', updated_at=now),
+                    execution_options={'synchronize_session': False}
+                )
+            db.session.execute(
+                update(Inventory).where(Inventory.date == allocation_date).values(
+                    allocated=func.coalesce(Inventory.allocated, 0) - reclaimed,
+                    remaining=func.coalesce(Inventory.remaining, 0) + reclaimed
+                ),
+                execution_options={'synchronize_session': False}
+            )
         db.session.commit()
         
         return {
-            'fulfilled': fulfilled_count,
-            'remaining_waitlist': len([w for w in waiting if w.status == 'waiting'])
+            'date': allocation_date.isoformat(),
+            'expired': len(overdue),
+            'reclaimed_qty': reclaimed
         }
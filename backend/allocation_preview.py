@@ -0,0 +1,259 @@
+"""Read-only allocation preview kept in memory as orders and supply change
+
+Each previewed date holds its pending orders sorted in allocation order
+(tier, score descending, order id) in a ``SortedList``, so an order change
+is an O(log n) insert or delete instead of a reload. Without
+sortedcontainers a plain list kept sorted with ``bisect`` is used; its
+inserts and deletes are O(n) element moves, which is still far cheaper
+than rescoring the day. A date is seeded from the database on its first
+read, and route hooks apply changes made by the serving process.
+
+Every process keeps its own books, so each read first checks them against
+the database in a few small indexed queries. Other gunicorn workers,
+scheduled jobs and CLI runs change the same tables:
+
+- orders changed since the last read are re-applied to the book
+- the date's supply is re-read
+- a change to waitlist entries or customers (which feed every score), or a
+  new day, reseeds the book
+"""
+import threading
+from bisect import bisect_left, insort
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from models import db, Order, Inventory, Waitlist, Customer
+from allocation_core import TIER_ORDER, OrderRecord
+from conditional import table_versions
+try:
+    from sortedcontainers import SortedList
+    SORTEDCONTAINERS_AVAILABLE = True
+except ImportError:
+    SORTEDCONTAINERS_AVAILABLE = False
+
+_TIER_RANKS = {tier: rank for rank, tier in enumerate(TIER_ORDER)}
+
+# Tables whose changes rescore every order of a book
+SCORE_TABLES = (Waitlist, Customer)
+# Orders are re-read from this long before the last sync, so a change
+# stamped before that read but committed after it is still picked up
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class PreviewBook:
+    """Pending orders of one date in allocation order"""
+
+    __slots__ = ('allocation_date', 'supply', 'available', 'scored_on', 'versions',
+                 'synced_at', 'keys', 'entries', 'result')
+
+    def __init__(self, allocation_date: date, supply: int, available: int, scored_on: date,
+                 versions: list = None, synced_at: datetime = None):
+        self.allocation_date = allocation_date
+        self.supply = supply
+        self.available = available
+        self.scored_on = scored_on
+        # SCORE_TABLES versions the scores were computed against
+        self.versions = versions
+        # When the book was last checked against the database
+        self.synced_at = synced_at
+        # Sorted (tier_rank, -score, order_id) keys
+        self.keys = SortedList() if SORTEDCONTAINERS_AVAILABLE else []
+        # order_id -> (key, allocation dict without allocated_qty)
+        self.entries = {}
+        # Cached preview, cleared by any change to the book
+        self.result = None
+
+    def add(self, entry: Dict):
+        self.discard(entry['order_id'])
+        key = (_TIER_RANKS.get(entry['tier'], len(TIER_ORDER)),
+               -entry['priority_score'], entry['order_id'])
+        if SORTEDCONTAINERS_AVAILABLE:
+            self.keys.add(key)
+        else:
+            insort(self.keys, key)
+        self.entries[entry['order_id']] = (key, entry)
+        self.result = None
+
+    def discard(self, order_id: int) -> bool:
+        item = self.entries.pop(order_id, None)
+        if item is None:
+            return False
+        if SORTEDCONTAINERS_AVAILABLE:
+            self.keys.remove(item[0])
+        else:
+            del self.keys[bisect_left(self.keys, item[0])]
+        self.result = None
+        return True
+
+
+class AllocationPreview:
+    """Per-date previews of what ``allocate_for_date`` would do right now"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._books: Dict[date, PreviewBook] = {}
+        # order_id -> date of the book holding it, to follow date changes
+        self._order_dates: Dict[int, date] = {}
+        self._lock = threading.Lock()
+
+    def get(self, allocation_date: date) -> Dict:
+        """Preview for a date in the ``allocate_for_date`` response shape"""
+        with self._lock:
+            book = self._books.get(allocation_date)
+            if book is not None:
+                book = self._sync(book)
+            if book is None:
+                book = self._load(allocation_date)
+
+            if book.result is None:
+                book.result = self._compute(book)
+            return book.result
+
+    def update_order(self, order: Order):
+        """Reflect a created or changed order"""
+        with self._lock:
+            self._discard(order.id)
+            book = self._books.get(order.requested_delivery_date)
+            if book is None or order.status != 'pending':
+                return
+            self._add_orders(book, [order], datetime.utcnow())
+
+    def remove_order(self, order_id: int):
+        """Drop a cancelled or no longer pending order"""
+        with self._lock:
+            self._discard(order_id)
+
+    def update_inventory(self, inventory: Inventory):
+        """Reflect a supply change for the inventory's date"""
+        with self._lock:
+            book = self._books.get(inventory.date)
+            if book is None:
+                return
+            book.supply, book.available = self._supply(inventory)
+            book.result = None
+
+    def invalidate(self, allocation_date: Optional[date] = None):
+        """Drop one date's book, or every book, so the next read reseeds"""
+        with self._lock:
+            dates = [allocation_date] if allocation_date else list(self._books)
+            for day in dates:
+                book = self._books.pop(day, None)
+                if book is not None:
+                    for order_id in book.entries:
+                        self._order_dates.pop(order_id, None)
+
+    def _sync(self, book: PreviewBook) -> Optional[PreviewBook]:
+        """Bring a book up to date with the database; None if it must be reseeded"""
+        now = datetime.utcnow()
+        if book.scored_on != now.date() or table_versions(SCORE_TABLES) != book.versions:
+            return None
+
+        inventory = Inventory.query.filter_by(date=book.allocation_date).first()
+        if not inventory:
+            return None
+        supply = self._supply(inventory)
+        if supply != (book.supply, book.available):
+            book.supply, book.available = supply
+            book.result = None
+
+        changed = Order.query.options(joinedload(Order.customer)).filter(
+            Order.updated_at >= book.synced_at - SYNC_OVERLAP
+        ).all()
+        for order in changed:
+            if order.id in book.entries:
+                book.discard(order.id)
+                self._order_dates.pop(order.id, None)
+        pending = [order for order in changed
+                   if order.requested_delivery_date == book.allocation_date
+                   and order.status == 'pending']
+        if pending:
+            self._add_orders(book, pending, now)
+        book.synced_at = now
+        return book
+
+    def _add_orders(self, book: PreviewBook, orders, as_of: datetime):
+        """Score orders and add them to a book"""
+        customer_ids = {order.customer_id for order in orders}
+        waiting = dict(db.session.query(Waitlist.customer_id, func.count(Waitlist.id)).filter(
+            Waitlist.status == 'waiting',
+            Waitlist.customer_id.in_(customer_ids)
+        ).group_by(Waitlist.customer_id).all())
+        for record in self.engine._calculate_priority_scores(orders, as_of, waiting):
+            self._discard(record.order_id)
+            book.add(self._entry(record))
+            self._order_dates[record.order_id] = book.allocation_date
+
+    def _discard(self, order_id: int):
+        allocation_date = self._order_dates.pop(order_id, None)
+        book = self._books.get(allocation_date)
+        if book is not None:
+            book.discard(order_id)
+
+    def _supply(self, inventory: Inventory):
+        """``(supply, available)``: allocated dates only have what is left"""
+        supply = inventory.actual_supply or inventory.expected_supply
+        if inventory.allocated_at:
+            return supply, inventory.remaining or 0
+        return supply, supply
+
+    def _load(self, allocation_date: date) -> PreviewBook:
+        """Seed a date's book from the database"""
+        inventory = Inventory.query.filter_by(date=allocation_date).first()
+        if not inventory:
+            raise ValueError(f"No inventory found for {allocation_date}")
+
+        old = self._books.pop(allocation_date, None)
+        if old is not None:
+            for order_id in old.entries:
+                self._order_dates.pop(order_id, None)
+
+        as_of = datetime.utcnow()
+        supply, available = self._supply(inventory)
+        book = PreviewBook(allocation_date, supply, available, as_of.date(),
+                           table_versions(SCORE_TABLES), as_of)
+
+        orders = Order.query.options(joinedload(Order.customer)).filter(
+            Order.requested_delivery_date == allocation_date,
+            Order.status == 'pending'
+        ).order_by(Order.id).all()
+        records = self.engine._calculate_priority_scores(
+            orders, as_of, self.engine._waiting_counts_for_date(allocation_date)
+        )
+        for record in records:
+            book.add(self._entry(record))
+            self._order_dates[record.order_id] = allocation_date
+
+        self._books[allocation_date] = book
+        return book
+
+    def _entry(self, record: OrderRecord) -> Dict:
+        entry = self.engine._record_to_allocation_dict(record)
+        del entry['allocated_qty']
+        return entry
+
+    def _compute(self, book: PreviewBook) -> Dict:
+        """Run the allocation kernel over the book without persisting anything"""
+        records = [
+            OrderRecord(entry['order_id'], entry['customer_id'], entry['tier'],
+                        entry['requested_qty'], entry['priority_score'], ref=entry,
+                        zone=entry['zone'])
+            for _, entry in (book.entries[key[2]] for key in book.keys)
+        ]
+        allocated, waitlisted, remaining = self.engine._allocate_records(
+            records, book.available, self.engine.strategy, self.engine.allow_partial
+        )
+
+        def to_dict(record):
+            result = dict(record.ref, allocated_qty=record.allocated_qty)
+            if record.waitlist_qty:
+                result['waitlisted_qty'] = record.waitlist_qty
+            return result
+
+        result = self.engine._allocation_result(
+            book.allocation_date, book.supply,
+            [to_dict(r) for r in allocated], [to_dict(r) for r in waitlisted],
+            remaining, len(records), self.engine.strategy
+        )
+        result['preview'] = True
+        return result
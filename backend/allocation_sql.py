@@ -0,0 +1,218 @@
+"""SQL-native allocation: ranking, greedy pass and writes run inside the database
+
+Pending orders are scored and ranked with ``ROW_NUMBER()`` into a
+temporary table. The greedy pass then runs as rounds of windowed running
+totals of the capped quantity, and allocations and waitlist entries are
+written with ``INSERT ... SELECT``. Only scalars cross the wire until the
+final response rows are read. Supports SQLite (3.25+) and PostgreSQL.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
+from sqlalchemy import bindparam, text
+from sqlalchemy.types import Date, DateTime
+from allocation_core import TIER_ORDER, TIER_SCORES
+
+SUPPORTED_DIALECTS = ('sqlite', 'postgresql')
+
+_TIER_RANK_SQL = 'CASE c.tier {} END'.format(
+    ' '.join(f"WHEN '{tier}' THEN {rank}" for rank, tier in enumerate(TIER_ORDER))
+)
+_TIER_SCORE_SQL = 'CASE c.tier {} ELSE 0 END'.format(
+    ' '.join(f"WHEN '{tier}' THEN {TIER_SCORES[tier]}" for tier in TIER_ORDER)
+)
+_KNOWN_TIERS_SQL = ', '.join(f"'{tier}'" for tier in TIER_ORDER)
+
+
+def _days_since(dialect: str, column: str) -> str:
+    """Whole days between ``column`` and the ``:today`` parameter"""
+    if dialect == 'postgresql':
+        return f"(CAST(:today AS DATE) - CAST({column} AS DATE))"
+    return f"CAST(julianday(:today) - julianday(date({column})) AS INTEGER)"
+
+
+def _rank_sql(dialect: str) -> str:
+    days_since_fulfilled = _days_since(dialect, 'c.last_fulfilled_date')
+    days_waiting = _days_since(dialect, 'o.order_date')
+    return f"""
+        CREATE TEMPORARY TABLE alloc_rank AS
+        WITH waiting AS (
+            SELECT customer_id, COUNT(id) AS waiting
+            FROM waitlist
+            WHERE status = 'waiting'
+            GROUP BY customer_id
+        ), scored AS (
+            SELECT
+                o.id AS order_id,
+                o.customer_id AS customer_id,
+                o.order_qty AS order_qty,
+                CASE WHEN o.order_qty < :max_per_customer
+                     THEN o.order_qty ELSE :max_per_customer END AS qty,
+                {_TIER_RANK_SQL} AS tier_rank,
+                {_TIER_SCORE_SQL}
+                + CASE WHEN c.last_fulfilled_date IS NULL THEN 30
+                       WHEN {days_since_fulfilled} * 2 < 100 THEN {days_since_fulfilled} * 2
+                       ELSE 100 END
+                + {days_waiting} * 5
+                + COALESCE(o.priority_level, 0) * 10
+                + COALESCE(w.waiting, 0) * 20 AS score
+            FROM orders o
+            JOIN customers c ON c.id = o.customer_id
+            LEFT JOIN waiting w ON w.customer_id = o.customer_id
+            WHERE o.requested_delivery_date = :allocation_date
+              AND o.status = 'pending'
+              AND c.tier IN ({_KNOWN_TIERS_SQL})
+        )
+        SELECT
+            scored.*,
+            ROW_NUMBER() OVER (ORDER BY tier_rank, score DESC, order_id) AS rn,
+            0 AS taken
+        FROM scored
+    """
+
+
+_ROUND_SQL = """
+    SELECT
+        MIN(CASE WHEN running > :remaining THEN rn END) AS stop_rn,
+        MAX(CASE WHEN running <= :remaining THEN running END) AS used
+    FROM (
+        SELECT rn, SUM(qty) OVER (ORDER BY rn ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS running
+        FROM alloc_rank
+        WHERE rn > :cursor AND qty <= :remaining
+    ) candidates
+"""
+
+_TAKE_SQL = """
+    UPDATE alloc_rank SET taken = 1
+    WHERE rn > :cursor AND qty <= :remaining
+"""
+
+_WRITE_SQL = (
+    """
+    INSERT INTO allocations (order_id, customer_id, allocation_date, allocated_qty, status,
+                             allocation_timestamp, pickup_deadline, created_at, updated_at)
+    SELECT order_id, customer_id, :allocation_date, qty, 'pending', :now, :pickup_deadline, :now, :now
+    FROM alloc_rank WHERE taken = 1 ORDER BY rn
+    """,
+    """
+    INSERT INTO waitlist (order_id, customer_id, requested_qty, priority_score, added_date,
+                          target_fulfillment_date, status, created_at, updated_at)
+    SELECT order_id, customer_id, order_qty, score, :now, :target_date, 'waiting', :now, :now
+    FROM alloc_rank WHERE taken = 0 ORDER BY rn
+    """,
+    """
+    UPDATE orders SET status = 'allocated', expected_delivery_date = :allocation_date, updated_at = :now
+    WHERE id IN (SELECT order_id FROM alloc_rank WHERE taken = 1)
+    """,
+    """
+    UPDATE orders SET status = 'waitlisted', updated_at = :now
+    WHERE id IN (SELECT order_id FROM alloc_rank WHERE taken = 0)
+    """,
+    """
+    UPDATE customers SET last_fulfilled_date = :now, updated_at = :now
+    WHERE id IN (SELECT customer_id FROM alloc_rank WHERE taken = 1)
+    """,
+    """
+    UPDATE inventory SET allocated = :allocated, remaining = :remaining,
+                         allocated_at = :now, updated_at = :now
+    WHERE id = :inventory_id
+    """,
+)
+
+_RESULT_SQL = """
+    SELECT r.order_id, o.order_number, r.customer_id, c.farm_name, c.phone, c.zone, c.tier,
+           r.order_qty, r.qty, r.score, r.taken
+    FROM alloc_rank r
+    JOIN orders o ON o.id = r.order_id
+    JOIN customers c ON c.id = r.customer_id
+    ORDER BY r.rn
+"""
+
+_PENDING_COUNT_SQL = """
+    SELECT COUNT(id) FROM orders
+    WHERE requested_delivery_date = :allocation_date AND status = 'pending'
+"""
+
+
+def _statement(sql: str):
+    """Text statement with date/datetime parameters typed for the dialect"""
+    params = [
+        bindparam(name, type_=type_) for name, type_ in (
+            ('allocation_date', Date()), ('target_date', Date()),
+            ('now', DateTime()), ('pickup_deadline', DateTime())
+        ) if f':{name}' in sql
+    ]
+    return text(sql).bindparams(*params)
+
+
+def allocate_in_database(session, inventory_id: int, supply: int, allocation_date: date,
+                         as_of: datetime, max_per_customer: int,
+                         pickup_deadline: datetime) -> Tuple[List[Dict], List[Dict], int, int]:
+    """Allocate a date's pending orders without loading them into Python
+
+    Stages all writes on ``session`` without committing. Returns
+    ``(allocated, waitlisted, remaining, total_orders)`` where the lists
+    hold allocation dictionaries in allocation order.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect not in SUPPORTED_DIALECTS:
+        raise ValueError(f"SQL allocation engine does not support {dialect}")
+
+    total_orders = session.execute(
+        _statement(_PENDING_COUNT_SQL), {'allocation_date': allocation_date}
+    ).scalar()
+    if not total_orders:
+        return [], [], supply, 0
+
+    session.execute(text('DROP TABLE IF EXISTS alloc_rank'))
+    session.execute(_statement(_rank_sql(dialect)), {
+        'allocation_date': allocation_date,
+        'today': as_of.date().isoformat(),
+        'max_per_customer': max_per_customer
+    })
+
+    # Greedy rounds: take the longest prefix whose running total fits; the
+    # first row past it is waitlisted and the pass resumes after it
+    remaining = supply
+    cursor = 0
+    while True:
+        params = {'cursor': cursor, 'remaining': remaining}
+        stop_rn, used = session.execute(text(_ROUND_SQL), params).one()
+        if stop_rn is None:
+            session.execute(text(_TAKE_SQL), params)
+            remaining -= used or 0
+            break
+        session.execute(text(_TAKE_SQL + ' AND rn < :stop_rn'), dict(params, stop_rn=stop_rn))
+        remaining -= used or 0
+        cursor = stop_rn
+
+    write_params = {
+        'allocation_date': allocation_date,
+        'target_date': allocation_date + timedelta(days=1),
+        'now': as_of,
+        'pickup_deadline': pickup_deadline,
+        'allocated': supply - remaining,
+        'remaining': remaining,
+        'inventory_id': inventory_id
+    }
+    for sql in _WRITE_SQL:
+        session.execute(_statement(sql), write_params)
+
+    allocated = []
+    waitlisted = []
+    for row in session.execute(text(_RESULT_SQL)):
+        entry = {
+            'order_id': row.order_id,
+            'order_number': row.order_number,
+            'customer_id': row.customer_id,
+            'customer_name': row.farm_name,
+            'phone': row.phone,
+            'zone': row.zone,
+            'tier': row.tier,
+            'requested_qty': row.order_qty,
+            'allocated_qty': row.qty if row.taken else 0,
+            'priority_score': float(row.score)
+        }
+        (allocated if row.taken else waitlisted).append(entry)
+
+    session.execute(text('DROP TABLE alloc_rank'))
+    return allocated, waitlisted, remaining, total_orders
@@ -0,0 +1,143 @@
+"""Zone-partitioned allocation with supply reserves for remote zones
+
+Supply is split into per-zone budgets. Remote zones first receive a
+reserve (a share of supply divided by their demand, never more than that
+demand); the rest is shared out in proportion to each zone's unmet demand.
+Every zone is then allocated independently by the kernel, in-process or,
+when opted in for large order books, in the shared worker processes (see
+``process_pool``), and a final global pass hands whatever the zones did
+not use to the best waitlisted orders across all zones.
+"""
+from typing import Collection, Dict, List, Tuple
+from allocation_core import TIER_ORDER, OrderRecord
+import allocation_core
+import process_pool
+
+# Strategy name for zone-partitioned allocation
+ZONED = 'zoned'
+
+# Partition for orders whose customer has no zone
+NO_ZONE = ''
+
+_TIER_RANKS = {tier: rank for rank, tier in enumerate(TIER_ORDER)}
+
+
+def zone_budgets(demand: Dict[str, int], supply: int, remote_zones: Collection[str],
+                 remote_reserve_pct: int) -> Dict[str, int]:
+    """Integer supply budget per zone from each zone's capped demand"""
+    budgets = {zone: 0 for zone in demand}
+
+    remote_demand = {zone: qty for zone, qty in demand.items() if zone in remote_zones and qty}
+    if remote_demand:
+        reserve = min(supply * remote_reserve_pct // 100, sum(remote_demand.values()))
+        budgets.update(_apportion(reserve, remote_demand))
+
+    unmet = {zone: qty - budgets[zone] for zone, qty in demand.items() if qty > budgets[zone]}
+    if unmet:
+        rest = min(supply - sum(budgets.values()), sum(unmet.values()))
+        for zone, share in _apportion(rest, unmet).items():
+            budgets[zone] += share
+
+    return budgets
+
+
+def _apportion(total: int, weights: Dict[str, int]) -> Dict[str, int]:
+    """Split ``total`` in proportion to ``weights`` by largest remainder
+
+    No share exceeds its weight as long as ``total`` does not exceed the
+    sum of the weights.
+    """
+    weight_sum = sum(weights.values())
+    shares = {key: total * weight // weight_sum for key, weight in weights.items()}
+    leftover = total - sum(shares.values())
+    by_remainder = sorted(weights, key=lambda key: (-(total * weights[key] % weight_sum), key))
+    for key in by_remainder[:leftover]:
+        shares[key] += 1
+    return shares
+
+
+def _allocate_zones(jobs: List[Tuple]) -> List[List[Tuple[int, int]]]:
+    return [_allocate_zone(job) for job in jobs]
+
+
+def _allocate_zone(args: Tuple[List[Tuple], int, int, str]) -> List[Tuple[int, int]]:
+    """Kernel pass over one zone; returns ``(order_id, qty)`` of allocated orders"""
+    entries, budget, max_per_customer, strategy = args
+    records = [OrderRecord(*entry) for entry in entries]
+    allocated, _, _ = allocation_core.allocate(records, budget, max_per_customer, strategy)
+    return [(record.order_id, record.allocated_qty) for record in allocated]
+
+
+def allocate_zoned(records: List[OrderRecord], supply: int, max_per_customer: int,
+                   remote_zones: Collection[str] = (), remote_reserve_pct: int = 0,
+                   strategy: str = 'greedy', allow_partial: bool = False,
+                   min_partial_qty: int = 1, workers: int = 1,
+                   parallel_min_orders: int = 0) -> Tuple[List[OrderRecord], List[OrderRecord], int]:
+    """Zone-partitioned ``allocation_core.allocate`` with the same return value
+
+    ``strategy`` is used within each zone. Zone passes run in-process unless
+    ``workers`` is above 1 and there are at least ``parallel_min_orders``
+    records; then they are split into one batch per worker (at most
+    ``process_pool.MAX_WORKERS``) and only order tuples cross the process
+    boundary. Partial fills, if
+    allowed, happen in the global rebalancing pass.
+    """
+    if strategy not in allocation_core.STRATEGIES:
+        raise ValueError(f"Unknown allocation strategy: {strategy}")
+
+    records = list(records)
+    by_zone: Dict[str, List[OrderRecord]] = {}
+    demand: Dict[str, int] = {}
+    for record in records:
+        record.allocated_qty = 0
+        record.waitlist_qty = 0
+        if record.tier not in _TIER_RANKS:
+            continue
+        zone = record.zone or NO_ZONE
+        by_zone.setdefault(zone, []).append(record)
+        demand[zone] = demand.get(zone, 0) + min(record.order_qty, max_per_customer)
+
+    budgets = zone_budgets(demand, supply, remote_zones, remote_reserve_pct)
+    zones = sorted(by_zone)
+    jobs = [
+        ([(r.order_id, r.customer_id, r.tier, r.order_qty, r.priority_score)
+          for r in by_zone[zone]], budgets[zone], max_per_customer, strategy)
+        for zone in zones
+    ]
+
+    workers = min(process_pool.worker_count(workers), len(jobs))
+    if workers > 1 and len(records) >= parallel_min_orders:
+        size = -(-len(jobs) // workers)
+        batches = [(jobs[start:start + size],) for start in range(0, len(jobs), size)]
+        zone_results = [result for batch in process_pool.run_batches(_allocate_zones, batches)
+                        for result in batch]
+    else:
+        zone_results = _allocate_zones(jobs)
+
+    by_id = {record.order_id: record for record in records}
+    for zone_allocated in zone_results:
+        for order_id, qty in zone_allocated:
+            by_id[order_id].allocated_qty = qty
+
+    # Global rebalancing: zone leftovers go to the best waitlisted orders that
+    # still fit, considered in input order like a plain kernel pass
+    known = [record for record in records if record.tier in _TIER_RANKS]
+    remaining = supply - sum(record.allocated_qty for record in known)
+    candidates = [record for record in known if not record.allocated_qty
+                  and min(record.order_qty, max_per_customer) <= remaining]
+    _, _, remaining = allocation_core.allocate(candidates, remaining, max_per_customer)
+
+    # Report both lists in global allocation order, like the kernel
+    position = {record.order_id: i for i, record in enumerate(records)}
+    known.sort(key=lambda r: (_TIER_RANKS[r.tier], -r.priority_score, position[r.order_id]))
+    allocated = [record for record in known if record.allocated_qty]
+    waitlisted = [record for record in known if not record.allocated_qty]
+
+    if allow_partial and waitlisted and remaining >= max(min_partial_qty, 1):
+        record = waitlisted.pop(0)
+        record.allocated_qty = remaining
+        record.waitlist_qty = min(record.order_qty, max_per_customer) - remaining
+        allocated.append(record)
+        remaining = 0
+
+    return allocated, waitlisted, remaining
@@ -23,7 +23,9 @@ def create_app(config_name=None):
     # Configure CORS for production - allow all Vercel deployments
     CORS(app, 
          resources={r"/*": {"origins": "*"}},
-         allow_headers=["Content-Type", "Authorization"],
+         allow_headers=["Content-Type", "Authorization", "Idempotency-Key",
+                        "If-None-Match", "If-Modified-Since"],
+         expose_headers=["X-Next-Cursor", "ETag", "Last-Modified"],
          methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
          supports_credentials=False)
     
@@ -46,10 +48,11 @@ def create_app(config_name=None):
     def init_db():
         try:
             from models import User
+            from schema_upgrades import upgrade_schema
             from werkzeug.security import generate_password_hash
             
-            # Create all tables
-            db.create_all()
+            # Create all tables and bring older schemas up to date
+            upgrade_schema()
             
             # Check if admin user already exists
             existing_admin = User.query.filter_by(username='admin').first()
@@ -92,5 +95,10 @@ def create_app(config_name=None):
     return app
 
 if __name__ == '__main__':
+    from jobs import start_scheduler
+
     app = create_app()
+    # Only in the reloader's serving child, not its watcher process
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_scheduler(app)
     app.run(debug=True, host='0.0.0.0', port=5000)
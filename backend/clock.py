@@ -0,0 +1,19 @@
+"""Business-local wall-clock times for a UTC database
+
+Timestamps are stored and compared as naive UTC (``datetime.utcnow()``).
+Times people set or read, such as the ``PICKUP_DEADLINE_HOUR`` cut-off and
+the deadline in a customer's message, are in ``BUSINESS_TIMEZONE``.
+"""
+from datetime import date, datetime, time, timezone
+from zoneinfo import ZoneInfo
+
+
+def local_to_utc(day: date, hour: int, zone: str) -> datetime:
+    """Naive UTC time of ``hour`` o'clock on ``day`` in ``zone``"""
+    local = datetime.combine(day, time(hour), tzinfo=ZoneInfo(zone))
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def utc_to_local(moment: datetime, zone: str) -> datetime:
+    """Naive UTC ``moment`` as a naive wall-clock time in ``zone``"""
+    return moment.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(zone)).replace(tzinfo=None)
@@ -0,0 +1,78 @@
+"""Conditional GET for list and report endpoints
+
+``@conditional(Order, Customer)`` validates a GET against the tables it
+reads before running the view. One query fetches each table's highest id
+and latest ``updated_at``, both read off an index (rows are never deleted,
+only cancelled, so an insert or update moves one of them). The ETag hashes
+those together with the request URL and today's date, and the newest
+``updated_at`` is the Last-Modified time. A client that sends back a matching ``If-None-Match`` (or an
+``If-Modified-Since`` no older than that time) gets ``304 Not Modified``
+without the view running, so an unchanged poll costs one small aggregate
+query and no serialization.
+"""
+import hashlib
+from datetime import date, timezone
+from functools import wraps
+from flask import Response, make_response, request
+from sqlalchemy import func, select
+from models import db
+
+
+def table_versions_statement(models):
+    """One SELECT of each model's highest id and latest ``updated_at``"""
+    columns = []
+    for model in models:
+        columns.append(select(func.max(model.id)).scalar_subquery())
+        columns.append(select(func.max(model.updated_at)).scalar_subquery())
+    return select(*columns)
+
+
+def table_versions(models) -> list:
+    """``[max(id), max(updated_at), ...]`` for each model, in one query"""
+    return list(db.session.execute(table_versions_statement(models)).one())
+
+
+def _validators(models):
+    versions = table_versions(models)
+    key = repr((request.full_path, date.today().isoformat(), versions))
+    etag = hashlib.sha1(key.encode()).hexdigest()
+    updated = [value for value in versions[1::2] if value is not None]
+    last_modified = max(updated).replace(microsecond=0, tzinfo=timezone.utc) if updated else None
+    return etag, last_modified
+
+
+def _not_modified(etag, last_modified) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    # Clients may keep the response but must revalidate before reusing it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def conditional(*models):
+    """Answer unchanged GETs of a view reading ``models`` with 304"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+
+            etag, last_modified = _validators(models)
+            if _not_modified(etag, last_modified):
+                return _set_validators(Response(status=304), etag, last_modified)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                _set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
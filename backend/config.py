@@ -33,10 +33,110 @@ class Config:
     # Firebase
     FCM_SERVER_KEY = os.getenv('FCM_SERVER_KEY')
     
+    # Notification outbox worker: messages claimed per batch, concurrent sends,
+    # attempts before a message is marked failed (retries back off
+    # exponentially from the base delay) and how long a claim is held
+    NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', 100))
+    NOTIFICATION_WORKERS = int(os.getenv('NOTIFICATION_WORKERS', 8))
+    NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', 5))
+    NOTIFICATION_RETRY_BASE_SECONDS = int(os.getenv('NOTIFICATION_RETRY_BASE_SECONDS', 30))
+    NOTIFICATION_CLAIM_TTL_SECONDS = int(os.getenv('NOTIFICATION_CLAIM_TTL_SECONDS', 300))
+    NOTIFICATION_POLL_SECONDS = int(os.getenv('NOTIFICATION_POLL_SECONDS', 5))
+    NOTIFICATION_HTTP_TIMEOUT_SECONDS = int(os.getenv('NOTIFICATION_HTTP_TIMEOUT_SECONDS', 10))
+    
+    # Provider transports: live (providers, or printed when unconfigured) or
+    # fake (in-process, for offline benchmarks), and concurrent requests
+    # allowed per provider
+    NOTIFICATION_TRANSPORT = os.getenv('NOTIFICATION_TRANSPORT', 'live')
+    NOTIFICATION_FAKE_LATENCY_MS = int(os.getenv('NOTIFICATION_FAKE_LATENCY_MS', 50))
+    TWILIO_MAX_CONCURRENCY = int(os.getenv('TWILIO_MAX_CONCURRENCY', 8))
+    SENDGRID_MAX_CONCURRENCY = int(os.getenv('SENDGRID_MAX_CONCURRENCY', 8))
+    FCM_MAX_CONCURRENCY = int(os.getenv('FCM_MAX_CONCURRENCY', 16))
+    
+    # Worker fan-out: threads (NOTIFICATION_WORKERS) or asyncio, with
+    # per-provider send rates (0 for no limit) and the dispatch queue bound
+    NOTIFICATION_DISPATCHER = os.getenv('NOTIFICATION_DISPATCHER', 'asyncio')
+    TWILIO_RATE_PER_SECOND = float(os.getenv('TWILIO_RATE_PER_SECOND', 100))
+    SENDGRID_RATE_PER_SECOND = float(os.getenv('SENDGRID_RATE_PER_SECOND', 100))
+    FCM_RATE_PER_SECOND = float(os.getenv('FCM_RATE_PER_SECOND', 500))
+    NOTIFICATION_QUEUE_SIZE = int(os.getenv('NOTIFICATION_QUEUE_SIZE', 1000))
+    # One digest per recipient and channel for messages due together; the
+    # window holds new messages back so later ones can join the digest
+    NOTIFICATION_DIGEST_ENABLED = os.getenv('NOTIFICATION_DIGEST_ENABLED', 'true').lower() == 'true'
+    NOTIFICATION_DIGEST_WINDOW_SECONDS = int(os.getenv('NOTIFICATION_DIGEST_WINDOW_SECONDS', 0))
+    # Deliver the outbox from the job scheduler
+    # instead of a separate notification_worker.py
+    NOTIFICATION_IN_PROCESS = os.getenv('NOTIFICATION_IN_PROCESS', 'false').lower() == 'true'
+    
     # Business Rules
     MAX_PER_CUSTOMER = int(os.getenv('MAX_PER_CUSTOMER', 1000))
     WAITING_PERIOD_DAYS = int(os.getenv('WAITING_PERIOD_DAYS', 7))
     PICKUP_DEADLINE_HOUR = int(os.getenv('PICKUP_DEADLINE_HOUR', 14))
+    # Zone of wall-clock business times (the pickup cut-off, message times);
+    # timestamps are stored in UTC
+    BUSINESS_TIMEZONE = os.getenv('BUSINESS_TIMEZONE', 'UTC')
+    
+    # Allocation engine: 'python' (ORM + kernel), 'numpy' (vectorized, bulk writes)
+    # or 'sql' (window functions and INSERT ... SELECT inside the database)
+    ALLOCATION_ENGINE = os.getenv('ALLOCATION_ENGINE', 'python')
+    
+    # Allocation strategy: 'greedy', 'best_fit' or 'zoned'; partial fills split one order
+    # to use supply that would otherwise be stranded
+    ALLOCATION_STRATEGY = os.getenv('ALLOCATION_STRATEGY', 'greedy')
+    ALLOCATION_ALLOW_PARTIAL = os.getenv('ALLOCATION_ALLOW_PARTIAL', 'false').lower() == 'true'
+    ALLOCATION_MIN_PARTIAL_QTY = int(os.getenv('ALLOCATION_MIN_PARTIAL_QTY', 50))
+    
+    # Zone-partitioned allocation ('zoned' strategy): remote zones get a reserved
+    # share of supply; zone passes run in-process unless ALLOCATION_ZONE_WORKERS
+    # opts in to worker processes (capped at process_pool.MAX_WORKERS) on large days
+    REMOTE_ZONES = [z.strip() for z in os.getenv('REMOTE_ZONES', '').split(',') if z.strip()]
+    REMOTE_ZONE_RESERVE_PCT = int(os.getenv('REMOTE_ZONE_RESERVE_PCT', 10))
+    ALLOCATION_ZONE_WORKERS = int(os.getenv('ALLOCATION_ZONE_WORKERS', 1))
+    ALLOCATION_ZONE_PARALLEL_MIN_ORDERS = int(os.getenv('ALLOCATION_ZONE_PARALLEL_MIN_ORDERS', 20000))
+    
+    # Allocation persistence: 'orm' (single unit of work) or 'bulk' (chunked commits)
+    ALLOCATION_WRITE_MODE = os.getenv('ALLOCATION_WRITE_MODE', 'orm')
+    ALLOCATION_WRITE_CHUNK_SIZE = int(os.getenv('ALLOCATION_WRITE_CHUNK_SIZE', 1000))
+    
+    # Per-date run lock: how long a contending run waits, and how long after
+    # its last heartbeat (renewed per committed chunk) a run is considered
+    # abandoned
+    ALLOCATION_LOCK_WAIT_SECONDS = int(os.getenv('ALLOCATION_LOCK_WAIT_SECONDS', 30))
+    ALLOCATION_LOCK_TTL_SECONDS = int(os.getenv('ALLOCATION_LOCK_TTL_SECONDS', 900))
+    
+    # Job scheduler (APScheduler) in the development server; behind gunicorn
+    # run one `python jobs.py scheduler` process, or cron `python jobs.py <job>`
+    SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'false').lower() == 'true'
+    WAITLIST_SWEEP_INTERVAL_MINUTES = int(os.getenv('WAITLIST_SWEEP_INTERVAL_MINUTES', 60))
+    WAITLIST_RESCORE_INTERVAL_MINUTES = int(os.getenv('WAITLIST_RESCORE_INTERVAL_MINUTES', 60))
+    
+    # Pickup expiry: overdue allocations are reclaimed every few minutes and
+    # optionally re-offered to the waitlist. Allocations made after the daily
+    # cut-off get REALLOCATION_PICKUP_HOURS to collect
+    PICKUP_EXPIRY_INTERVAL_MINUTES = int(os.getenv('PICKUP_EXPIRY_INTERVAL_MINUTES', 5))
+    PICKUP_EXPIRY_FULFIL_WAITLIST = os.getenv('PICKUP_EXPIRY_FULFIL_WAITLIST', 'true').lower() == 'true'
+    REALLOCATION_PICKUP_HOURS = int(os.getenv('REALLOCATION_PICKUP_HOURS', 3))
+    
+    # Late orders never wait on a run lock when saved; ones that found it busy
+    # are allocated by this job
+    LATE_ORDER_INTERVAL_MINUTES = int(os.getenv('LATE_ORDER_INTERVAL_MINUTES', 5))
+    
+    # List endpoints page only when asked (?limit= or ?cursor=): pages of
+    # API_PAGE_SIZE rows unless ?limit= asks for another size, never more
+    # than API_MAX_PAGE_SIZE
+    API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 100))
+    API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 1000))
+    # Streamed listings (?stream=ndjson|json) read and write rows in batches of this size
+    STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 1000))
+    
+    # Waitlist fulfilment reads waiting entries in keyset pages of this size
+    WAITLIST_PAGE_SIZE = int(os.getenv('WAITLIST_PAGE_SIZE', 500))
+    
+    # What-if simulations: worker processes (1 runs in-process; more opt in to
+    # the shared spawn pool, capped at process_pool.MAX_WORKERS) and
+    # scenarios allowed per request
+    SIMULATION_MAX_WORKERS = int(os.getenv('SIMULATION_MAX_WORKERS', 1))
+    SIMULATION_MAX_SCENARIOS = int(os.getenv('SIMULATION_MAX_SCENARIOS', 200))
 
 class DevelopmentConfig(Config):
     """Development configuration"""
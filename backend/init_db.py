@@ -1,6 +1,7 @@
 """Database initialization script for production deployment"""
 from app import create_app, db
 from models import User
+from schema_upgrades import upgrade_schema
 from werkzeug.security import generate_password_hash
 import os
 
@@ -9,8 +10,8 @@ def init_database():
     app = create_app('production')
     
     with app.app_context():
-        # Create all tables
-        db.create_all()
+        # Create all tables and bring older schemas up to date
+        upgrade_schema()
         print("✅ Database tables created")
         
         # Check if admin user already exists
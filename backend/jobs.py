@@ -0,0 +1,172 @@
+"""Background maintenance jobs and their scheduler
+
+Jobs run in an application context and can be scheduled in-process with
+APScheduler or run from cron::
+
+    python jobs.py sweep-waitlist
+    python jobs.py rescore-waitlist
+    python jobs.py expire-allocations
+    python jobs.py allocate-late-orders
+    python jobs.py deliver-notifications
+
+``create_app`` never starts the scheduler, so API workers and scripts don't
+each run their own copy. With ``SCHEDULER_ENABLED`` it starts in the
+development server (``python app.py``); behind gunicorn, run exactly one
+scheduler process next to the workers::
+
+    python jobs.py scheduler
+"""
+import argparse
+import json
+import sys
+import time
+import traceback
+try:
+    from apscheduler.schedulers.background import BackgroundScheduler
+    APSCHEDULER_AVAILABLE = True
+except ImportError:
+    APSCHEDULER_AVAILABLE = False
+
+
+def sweep_waitlist(app):
+    """Merge duplicate and expire stale waitlist entries"""
+    from allocation_engine import AllocationEngine
+
+    with app.app_context():
+        result = AllocationEngine().sweep_waitlist()
+        print(f"🧹 Waitlist sweep: {result['merged']} merged, {result['expired']} expired, "
+              f"{result['remaining_waitlist']} waiting")
+        return result
+
+
+def rescore_waitlist(app):
+    """Recompute waiting entries' priority scores for today"""
+    from allocation_engine import AllocationEngine
+
+    with app.app_context():
+        result = AllocationEngine().recompute_waitlist_scores()
+        print(f"📊 Waitlist rescore: {result['updated']} of {result['rescored']} scores changed")
+        return result
+
+
+def expire_allocations(app):
+    """Reclaim allocations not picked up by their deadline"""
+    from allocation_engine import AllocationEngine
+
+    with app.app_context():
+        result = AllocationEngine().expire_overdue_allocations()
+        print(f"⏰ Pickup expiry: {result['expired']} allocations expired, "
+              f"{result['reclaimed_qty']} chicks reclaimed")
+        return result
+
+
+def allocate_late_orders(app):
+    """Allocate pending orders of already-allocated dates"""
+    from allocation_engine import AllocationEngine
+
+    with app.app_context():
+        result = AllocationEngine().allocate_late_orders()
+        if result['dates'] or result['busy']:
+            print(f"🕒 Late orders: {result['allocated']} allocated, "
+                  f"{result['waitlisted']} waitlisted, {len(result['busy'])} dates busy")
+        return result
+
+
+def deliver_notifications(app):
+    """Deliver notifications due in the outbox
+
+    Scheduled runs share one ``NotificationService`` (kept on the app), so the
+    transports and async sessions stay open between ticks.
+    """
+    from notification_worker import run_once
+    from notifications import NotificationService
+
+    service = app.extensions.setdefault('notification_service', NotificationService())
+    result = run_once(app, service=service)
+    if result['claimed']:
+        print(f"📨 Notifications: {result['sent']} sent, {result['retrying']} retrying, "
+              f"{result['failed']} failed")
+    return result
+
+
+def _run_job(job, app):
+    """Scheduler wrapper: a failing job must not stop the scheduler"""
+    try:
+        job(app)
+    except Exception:
+        traceback.print_exc()
+
+
+def start_scheduler(app, enabled=None):
+    """Start the scheduler if enabled (default: ``SCHEDULER_ENABLED``) and APScheduler is installed"""
+    if not (app.config['SCHEDULER_ENABLED'] if enabled is None else enabled):
+        return None
+    if not APSCHEDULER_AVAILABLE:
+        print("⚠️  The scheduler is enabled but APScheduler is not installed")
+        return None
+
+    scheduler = BackgroundScheduler(daemon=True)
+
+    for job, setting in ((sweep_waitlist, 'WAITLIST_SWEEP_INTERVAL_MINUTES'),
+                         (rescore_waitlist, 'WAITLIST_RESCORE_INTERVAL_MINUTES'),
+                         (expire_allocations, 'PICKUP_EXPIRY_INTERVAL_MINUTES'),
+                         (allocate_late_orders, 'LATE_ORDER_INTERVAL_MINUTES')):
+        interval = app.config[setting]
+        if interval > 0:
+            scheduler.add_job(_run_job, 'interval', minutes=interval, args=(job, app),
+                              id=job.__name__, max_instances=1, coalesce=True)
+
+    # Without a separate notification_worker.py process
+    if app.config['NOTIFICATION_IN_PROCESS']:
+        scheduler.add_job(_run_job, 'interval', seconds=app.config['NOTIFICATION_POLL_SECONDS'],
+                          args=(deliver_notifications, app), id='deliver_notifications',
+                          max_instances=1, coalesce=True)
+
+    scheduler.start()
+    return scheduler
+
+
+JOBS = {
+    'sweep-waitlist': sweep_waitlist,
+    'rescore-waitlist': rescore_waitlist,
+    'expire-allocations': expire_allocations,
+    'allocate-late-orders': allocate_late_orders,
+    'deliver-notifications': deliver_notifications,
+}
+
+
+def run_scheduler(app):
+    """Run the scheduled jobs in this process until interrupted"""
+    scheduler = start_scheduler(app, enabled=True)
+    if scheduler is None:
+        return 1
+    try:
+        while True:
+            time.sleep(60)
+    except (KeyboardInterrupt, SystemExit):
+        scheduler.shutdown()
+    finally:
+        if 'notification_service' in app.extensions:
+            app.extensions.pop('notification_service').close()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a ChickFlow maintenance job once, '
+                                                 'or the job scheduler')
+    parser.add_argument('job', choices=sorted(JOBS) + ['scheduler'])
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    app = create_app()
+    if args.job == 'scheduler':
+        return run_scheduler(app)
+    result = JOBS[args.job](app)
+    if 'notification_service' in app.extensions:
+        app.extensions.pop('notification_service').close()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,7 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, literal_column
+from sqlalchemy.ext.hybrid import hybrid_property
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
@@ -60,6 +62,12 @@ class Customer(db.Model):
     orders = db.relationship('Order', backref='customer', lazy='dynamic', cascade='all, delete-orphan')
     allocations = db.relationship('Allocation', backref='customer', lazy='dynamic', cascade='all, delete-orphan')
     
+    # Conditional GETs and the allocation preview read the latest updated_at
+    __table_args__ = (
+        db.Index('ix_customers_updated_at', 'updated_at'),
+        db.Index('ix_customers_active', 'is_active'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -105,12 +113,21 @@ class Order(db.Model):
     allocations = db.relationship('Allocation', backref='order', lazy='dynamic', cascade='all, delete-orphan')
     deliveries = db.relationship('Delivery', backref='order', uselist=False, cascade='all, delete-orphan')
     
-    def to_dict(self):
-        return {
+    # Allocation reads a date's pending orders; customer pages and reports
+    # read by customer, status and order date; conditional GETs by updated_at
+    __table_args__ = (
+        db.Index('ix_orders_delivery_status', 'requested_delivery_date', 'status'),
+        db.Index('ix_orders_customer_date', 'customer_id', 'order_date'),
+        db.Index('ix_orders_status_date', 'status', 'order_date'),
+        db.Index('ix_orders_order_date', 'order_date'),
+        db.Index('ix_orders_updated_at', 'updated_at'),
+    )
+    
+    def to_dict(self, include_customer=True):
+        result = {
             'id': self.id,
             'order_number': self.order_number,
             'customer_id': self.customer_id,
-            'customer': self.customer.to_dict() if self.customer else None,
             'order_qty': self.order_qty,
             'status': self.status,
             'order_date': self.order_date.isoformat() if self.order_date else None,
@@ -122,6 +139,9 @@ class Order(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+        if include_customer:
+            result['customer'] = self.customer.to_dict() if self.customer else None
+        return result
 
 
 class Inventory(db.Model):
@@ -136,6 +156,7 @@ class Inventory(db.Model):
     remaining = db.Column(db.Integer)
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, delivered
     notes = db.Column(db.Text)
+    allocated_at = db.Column(db.DateTime)  # last allocation run for this date
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -150,6 +171,7 @@ class Inventory(db.Model):
             'remaining': self.remaining,
             'status': self.status,
             'notes': self.notes,
+            'allocated_at': self.allocated_at.isoformat() if self.allocated_at else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -164,7 +186,7 @@ class Allocation(db.Model):
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
     allocation_date = db.Column(db.Date, nullable=False)
     allocated_qty = db.Column(db.Integer, nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, confirmed, picked_up, cancelled
+    status = db.Column(db.String(20), default='pending')  # pending, confirmed, picked_up, cancelled, expired
     
     # Timing
     allocation_timestamp = db.Column(db.DateTime, default=datetime.utcnow)
@@ -176,12 +198,21 @@ class Allocation(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def to_dict(self):
-        return {
+    # Reports read by date, order and customer pages by their ids; overdue
+    # pickups are found by status and deadline; conditional GETs by updated_at
+    __table_args__ = (
+        db.Index('ix_allocations_date_status', 'allocation_date', 'status'),
+        db.Index('ix_allocations_order', 'order_id'),
+        db.Index('ix_allocations_customer_date', 'customer_id', 'allocation_date'),
+        db.Index('ix_allocations_status_deadline', 'status', 'pickup_deadline'),
+        db.Index('ix_allocations_updated_at', 'updated_at'),
+    )
+    
+    def to_dict(self, include_customer=True):
+        result = {
             'id': self.id,
             'order_id': self.order_id,
             'customer_id': self.customer_id,
-            'customer': self.customer.to_dict() if self.customer else None,
             'allocation_date': self.allocation_date.isoformat() if self.allocation_date else None,
             'allocated_qty': self.allocated_qty,
             'status': self.status,
@@ -192,6 +223,9 @@ class Allocation(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+        if include_customer:
+            result['customer'] = self.customer.to_dict() if self.customer else None
+        return result
 
 
 class Delivery(db.Model):
@@ -220,6 +254,11 @@ class Delivery(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Conditional GETs read the latest updated_at
+    __table_args__ = (
+        db.Index('ix_deliveries_updated_at', 'updated_at'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -253,7 +292,7 @@ class Waitlist(db.Model):
     target_fulfillment_date = db.Column(db.Date)
     actual_fulfillment_date = db.Column(db.Date)
     
-    status = db.Column(db.String(20), default='waiting')  # waiting, fulfilled, cancelled
+    status = db.Column(db.String(20), default='waiting')  # waiting, fulfilled, cancelled, merged, expired
     notes = db.Column(db.Text)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -263,12 +302,34 @@ class Waitlist(db.Model):
     order = db.relationship('Order', backref='waitlist_entries')
     customer = db.relationship('Customer', backref='waitlist_entries')
     
-    def to_dict(self):
-        return {
+    # Waiting entries in fulfilment order (queue_score, then id), so top-K
+    # reads walk the index, and by quantity for the smallest waiting request;
+    # waiting counts go by customer and reports by the date entries were added;
+    # conditional GETs read the latest updated_at
+    __table_args__ = (
+        db.Index('ix_waitlist_queue_score', 'status',
+                 func.coalesce(priority_score, literal_column('0.0')).desc(), 'id'),
+        db.Index('ix_waitlist_customer_status', 'customer_id', 'status'),
+        db.Index('ix_waitlist_order', 'order_id', 'status'),
+        db.Index('ix_waitlist_status_qty', 'status', 'requested_qty'),
+        db.Index('ix_waitlist_added', 'added_date'),
+        db.Index('ix_waitlist_updated_at', 'updated_at'),
+    )
+    
+    @hybrid_property
+    def queue_score(self):
+        """Priority score for queue order; an unscored entry counts as 0"""
+        return 0.0 if self.priority_score is None else self.priority_score
+    
+    @queue_score.expression
+    def queue_score(cls):
+        return func.coalesce(cls.priority_score, literal_column('0.0'))
+    
+    def to_dict(self, include_customer=True):
+        result = {
             'id': self.id,
             'order_id': self.order_id,
             'customer_id': self.customer_id,
-            'customer': self.customer.to_dict() if self.customer else None,
             'requested_qty': self.requested_qty,
             'priority_score': self.priority_score,
             'added_date': self.added_date.isoformat() if self.added_date else None,
@@ -279,6 +340,9 @@ class Waitlist(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+        if include_customer:
+            result['customer'] = self.customer.to_dict() if self.customer else None
+        return result
 
 
 class Notification(db.Model):
@@ -312,3 +376,82 @@ class Notification(db.Model):
             'sent_at': self.sent_at.isoformat() if self.sent_at else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+
+class NotificationOutbox(db.Model):
+    """Message waiting to be delivered, written in the transaction that caused it"""
+    __tablename__ = 'notification_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(20), nullable=False)  # sms, email, push
+    recipient_type = db.Column(db.String(20), nullable=False)
+    recipient_id = db.Column(db.Integer)
+    recipient_contact = db.Column(db.String(100), nullable=False)
+    subject = db.Column(db.String(200))
+    message = db.Column(db.Text, nullable=False)
+    
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    sent_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Workers claim due pending rows, reclaim stale sending ones and
+    # claim a recipient's other due rows for a digest
+    __table_args__ = (
+        db.Index('ix_notification_outbox_due', 'status', 'next_attempt_at'),
+        db.Index('ix_notification_outbox_recipient', 'recipient_contact', 'channel', 'status'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'channel': self.channel,
+            'recipient_type': self.recipient_type,
+            'recipient_id': self.recipient_id,
+            'recipient_contact': self.recipient_contact,
+            'subject': self.subject,
+            'message': self.message,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class AllocationRun(db.Model):
+    """Allocation or waitlist run for a date; a running row is the date's run lock"""
+    __tablename__ = 'allocation_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    allocation_date = db.Column(db.Date, nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)  # allocation, incremental, waitlist
+    idempotency_key = db.Column(db.String(100), unique=True)
+    status = db.Column(db.String(20), default='running')  # running, completed, failed
+    
+    result = db.Column(db.Text)  # JSON response of a completed run
+    error_message = db.Column(db.Text)
+    
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime)  # renewed as a running run commits chunks
+    finished_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'allocation_date': self.allocation_date.isoformat() if self.allocation_date else None,
+            'kind': self.kind,
+            'idempotency_key': self.idempotency_key,
+            'status': self.status,
+            'error_message': self.error_message,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
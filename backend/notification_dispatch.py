@@ -0,0 +1,249 @@
+"""asyncio fan-out of notification batches
+
+``AsyncDispatcher`` sends a batch of outbox messages on all channels at once
+from one event loop instead of a thread per in-flight message. Each channel
+has its own limits:
+
+- a semaphore caps in-flight requests at the transport's ``max_concurrency``
+- a token bucket holds sends to the provider's quota
+  (``*_RATE_PER_SECOND``, 0 for none)
+
+Messages pass through a bounded queue of ``NOTIFICATION_QUEUE_SIZE``, so the
+producer waits when senders fall behind and memory stays flat however large
+the batch. ``notification_worker`` uses this dispatcher when
+``NOTIFICATION_DISPATCHER=asyncio``.
+
+A dispatcher keeps one event loop for its lifetime, so the transports' async
+sessions (and their open connections) carry over from batch to batch until
+``close``.
+
+Benchmark threads against asyncio offline, with fake transports or a
+local stub HTTP server::
+
+    python notification_dispatch.py --messages 5000 --transport stub --latency-ms 50 \
+        --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+from config import Config
+from notification_transports import CHANNELS, Transport
+
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second with bursts up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncDispatcher:
+    """Sends message batches concurrently over ``transports``"""
+
+    def __init__(self, transports: Dict[str, Transport], rates: Optional[Dict[str, float]] = None,
+                 queue_size: int = 1000):
+        self.transports = transports
+        self.rates = rates or {}
+        self.queue_size = queue_size
+        self._loop = None
+
+    @classmethod
+    def from_config(cls, transports: Dict[str, Transport], config: Config = None):
+        config = config or Config()
+        return cls(transports, {
+            'sms': config.TWILIO_RATE_PER_SECOND,
+            'email': config.SENDGRID_RATE_PER_SECOND,
+            'push': config.FCM_RATE_PER_SECOND,
+        }, config.NOTIFICATION_QUEUE_SIZE)
+
+    async def _send(self, message: Dict, slots: Dict, buckets: Dict) -> Optional[str]:
+        channel = message['channel']
+        transport = self.transports.get(channel)
+        if transport is None:
+            return f"ValueError: Unknown notification channel: {channel}"
+        try:
+            async with slots[channel]:
+                if channel in buckets:
+                    await buckets[channel].acquire()
+                await transport.asend(message['recipient_contact'], message['subject'],
+                                      message['message'], message['recipient_id'])
+            return None
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"[:1000]
+
+    async def dispatch(self, messages: Sequence[Dict]) -> List[Optional[str]]:
+        """Send every message; the error text (or None) for each, in order"""
+        errors = [None] * len(messages)
+        slots = {channel: asyncio.Semaphore(transport.max_concurrency)
+                 for channel, transport in self.transports.items()}
+        buckets = {channel: TokenBucket(rate) for channel, rate in self.rates.items() if rate}
+        queue = asyncio.Queue(maxsize=self.queue_size)
+
+        async def sender():
+            while True:
+                index = await queue.get()
+                errors[index] = await self._send(messages[index], slots, buckets)
+                queue.task_done()
+
+        # Enough senders to fill every channel's semaphore at once
+        senders = [asyncio.create_task(sender())
+                   for _ in range(sum(transport.max_concurrency
+                                      for transport in self.transports.values()))]
+        try:
+            for index in range(len(messages)):
+                await queue.put(index)
+            await queue.join()
+        finally:
+            for task in senders:
+                task.cancel()
+            await asyncio.gather(*senders, return_exceptions=True)
+        return errors
+
+    def run(self, messages: Sequence[Dict]) -> List[Optional[str]]:
+        """``dispatch`` from synchronous code (worker loop, Flask, CLI)"""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(self.dispatch(messages))
+
+    def close(self):
+        """Close the transports' async sessions and the event loop"""
+        if self._loop is None:
+            return
+        for transport in self.transports.values():
+            self._loop.run_until_complete(transport.aclose())
+        self._loop.close()
+        self._loop = None
+
+
+def _stub_server(latency: float):
+    """Local HTTP server answering every POST after ``latency`` seconds"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _bench_transports(kind: str, latency: float, config: Config, url: Optional[str],
+                      concurrency: Optional[int]):
+    from notification_transports import (FakeTransport, FCMTransport, SendGridTransport,
+                                         TwilioTransport)
+
+    limits = {'sms': config.TWILIO_MAX_CONCURRENCY, 'email': config.SENDGRID_MAX_CONCURRENCY,
+              'push': config.FCM_MAX_CONCURRENCY}
+    if concurrency:
+        limits = dict.fromkeys(limits, concurrency)
+    if kind == 'fake':
+        return {channel: FakeTransport(channel, latency, max_concurrency=limits[channel])
+                for channel in CHANNELS}
+    return {
+        'sms': TwilioTransport('AC-bench', 'token', '+10000000000', base_url=url,
+                               max_concurrency=limits['sms']),
+        'email': SendGridTransport('bench', 'bench@example.com', base_url=url,
+                                   max_concurrency=limits['email']),
+        'push': FCMTransport('bench', base_url=url, max_concurrency=limits['push']),
+    }
+
+
+def bench(count: int, kind: str = 'fake', latency: float = 0.05,
+          concurrency: Optional[int] = None, rate_limited: bool = False) -> Dict:
+    """Messages per second for a thread pool and for ``AsyncDispatcher``
+
+    Both runs get the same per-channel ``concurrency`` (the configured
+    ``*_MAX_CONCURRENCY`` by default); the thread pool has a thread for each
+    slot. Provider rate limits only apply with ``rate_limited``.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    config = Config()
+    server = _stub_server(latency) if kind == 'stub' else None
+    url = f"http://127.0.0.1:{server.server_port}" if server else None
+    messages = [{'channel': CHANNELS[i % len(CHANNELS)], 'recipient_contact': f'+2547{i:08d}',
+                 'subject': 'Benchmark', 'message': 'Benchmark message', 'recipient_id': i}
+                for i in range(count)]
+    results = {'messages': count, 'transport': kind, 'latency_ms': latency * 1000}
+
+    try:
+        transports = _bench_transports(kind, latency, config, url, concurrency)
+        workers = sum(transport.max_concurrency for transport in transports.values())
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda m: transports[m['channel']].send(
+                m['recipient_contact'], m['subject'], m['message'], m['recipient_id']), messages))
+        elapsed = time.perf_counter() - started
+        results['threads'] = {'workers': workers, 'seconds': round(elapsed, 3),
+                              'per_second': round(count / elapsed)}
+        for transport in transports.values():
+            transport.close()
+
+        transports = _bench_transports(kind, latency, config, url, concurrency)
+        dispatcher = AsyncDispatcher.from_config(transports, config)
+        if not rate_limited:
+            dispatcher.rates = {}
+        started = time.perf_counter()
+        errors = dispatcher.run(messages)
+        elapsed = time.perf_counter() - started
+        dispatcher.close()
+        results['asyncio'] = {'seconds': round(elapsed, 3), 'per_second': round(count / elapsed),
+                              'failed': sum(1 for error in errors if error)}
+    finally:
+        if server:
+            server.shutdown()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark notification fan-out offline')
+    parser.add_argument('--messages', type=int, default=3000)
+    parser.add_argument('--transport', choices=('fake', 'stub'), default='fake',
+                        help='In-process fakes or provider transports against a local stub server')
+    parser.add_argument('--latency-ms', type=float, default=50,
+                        help='Simulated provider round trip')
+    parser.add_argument('--concurrency', type=int,
+                        help='In-flight sends per channel (default: *_MAX_CONCURRENCY)')
+    parser.add_argument('--rate-limited', action='store_true',
+                        help='Apply the configured *_RATE_PER_SECOND to the asyncio run')
+    args = parser.parse_args(argv)
+
+    print(json.dumps(bench(args.messages, args.transport, args.latency_ms / 1000,
+                           args.concurrency, args.rate_limited), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""Provider transports for notification delivery
+
+A transport sends messages on one channel (``sms``, ``email`` or ``push``).
+Provider transports call the Twilio, SendGrid and FCM HTTP APIs through one
+long-lived ``requests.Session`` each. The session's connection pool keeps
+connections alive between messages, so a message does not pay for a new TLS
+handshake. Every request has a timeout, and a semaphore caps the
+concurrent requests to each provider at its ``*_MAX_CONCURRENCY``.
+
+Channels without credentials use ``SimulatedTransport``, which only prints.
+``NOTIFICATION_TRANSPORT=fake`` swaps every channel for an in-process
+``FakeTransport`` with a configurable latency, so delivery throughput can be
+measured offline.
+
+``asend`` is the coroutine counterpart of ``send`` used by
+``notification_dispatch``. HTTP transports make it a native aiohttp request
+when aiohttp is installed. Otherwise it runs ``send`` in a thread.
+"""
+import asyncio
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+CHANNELS = ('sms', 'email', 'push')
+
+
+class Transport(ABC):
+    """Sends messages on one channel, at most ``max_concurrency`` at a time"""
+
+    channel = None
+
+    def __init__(self, max_concurrency: int = 8):
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def send(self, contact: str, subject: Optional[str], message: str,
+             recipient_id: Optional[int] = None):
+        """Send one message; raises on failure"""
+        with self._slots:
+            self._send(contact, subject, message, recipient_id)
+
+    @abstractmethod
+    def _send(self, contact, subject, message, recipient_id):
+        """Send one message over the provider; raises on failure"""
+
+    async def asend(self, contact: str, subject: Optional[str], message: str,
+                    recipient_id: Optional[int] = None):
+        """Send one message from a coroutine; the caller bounds concurrency"""
+        await asyncio.to_thread(self._send, contact, subject, message, recipient_id)
+
+    def close(self):
+        """Release pooled connections"""
+
+    async def aclose(self):
+        """Release connections opened by ``asend``"""
+
+
+class HTTPTransport(Transport):
+    """Transport over a pooled keep-alive HTTP session"""
+
+    base_url = None
+
+    def __init__(self, max_concurrency: int = 8, timeout: float = 10,
+                 base_url: Optional[str] = None):
+        super().__init__(max_concurrency)
+        self.timeout = timeout
+        if base_url:
+            self.base_url = base_url.rstrip('/')
+
+        # One pooled connection per concurrent request; failed sends are
+        # retried by the outbox, not here
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.headers = {}
+        self.auth = None
+        self._async_session = None
+
+    @abstractmethod
+    def _request(self, contact, subject, message, recipient_id) -> Tuple[str, Dict]:
+        """``(path, body)`` of the POST for one message; body has ``data`` or ``json``"""
+
+    def _send(self, contact, subject, message, recipient_id):
+        path, body = self._request(contact, subject, message, recipient_id)
+        response = self.session.post(f"{self.base_url}{path}", headers=self.headers,
+                                     auth=self.auth, timeout=self.timeout, **body)
+        response.raise_for_status()
+
+    async def asend(self, contact, subject, message, recipient_id=None):
+        if not AIOHTTP_AVAILABLE:
+            return await super().asend(contact, subject, message, recipient_id)
+
+        # aiohttp sessions belong to the event loop they were opened on; the
+        # dispatcher keeps that loop until it closes us with ``aclose``
+        if self._async_session is None:
+            self._async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=self.headers,
+                auth=aiohttp.BasicAuth(*self.auth) if self.auth else None
+            )
+        path, body = self._request(contact, subject, message, recipient_id)
+        async with self._async_session.post(f"{self.base_url}{path}", **body) as response:
+            response.raise_for_status()
+            await response.read()
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+
+
+class TwilioTransport(HTTPTransport):
+    """SMS via the Twilio Messages API"""
+
+    channel = 'sms'
+    base_url = 'https://api.twilio.com'
+
+    def __init__(self, account_sid: str, auth_token: str, from_number: str, **kwargs):
+        super().__init__(**kwargs)
+        self.account_sid = account_sid
+        self.from_number = from_number
+        self.auth = (account_sid, auth_token)
+
+    def _request(self, contact, subject, message, recipient_id):
+        return (f"/2010-04-01/Accounts/{self.account_sid}/Messages.json",
+                {'data': {'To': contact, 'From': self.from_number, 'Body': message}})
+
+
+class SendGridTransport(HTTPTransport):
+    """Email via the SendGrid v3 mail API"""
+
+    channel = 'email'
+    base_url = 'https://api.sendgrid.com'
+
+    def __init__(self, api_key: str, from_email: str, **kwargs):
+        super().__init__(**kwargs)
+        self.from_email = from_email
+        self.headers['Authorization'] = f'Bearer {api_key}'
+
+    def _request(self, contact, subject, message, recipient_id):
+        return '/v3/mail/send', {'json': {
+            'personalizations': [{'to': [{'email': contact}]}],
+            'from': {'email': self.from_email},
+            'subject': subject,
+            'content': [{'type': 'text/html', 'value': f'<p>{message}</p>'}]
+        }}
+
+
+class FCMTransport(HTTPTransport):
+    """Push notifications via Firebase Cloud Messaging"""
+
+    channel = 'push'
+    base_url = 'https://fcm.googleapis.com'
+
+    def __init__(self, server_key: str, **kwargs):
+        super().__init__(**kwargs)
+        self.headers['Authorization'] = f'key={server_key}'
+
+    def _request(self, contact, subject, message, recipient_id):
+        # This would require device tokens stored in user/customer profile
+        return '/fcm/send', {'json': {
+            'notification': {'title': subject, 'body': message},
+            'to': f'/topics/user_{recipient_id}'  # Or use device token
+        }}
+
+
+class SimulatedTransport(Transport):
+    """Prints messages for a channel with no provider configured"""
+
+    LABELS = {'sms': 'SMS', 'email': 'Email', 'push': 'Push'}
+
+    def __init__(self, channel: str, **kwargs):
+        super().__init__(**kwargs)
+        self.channel = channel
+
+    def _send(self, contact, subject, message, recipient_id):
+        detail = message if self.channel == 'sms' else subject
+        print(f"{self.LABELS[self.channel]} (simulated): {contact} - {detail}")
+
+    async def asend(self, contact, subject, message, recipient_id=None):
+        self._send(contact, subject, message, recipient_id)
+
+
+class FakeTransport(Transport):
+    """In-process transport for tests and offline benchmarks
+
+    Each send sleeps for ``latency`` seconds, standing in for a provider
+    round trip, and fails with probability ``failure_rate``. ``sent``
+    counts successful sends.
+    """
+
+    def __init__(self, channel: str, latency: float = 0.0, failure_rate: float = 0.0,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.channel = channel
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def _send(self, contact, subject, message, recipient_id):
+        if self.latency:
+            time.sleep(self.latency)
+        self._outcome()
+
+    async def asend(self, contact, subject, message, recipient_id=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._outcome()
+
+    def _outcome(self):
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ConnectionError(f"Fake {self.channel} transport failure")
+        with self._lock:
+            self.sent += 1
+
+
+def build_transports(config: Config = None) -> Dict[str, Transport]:
+    """Transport for each channel, as configured"""
+    config = config or Config()
+    limits = {
+        'sms': config.TWILIO_MAX_CONCURRENCY,
+        'email': config.SENDGRID_MAX_CONCURRENCY,
+        'push': config.FCM_MAX_CONCURRENCY,
+    }
+
+    if config.NOTIFICATION_TRANSPORT == 'fake':
+        latency = config.NOTIFICATION_FAKE_LATENCY_MS / 1000
+        return {channel: FakeTransport(channel, latency, max_concurrency=limits[channel])
+                for channel in CHANNELS}
+    if config.NOTIFICATION_TRANSPORT != 'live':
+        raise ValueError(f"Unknown notification transport: {config.NOTIFICATION_TRANSPORT}")
+
+    timeout = config.NOTIFICATION_HTTP_TIMEOUT_SECONDS
+    transports = {}
+    if config.TWILIO_ACCOUNT_SID and config.TWILIO_AUTH_TOKEN:
+        transports['sms'] = TwilioTransport(
+            config.TWILIO_ACCOUNT_SID, config.TWILIO_AUTH_TOKEN, config.TWILIO_PHONE_NUMBER,
+            max_concurrency=limits['sms'], timeout=timeout
+        )
+    if config.SENDGRID_API_KEY:
+        transports['email'] = SendGridTransport(
+            config.SENDGRID_API_KEY, config.FROM_EMAIL,
+            max_concurrency=limits['email'], timeout=timeout
+        )
+    if config.FCM_SERVER_KEY:
+        transports['push'] = FCMTransport(
+            config.FCM_SERVER_KEY, max_concurrency=limits['push'], timeout=timeout
+        )
+
+    for channel in CHANNELS:
+        if channel not in transports:
+            transports[channel] = SimulatedTransport(channel, max_concurrency=limits[channel])
+    return transports
@@ -0,0 +1,231 @@
+"""Deliver queued notifications from the outbox
+
+Allocation, order and delivery changes write their messages to
+``notification_outbox`` in the same transaction as the change itself, so an
+API request never waits on SMS, email or push providers. This worker claims
+due messages in batches, sends them concurrently and records the outcome.
+Sends fan out on an event loop (``notification_dispatch``) or, with
+``NOTIFICATION_DISPATCHER=threads``, on ``NOTIFICATION_WORKERS`` threads:
+
+- sent messages are marked sent and logged in ``notifications``
+- failed messages are retried with exponential backoff, and marked failed
+  (and logged) after ``NOTIFICATION_MAX_ATTEMPTS``
+- messages claimed by a worker that died are reclaimed after
+  ``NOTIFICATION_CLAIM_TTL_SECONDS``
+
+With ``NOTIFICATION_DIGEST_ENABLED`` a claim takes all due messages of the
+recipients it picks, and each recipient gets one digest per channel (see
+``notifications.coalesce``) instead of one message per order.
+
+Claims are a guarded ``UPDATE ... RETURNING`` (selecting with ``SKIP
+LOCKED`` on PostgreSQL), so several workers can share one database. Run
+continuously or once (e.g. from cron)::
+
+    python notification_worker.py
+    python notification_worker.py --once
+"""
+import argparse
+import json
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import select, tuple_, update
+from models import db, NotificationOutbox
+from notifications import NotificationLog, NotificationService, coalesce, digest_message
+
+
+def _claim(batch_size: int, claim_ttl: int, due_by: datetime,
+           with_siblings: bool = False) -> List[Dict]:
+    """Mark up to ``batch_size`` messages due by ``due_by`` as sending and return them
+
+    ``with_siblings`` also claims every other due message to the same
+    recipients on the same channels, so they can be sent as one digest.
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=claim_ttl)
+    due = select(NotificationOutbox.id, NotificationOutbox.channel,
+                 NotificationOutbox.recipient_contact).where(
+        db.or_(
+            db.and_(NotificationOutbox.status == 'pending',
+                    NotificationOutbox.next_attempt_at <= due_by),
+            db.and_(NotificationOutbox.status == 'sending',
+                    NotificationOutbox.claimed_at < stale)
+        )
+    ).order_by(NotificationOutbox.next_attempt_at, NotificationOutbox.id).limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        due = due.with_for_update(skip_locked=True)
+
+    rows = db.session.execute(due).all()
+    if not rows:
+        db.session.rollback()
+        return []
+
+    # The status guard keeps a row claimed by a concurrent worker out of this batch
+    outbox = NotificationOutbox.__table__
+    selected = db.and_(
+        outbox.c.id.in_([row.id for row in rows]),
+        db.or_(outbox.c.status == 'pending', outbox.c.claimed_at < stale)
+    )
+    if with_siblings:
+        selected = db.or_(selected, db.and_(
+            tuple_(outbox.c.recipient_contact, outbox.c.channel).in_(
+                {(row.recipient_contact, row.channel) for row in rows}
+            ),
+            outbox.c.status == 'pending',
+            outbox.c.next_attempt_at <= due_by
+        ))
+    claimed = db.session.execute(
+        update(outbox).where(selected).values(status='sending', claimed_at=now, updated_at=now).returning(*outbox.c)
+    ).mappings().all()
+    db.session.commit()
+    # Plain dicts: sender threads never touch the session
+    return sorted((dict(row) for row in claimed), key=lambda message: message['id'])
+
+
+def _send(service: NotificationService, message: Dict) -> Optional[str]:
+    """Deliver one message; the error text on failure"""
+    try:
+        service.deliver(message['channel'], message['recipient_contact'], message['subject'],
+                        message['message'], message['recipient_id'])
+        return None
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"[:1000]
+
+
+def _record(groups: List[List[Dict]], deliveries: List[Dict], errors: List[Optional[str]],
+            config, now: datetime) -> Dict:
+    """Write delivery outcomes to the outbox and the notification log
+
+    A sent delivery (one message or a digest of its group) is logged once.
+    A failed one is logged only for the messages out of attempts, as a
+    digest of just those; messages that will be retried are not logged yet.
+    Messages with the same outcome share one set-based UPDATE, and the log
+    rows go in with one bulk insert, all in a single transaction.
+    """
+    outcomes = defaultdict(list)
+    log = NotificationLog()
+    counts = {'sent': 0, 'retrying': 0, 'failed': 0}
+    for group, delivery, error in zip(groups, deliveries, errors):
+        exhausted = []
+        for message in group:
+            attempts = message['attempts'] + 1
+            if error is None:
+                key = ('sent', None, None)
+            elif attempts >= config['NOTIFICATION_MAX_ATTEMPTS']:
+                key = ('failed', None, error)
+                exhausted.append(message)
+            else:
+                # The retry delay depends on the attempt count
+                key = ('pending', attempts, error)
+            outcomes[key].append(message['id'])
+            counts['retrying' if key[0] == 'pending' else key[0]] += 1
+
+        if error is None:
+            log.add(delivery, 'sent', None, now)
+        elif exhausted:
+            log.add(delivery if len(exhausted) == len(group) else digest_message(exhausted),
+                    'failed', error, now)
+
+    outbox = NotificationOutbox.__table__
+    with db.engine.begin() as conn:
+        for (status, attempts, error), ids in outcomes.items():
+            values = {'status': status, 'attempts': outbox.c.attempts + 1,
+                      'last_error': error, 'updated_at': now}
+            if status == 'sent':
+                values['sent_at'] = now
+            elif status == 'pending':
+                delay = config['NOTIFICATION_RETRY_BASE_SECONDS'] * 2 ** (attempts - 1)
+                values['next_attempt_at'] = now + timedelta(seconds=delay)
+            conn.execute(update(outbox).where(outbox.c.id.in_(ids)).values(**values))
+        log.flush(conn)
+    return counts
+
+
+def run_once(app, batch_size: Optional[int] = None, workers: Optional[int] = None,
+             service: Optional[NotificationService] = None) -> Dict:
+    """Deliver every message due now; returns counts by outcome and elapsed time
+
+    Pass a long-lived ``service`` to reuse its pooled transports, and its
+    dispatcher's event loop and async sessions, across runs.
+    """
+    config = app.config
+    batch_size = batch_size or config['NOTIFICATION_BATCH_SIZE']
+    workers = workers or config['NOTIFICATION_WORKERS']
+    owns_service = service is None
+    service = service or NotificationService()
+    digest = config['NOTIFICATION_DIGEST_ENABLED']
+    totals = {'claimed': 0, 'deliveries': 0, 'sent': 0, 'retrying': 0, 'failed': 0}
+    clock = time.perf_counter()
+
+    if config['NOTIFICATION_DISPATCHER'] == 'asyncio':
+        pool = None
+        send_batch = service.dispatcher.run
+    elif config['NOTIFICATION_DISPATCHER'] == 'threads':
+        pool = ThreadPoolExecutor(max_workers=workers)
+        send_batch = lambda messages: list(pool.map(lambda message: _send(service, message),
+                                                    messages))
+    else:
+        raise ValueError(f"Unknown notification dispatcher: {config['NOTIFICATION_DISPATCHER']}")
+
+    with app.app_context():
+        # Retries scheduled during this run wait for the next one
+        started = datetime.utcnow()
+        while True:
+            messages = _claim(batch_size, config['NOTIFICATION_CLAIM_TTL_SECONDS'], started,
+                              with_siblings=digest)
+            if not messages:
+                break
+
+            groups = coalesce(messages) if digest else [[message] for message in messages]
+            deliveries = [digest_message(group) for group in groups]
+            errors = send_batch(deliveries)
+            counts = _record(groups, deliveries, errors, config, datetime.utcnow())
+
+            totals['claimed'] += len(messages)
+            totals['deliveries'] += len(deliveries)
+            for key, value in counts.items():
+                totals[key] += value
+
+    if pool:
+        pool.shutdown()
+    if owns_service:
+        service.close()
+    totals['seconds'] = round(time.perf_counter() - clock, 3)
+    return totals
+
+
+def run(app, batch_size: Optional[int] = None, workers: Optional[int] = None):
+    """Deliver due messages, polling every ``NOTIFICATION_POLL_SECONDS``"""
+    poll = app.config['NOTIFICATION_POLL_SECONDS']
+    service = NotificationService()
+    try:
+        while True:
+            totals = run_once(app, batch_size, workers, service)
+            if totals['claimed']:
+                print(f"📨 Notifications: {totals['sent']} sent, {totals['retrying']} retrying, "
+                      f"{totals['failed']} failed")
+            time.sleep(poll)
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Deliver queued ChickFlow notifications')
+    parser.add_argument('--once', action='store_true', help='Deliver what is due and exit')
+    parser.add_argument('--batch-size', type=int, help='Messages claimed per batch')
+    parser.add_argument('--workers', type=int, help='Concurrent sends (threads dispatcher)')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    app = create_app()
+    if args.once:
+        print(json.dumps(run_once(app, args.batch_size, args.workers), indent=2))
+    else:
+        run(app, args.batch_size, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,216 +1,254 @@
-from datetime import datetime
-from models import db, Notification
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, Notification, NotificationOutbox
 from config import Config
-import requests
-from typing import Optional
+from clock import utc_to_local
+from notification_dispatch import AsyncDispatcher
+from notification_transports import build_transports
+from sqlalchemy import insert
+from typing import Dict, Iterable, List, Optional
+
+# Customer fields the message builders need; Customer rows fit too
+Recipient = namedtuple('Recipient', 'id farm_name phone email')
+
+SIGNATURE = '- ChickFlow'
+
+
+def _message(channel: str, customer, contact: str, message: str,
+             subject: Optional[str] = None) -> Dict:
+    """Outbox row for one message on one channel"""
+    return {
+        'channel': channel,
+        'recipient_type': 'customer',
+        'recipient_id': customer.id,
+        'recipient_contact': contact,
+        'subject': subject,
+        'message': message
+    }
+
+
+def order_confirmation_messages(customer, order) -> List[Dict]:
+    """Order confirmation by SMS and, if the customer has one, email"""
+    message = (
+        f"Hi {customer.farm_name}, your order {order.order_number} for {order.order_qty} "
+        f"chicks has been received. Requested delivery: {order.requested_delivery_date}. "
+        f"We'll notify you once allocated. {SIGNATURE}"
+    )
+
+    messages = [_message('sms', customer, customer.phone, message)]
+    if customer.email:
+        messages.append(_message('email', customer, customer.email, message,
+                                 f"Order Confirmation - {order.order_number}"))
+    return messages
+
+
+def allocation_messages(customer, allocation_data: Dict) -> List[Dict]:
+    """Allocation confirmation by SMS, email and push
+
+    ``allocation_data['pickup_deadline']`` is the stored (UTC) deadline; the
+    message gives it in ``BUSINESS_TIMEZONE``.
+    """
+    deadline = utc_to_local(allocation_data['pickup_deadline'], Config.BUSINESS_TIMEZONE)
+    message = (
+        f"Great news {customer.farm_name}! {allocation_data['allocated_qty']} chicks "
+        f"allocated for pickup. Deadline: {deadline:%H:%M, %d %b}. "
+        f"Order: {allocation_data['order_number']}. {SIGNATURE}"
+    )
+
+    messages = [_message('sms', customer, customer.phone, message)]
+    if customer.email:
+        messages.append(_message('email', customer, customer.email, message,
+                                 "Chicks Allocated - Ready for Pickup"))
+    messages.append(_message('push', customer, f"user_{customer.id}", message,
+                             "Chicks Allocated!"))
+    return messages
+
+
+def waitlist_messages(customer, waitlist_data: Dict) -> List[Dict]:
+    """Waitlist notice by SMS and email"""
+    message = (
+        f"Hi {customer.farm_name}, today's allocation is full. You're prioritized for "
+        f"the next batch. Order: {waitlist_data.get('order_number', 'N/A')}. "
+        f"Thank you for your patience! {SIGNATURE}"
+    )
+
+    messages = [_message('sms', customer, customer.phone, message)]
+    if customer.email:
+        messages.append(_message('email', customer, customer.email, message,
+                                 "Order Waitlisted - Priority for Next Batch"))
+    return messages
+
+
+def waitlist_expired_messages(customer, order) -> List[Dict]:
+    """Notice by SMS and email that a waitlisted order was cancelled"""
+    message = (
+        f"Hi {customer.farm_name}, your waitlisted order {order.order_number} for "
+        f"{order.order_qty} chicks could not be filled within "
+        f"{Config.WAITING_PERIOD_DAYS} days and has been cancelled. "
+        f"Please place a new order if you still need chicks. {SIGNATURE}"
+    )
+
+    messages = [_message('sms', customer, customer.phone, message)]
+    if customer.email:
+        messages.append(_message('email', customer, customer.email, message,
+                                 f"Order Cancelled - {order.order_number}"))
+    return messages
+
+
+def delivery_messages(customer, delivery) -> List[Dict]:
+    """Delivery update by SMS and push"""
+    message = (
+        f"Hi {customer.farm_name}, your chicks are on the way! "
+        f"Driver: {delivery.driver_name}, Vehicle: {delivery.vehicle_number}. "
+        f"ETA: {delivery.estimated_arrival.strftime('%I:%M %p') if delivery.estimated_arrival else 'TBD'}. "
+        f"{SIGNATURE}"
+    )
+
+    return [
+        _message('sms', customer, customer.phone, message),
+        _message('push', customer, f"user_{customer.id}", message, "Delivery in Progress")
+    ]
+
+
+def enqueue(messages: Iterable[Dict]):
+    """Stage outbox rows in the current transaction; the caller commits
+
+    With ``NOTIFICATION_DIGEST_WINDOW_SECONDS`` the rows wait that long before
+    delivery, so later messages to the same recipient join their digest.
+    """
+    messages = list(messages)
+    if not messages:
+        return
+    window = current_app.config['NOTIFICATION_DIGEST_WINDOW_SECONDS']
+    if window:
+        due = datetime.utcnow() + timedelta(seconds=window)
+        messages = [dict(message, next_attempt_at=due) for message in messages]
+    db.session.execute(insert(NotificationOutbox), messages)
+
+
+def coalesce(messages: List[Dict]) -> List[List[Dict]]:
+    """Group messages to the same recipient on the same channel, in order"""
+    groups = {}
+    for message in messages:
+        key = (message['channel'], message['recipient_type'], message['recipient_id'],
+               message['recipient_contact'])
+        groups.setdefault(key, []).append(message)
+    return list(groups.values())
+
+
+def digest_message(group: List[Dict]) -> Dict:
+    """One message carrying every message of a group"""
+    if len(group) == 1:
+        return group[0]
+
+    lines = [message['message'].removesuffix(SIGNATURE).strip() for message in group]
+    body = '\n'.join(f"{number}. {line}" for number, line in enumerate(lines, 1))
+    return dict(group[0], subject=f"Your ChickFlow updates ({len(group)})",
+                message=f"{body}\n{SIGNATURE}")
+
+
+class NotificationLog:
+    """Delivery outcomes buffered and written to ``notifications`` in bulk
+
+    ``flush`` inserts every buffered row with one executemany, on the given
+    connection or in its own transaction, so logging never flushes or
+    commits the caller's session.
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, message: Dict, status: str, error: Optional[str] = None,
+            at: Optional[datetime] = None):
+        """Buffer the outcome of one outbox message"""
+        at = at or datetime.utcnow()
+        self.rows.append({
+            'recipient_type': message['recipient_type'],
+            'recipient_id': message['recipient_id'],
+            'recipient_contact': message['recipient_contact'],
+            'notification_type': message['channel'],
+            'subject': message['subject'],
+            'message': message['message'],
+            'status': status,
+            'sent_at': at if status == 'sent' else None,
+            'error_message': error,
+            'created_at': at
+        })
+
+    def flush(self, connection=None) -> int:
+        """Write the buffered rows; returns how many were written"""
+        rows, self.rows = self.rows, []
+        if not rows:
+            return 0
+        if connection is None:
+            with db.engine.begin() as connection:
+                connection.execute(insert(Notification.__table__), rows)
+        else:
+            connection.execute(insert(Notification.__table__), rows)
+        return len(rows)
+
 
 class NotificationService:
-    """Service for sending notifications via SMS, Email, and Push"""
-    
-    def __init__(self, config: Config = None):
+    """Service for sending notifications via SMS, Email, and Push
+
+    ``send_*`` methods only write to the notification outbox, in the caller's
+    transaction; ``notification_worker`` delivers outbox rows with
+    ``deliver`` over the pooled transports of ``notification_transports``.
+    """
+
+    def __init__(self, config: Config = None, transports: Optional[Dict] = None):
         self.config = config or Config()
-    
+        self._transports = transports
+        self._dispatcher = None
+
+    @property
+    def transports(self) -> Dict:
+        """Channel -> transport, built on first use and reused for every message"""
+        if self._transports is None:
+            self._transports = build_transports(self.config)
+        return self._transports
+
+    @property
+    def dispatcher(self) -> AsyncDispatcher:
+        """``AsyncDispatcher`` over ``transports``, kept (with its event loop) until ``close``"""
+        if self._dispatcher is None:
+            self._dispatcher = AsyncDispatcher.from_config(self.transports, self.config)
+        return self._dispatcher
+
     def send_order_confirmation(self, customer, order):
-        """Send order confirmation notification"""
-        message = (
-            f"Hi {customer.farm_name}, your order {order.order_number} for {order.order_qty} "
-            f"chicks has been received. Requested delivery: {order.requested_delivery_date}. "
-            f"We'll notify you once allocated. - ChickFlow"
-        )
-        
-        self._send_sms(customer.phone, message, 'customer', customer.id)
-        
-        if customer.email:
-            subject = f"Order Confirmation - {order.order_number}"
-            self._send_email(customer.email, subject, message, 'customer', customer.id)
-    
+        """Queue order confirmation notification"""
+        enqueue(order_confirmation_messages(customer, order))
+
     def send_allocation_notification(self, customer, allocation_data):
-        """Send allocation confirmation"""
-        message = (
-            f"Great news {customer.farm_name}! {allocation_data['allocated_qty']} chicks "
-            f"allocated for pickup today. Deadline: 2PM. Order: {allocation_data['order_number']}. "
-            f"- ChickFlow"
-        )
-        
-        self._send_sms(customer.phone, message, 'customer', customer.id)
-        
-        if customer.email:
-            subject = "Chicks Allocated - Ready for Pickup"
-            self._send_email(customer.email, subject, message, 'customer', customer.id)
-        
-        # Send push notification if available
-        self._send_push_notification(
-            customer.id, 
-            "Chicks Allocated!", 
-            message,
-            'customer'
-        )
-    
+        """Queue allocation confirmation"""
+        enqueue(allocation_messages(customer, allocation_data))
+
     def send_waitlist_notification(self, customer, waitlist_data):
-        """Send waitlist notification"""
-        message = (
-            f"Hi {customer.farm_name}, today's allocation is full. You're prioritized for "
-            f"the next batch. Order: {waitlist_data.get('order_number', 'N/A')}. "
-            f"Thank you for your patience! - ChickFlow"
-        )
-        
-        self._send_sms(customer.phone, message, 'customer', customer.id)
-        
-        if customer.email:
-            subject = "Order Waitlisted - Priority for Next Batch"
-            self._send_email(customer.email, subject, message, 'customer', customer.id)
-    
+        """Queue waitlist notification"""
+        enqueue(waitlist_messages(customer, waitlist_data))
+
     def send_delivery_notification(self, customer, delivery):
-        """Send delivery update notification"""
-        message = (
-            f"Hi {customer.farm_name}, your chicks are on the way! "
-            f"Driver: {delivery.driver_name}, Vehicle: {delivery.vehicle_number}. "
-            f"ETA: {delivery.estimated_arrival.strftime('%I:%M %p') if delivery.estimated_arrival else 'TBD'}. "
-            f"- ChickFlow"
-        )
-        
-        self._send_sms(customer.phone, message, 'customer', customer.id)
-        self._send_push_notification(customer.id, "Delivery in Progress", message, 'customer')
-    
-    def _send_sms(self, phone: str, message: str, recipient_type: str, recipient_id: int) -> bool:
-        """Send SMS via Twilio"""
-        notification = Notification(
-            recipient_type=recipient_type,
-            recipient_id=recipient_id,
-            recipient_contact=phone,
-            notification_type='sms',
-            message=message,
-            status='pending'
-        )
-        
-        try:
-            if not self.config.TWILIO_ACCOUNT_SID or not self.config.TWILIO_AUTH_TOKEN:
-                print(f"SMS (simulated): {phone} - {message}")
-                notification.status = 'sent'
-                notification.sent_at = datetime.utcnow()
-            else:
-                from twilio.rest import Client
-                client = Client(self.config.TWILIO_ACCOUNT_SID, self.config.TWILIO_AUTH_TOKEN)
-                
-                msg = client.messages.create(
-                    body=message,
-                    from_=self.config.TWILIO_PHONE_NUMBER,
-                    to=phone
-                )
-                
-                notification.status = 'sent'
-                notification.sent_at = datetime.utcnow()
-            
-            db.session.add(notification)
-            db.session.commit()
-            return True
-            
-        except Exception as e:
-            notification.status = 'failed'
-            notification.error_message = str(e)
-            db.session.add(notification)
-            db.session.commit()
-            print(f"SMS Error: {e}")
-            return False
-    
-    def _send_email(self, email: str, subject: str, message: str, 
-                   recipient_type: str, recipient_id: int) -> bool:
-        """Send email via SendGrid"""
-        notification = Notification(
-            recipient_type=recipient_type,
-            recipient_id=recipient_id,
-            recipient_contact=email,
-            notification_type='email',
-            subject=subject,
-            message=message,
-            status='pending'
-        )
-        
-        try:
-            if not self.config.SENDGRID_API_KEY:
-                print(f"Email (simulated): {email} - {subject}")
-                notification.status = 'sent'
-                notification.sent_at = datetime.utcnow()
-            else:
-                from sendgrid import SendGridAPIClient
-                from sendgrid.helpers.mail import Mail
-                
-                mail = Mail(
-                    from_email=self.config.FROM_EMAIL,
-                    to_emails=email,
-                    subject=subject,
-                    html_content=f"<p>{message}</p>"
-                )
-                
-                sg = SendGridAPIClient(self.config.SENDGRID_API_KEY)
-                response = sg.send(mail)
-                
-                notification.status = 'sent'
-                notification.sent_at = datetime.utcnow()
-            
-            db.session.add(notification)
-            db.session.commit()
-            return True
-            
-        except Exception as e:
-            notification.status = 'failed'
-            notification.error_message = str(e)
-            db.session.add(notification)
-            db.session.commit()
-            print(f"Email Error: {e}")
-            return False
-    
-    def _send_push_notification(self, user_id: int, title: str, message: str, 
-                               recipient_type: str) -> bool:
-        """Send push notification via Firebase Cloud Messaging"""
-        notification = Notification(
-            recipient_type=recipient_type,
-            recipient_id=user_id,
-            recipient_contact=f"user_{user_id}",
-            notification_type='push',
-            subject=title,
-            message=message,
-            status='pending'
-        )
-        
-        try:
-            if not self.config.FCM_SERVER_KEY:
-                print(f"Push (simulated): {title} - {message}")
-                notification.status = 'sent'
-                notification.sent_at = datetime.utcnow()
-            else:
-                # FCM implementation
-                # This would require device tokens stored in user/customer profile
-                headers = {
-                    'Authorization': f'key={self.config.FCM_SERVER_KEY}',
-                    'Content-Type': 'application/json'
-                }
-                
-                payload = {
-                    'notification': {
-                        'title': title,
-                        'body': message
-                    },
-                    'to': f'/topics/user_{user_id}'  # Or use device token
-                }
-                
-                response = requests.post(
-                    'https://fcm.googleapis.com/fcm/send',
-                    headers=headers,
-                    json=payload
-                )
-                
-                notification.status = 'sent'
-                notification.sent_at = datetime.utcnow()
-            
-            db.session.add(notification)
-            db.session.commit()
-            return True
-            
-        except Exception as e:
-            notification.status = 'failed'
-            notification.error_message = str(e)
-            db.session.add(notification)
-            db.session.commit()
-            print(f"Push Notification Error: {e}")
-            return False
+        """Queue delivery update notification"""
+        enqueue(delivery_messages(customer, delivery))
+
+    def deliver(self, channel: str, contact: str, subject: Optional[str], message: str,
+                recipient_id: Optional[int] = None):
+        """Send one message; raises on failure. Touches no database state."""
+        transport = self.transports.get(channel)
+        if transport is None:
+            raise ValueError(f"Unknown notification channel: {channel}")
+        transport.send(contact, subject, message, recipient_id)
+
+    def close(self):
+        """Close the dispatcher and the transports' pooled connections"""
+        if self._dispatcher is not None:
+            self._dispatcher.close()
+            self._dispatcher = None
+        if self._transports is not None:
+            for transport in self._transports.values():
+                transport.close()
+            self._transports = None
@@ -0,0 +1,126 @@
+"""Keyset pagination for list endpoints
+
+A page is read with ``WHERE <sort key> after <cursor> ORDER BY <sort key>
+LIMIT n``, so each request costs the same however deep it is. The sort key
+is a list of ``(column, descending)`` pairs ending in a unique column. The
+cursor handed to clients is the last row's sort key values, JSON-encoded in
+URL-safe base64; it is opaque to clients and only valid for the endpoint
+that issued it.
+
+Paging is opt-in: a request without ``limit`` or ``cursor`` gets every row,
+as before pagination existed. Responses keep their body shape; the cursor
+of the next page, if there is one, is sent in the ``X-Next-Cursor`` header.
+Streaming requests (see ``streaming``) get every row after the cursor in
+one response.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from typing import List, Optional, Sequence, Tuple
+from flask import current_app, jsonify, request
+from sqlalchemy import and_, or_
+from streaming import stream_format, streamed_response
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that was not issued for this listing"""
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Opaque token for a row's sort key values"""
+    payload = [value.isoformat() if isinstance(value, (date, datetime)) else value
+               for value in values]
+    data = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(token: str, keys: Sequence[Tuple]) -> List:
+    """Sort key values from a token, converted to the key columns' types"""
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(data)
+    except (binascii.Error, ValueError):
+        raise InvalidCursor("Invalid cursor")
+    if not isinstance(payload, list) or len(payload) != len(keys):
+        raise InvalidCursor("Invalid cursor")
+
+    values = []
+    for (column, _), value in zip(keys, payload):
+        python_type = column.type.python_type
+        try:
+            if value is not None and python_type in (date, datetime):
+                value = python_type.fromisoformat(value)
+            elif value is not None and not isinstance(value, python_type):
+                value = python_type(value)
+        except (TypeError, ValueError):
+            raise InvalidCursor("Invalid cursor")
+        values.append(value)
+    return values
+
+
+def keyset_filter(keys: Sequence[Tuple], values: Sequence):
+    """Rows strictly after ``values`` in the order given by ``keys``"""
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        after = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*[keys[j][0] == values[j] for j in range(i)], after))
+    return or_(*clauses)
+
+
+def ordered_after(query, keys: Sequence[Tuple], cursor: Optional[str] = None):
+    """The query in sort key order, starting after ``cursor`` if given"""
+    if cursor:
+        query = query.filter(keyset_filter(keys, decode_cursor(cursor, keys)))
+    return query.order_by(*[column.desc() if descending else column.asc()
+                            for column, descending in keys])
+
+
+def page_query(query, keys: Sequence[Tuple], cursor: Optional[str] = None, limit: int = 100):
+    """The query for one page, with one extra row to tell if another follows"""
+    return ordered_after(query, keys, cursor).limit(limit + 1)
+
+
+def paginate(query, keys: Sequence[Tuple], cursor: Optional[str] = None,
+             limit: int = 100) -> Tuple[List, Optional[str]]:
+    """``(rows, next_cursor)`` for one page of an ORM query"""
+    rows = page_query(query, keys, cursor, limit).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, column.key) for column, _ in keys])
+
+
+def page_limit() -> int:
+    """``limit`` query argument, defaulted and capped by the app config"""
+    limit = request.args.get('limit', type=int) or current_app.config['API_PAGE_SIZE']
+    return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+def paginated_response(query, keys: Sequence[Tuple], projection=None):
+    """Response for the page named by the request's ``cursor`` and ``limit``
+
+    ``projection`` (a ``serialization.Projection``) shapes the body; by
+    default it is each row's ``to_dict()`` in a JSON array. A streaming
+    request gets every row after ``cursor`` instead of one page, and a
+    request with neither ``limit`` nor ``cursor`` gets every row.
+    """
+    fmt = stream_format()
+    if fmt:
+        serialize_row = projection.stream_row() if projection else (lambda row: row.to_dict())
+        return streamed_response(ordered_after(query, keys, request.args.get('cursor')),
+                                 serialize_row, fmt)
+
+    if 'limit' in request.args or 'cursor' in request.args:
+        rows, next_cursor = paginate(query, keys, request.args.get('cursor'), page_limit())
+    else:
+        rows, next_cursor = ordered_after(query, keys).all(), None
+    body = projection(rows) if projection else [row.to_dict() for row in rows]
+    response = jsonify(body)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response, 200
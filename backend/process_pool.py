@@ -0,0 +1,38 @@
+"""Shared worker processes for CPU-bound allocation passes
+
+Parallelism is opt-in: callers run in-process unless configured with more
+than one worker. The pool is created once per process, on first use, with
+the "spawn" start method, since forking a web or scheduler process copies
+its threads and open database connections. Worker processes start as work
+arrives and are reused by later requests; there are never more than
+``MAX_WORKERS``.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def worker_count(requested: int) -> int:
+    """Workers to use for ``requested``: at least 1, at most ``MAX_WORKERS``"""
+    return max(1, min(requested or 1, MAX_WORKERS))
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """The process-wide pool, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(MAX_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def run_batches(fn, batches):
+    """``[fn(*batch) for batch in batches]``, one pool task per batch"""
+    pool = get_pool()
+    return [future.result() for future in [pool.submit(fn, *batch) for batch in batches]]
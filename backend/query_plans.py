@@ -0,0 +1,216 @@
+"""Query-plan regression check for the hot query paths
+
+Each entry in ``hot_queries`` is built by the same function that
+``routes.py``, ``reports_routes.py``, ``allocation_engine.py`` or
+``conditional.py`` uses, keyset pages after a cursor included. The check
+runs EXPLAIN on every one against the configured database and reports any
+that read a whole table or index instead of searching one:
+
+- SQLite: any ``SCAN <table>`` step, covering-index scans included
+- PostgreSQL: a ``Seq Scan``, or an index scan with no ``Index Cond``, with
+  sequential scans disabled for the check so small development tables do
+  not hide a missing index
+
+A query that has to scan is listed in ``ALLOWED_SCANS`` with the reason.
+
+Command line (exits 1 if any hot query falls back to a full scan)::
+
+    python query_plans.py
+    python query_plans.py --verbose
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List, Sequence, Tuple
+from sqlalchemy import text
+from werkzeug.datastructures import MultiDict
+from models import db, Customer, Order, Inventory, Allocation, Waitlist
+import allocation_engine
+import reports_routes
+import routes
+from conditional import table_versions_statement
+from pagination import encode_cursor, page_query
+from serialization import Projection
+
+
+# Hot queries that scan by design -> why that is acceptable
+_FIRST_PAGE = 'an unfiltered first page walks its sort index and stops after the page'
+ALLOWED_SCANS = {
+    'routes.orders_page': _FIRST_PAGE,
+    'routes.orders_expand_customer_page': _FIRST_PAGE,
+    'routes.inventory_page': _FIRST_PAGE,
+    'routes.allocations_page': _FIRST_PAGE,
+    'routes.deliveries_page': _FIRST_PAGE,
+    'routes.notifications_page': _FIRST_PAGE,
+}
+
+
+def _pages(name: str, query, keys: Sequence[Tuple], after: Sequence) -> Dict[str, object]:
+    """A listing's first page and the page after a row with sort key ``after``"""
+    return {
+        f'{name}_page': page_query(query, keys),
+        f'{name}_next_page': page_query(query, keys, encode_cursor(after)),
+    }
+
+
+def hot_queries(as_of: datetime = None) -> Dict[str, object]:
+    """Name -> statement for each hot query, with representative parameters
+
+    Statements come from the functions the routes and the engine build their
+    queries with, so the check follows the code rather than a copy of it.
+    """
+    now = as_of or datetime.utcnow()
+    day = now.date()
+    week_ago = day - timedelta(days=7)
+    month_start = day.replace(day=1)
+    args = MultiDict()
+
+    # Resume the waitlist from a real entry when there is one
+    first = allocation_engine.waitlist_page_query(1).first()
+    waitlist_key = (first.score, first.id) if first else (0.0, 0)
+
+    queries = {
+        # allocation_engine.py
+        'engine.pending_orders': allocation_engine.pending_orders_query(day),
+        'engine.pending_order_rows': allocation_engine.pending_order_rows_query(day),
+        'engine.waiting_counts_for_date': allocation_engine.waiting_counts_query(day),
+        'engine.busy_run': allocation_engine.busy_run_query(day),
+        'engine.smallest_waiting_qty': allocation_engine.smallest_waiting_qty_query(),
+        'engine.waitlist_first_page': allocation_engine.waitlist_page_query(500),
+        'engine.waitlist_next_page': allocation_engine.waitlist_page_query(500, waitlist_key),
+        'engine.late_order_dates': allocation_engine.late_order_dates_query(day),
+        'engine.overdue_dates': allocation_engine.overdue_dates_query(now),
+        'engine.overdue_allocations': allocation_engine.overdue_allocations_query(day, now),
+
+        # routes.py
+        'routes.customer_recent_orders': routes.customer_recent_orders_query(1),
+        'routes.order_allocation': routes.order_allocation_query(1),
+        'routes.order_delivery': routes.order_delivery_query(1),
+        **{f'routes.dashboard_{name}': query
+           for name, query in routes.dashboard_queries(day).items()},
+    }
+
+    # routes.py list endpoints, default filters and common ones
+    listings = [
+        ('customers', routes.customers_query(args), routes.CUSTOMER_KEYS, [1]),
+        ('orders', routes.orders_query(args), routes.ORDER_KEYS, [now, 1]),
+        ('orders_expand_customer',
+         Projection(Order, expand=['customer']).apply(routes.orders_query(args)),
+         routes.ORDER_KEYS, [now, 1]),
+        ('orders_by_status', routes.orders_query(MultiDict({'status': 'pending'})),
+         routes.ORDER_KEYS, [now, 1]),
+        ('orders_by_delivery_date',
+         routes.orders_query(MultiDict({'date_from': week_ago.isoformat(),
+                                        'date_to': day.isoformat()})),
+         routes.ORDER_KEYS, [now, 1]),
+        ('inventory', routes.inventory_query(args), routes.INVENTORY_KEYS, [day, 1]),
+        ('allocations', routes.allocations_query(args), routes.ALLOCATION_KEYS, [day, 1]),
+        ('allocations_by_customer', routes.allocations_query(MultiDict({'customer_id': '1'})),
+         routes.ALLOCATION_KEYS, [day, 1]),
+        ('waitlist', routes.waitlist_query(args), routes.WAITLIST_KEYS, list(waitlist_key)),
+        ('deliveries', routes.deliveries_query(args), routes.DELIVERY_KEYS, [1]),
+        ('notifications', routes.notifications_query(args), routes.NOTIFICATION_KEYS, [1]),
+    ]
+    for name, query, keys, after in listings:
+        queries.update(_pages(f'routes.{name}', query, keys, after))
+
+    queries.update({
+        # reports_routes.py
+        'reports.daily_waitlist': reports_routes.daily_waitlist_query(day),
+        'reports.tier_breakdown': reports_routes.tier_breakdown_query(
+            month_start, month_start + timedelta(days=31)),
+        'reports.daily_allocations': reports_routes.daily_allocations_query(
+            month_start, month_start + timedelta(days=31)),
+        'reports.top_customers': reports_routes.top_customers_query(week_ago),
+        'reports.fulfillment_by_tier': reports_routes.fulfillment_by_tier_query(week_ago),
+        'reports.waitlist_since': reports_routes.waitlist_since_query(week_ago),
+        'reports.export_allocations': reports_routes.export_allocations_query(week_ago, day),
+    })
+    statements = {name: query.statement for name, query in queries.items()}
+
+    # conditional.py: every conditional GET runs this before its view
+    statements['conditional.table_versions'] = table_versions_statement(
+        [Inventory, Allocation, Order, Customer, Waitlist])
+    return statements
+
+
+def explain(statement) -> List[str]:
+    """Plan lines for a statement on the current database"""
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+    with db.engine.connect() as conn:
+        if dialect.name == 'sqlite':
+            return [row[-1] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+        if dialect.name == 'postgresql':
+            with conn.begin():
+                conn.execute(text('SET LOCAL enable_seqscan = off'))
+                return [row[0] for row in conn.execute(text(f'EXPLAIN {sql}'))]
+    raise ValueError(f"Query plans are not supported for {dialect.name}")
+
+
+def full_scans(plan: List[str]) -> List[str]:
+    """Plan lines that read a whole table or index rather than searching it"""
+    tables = set(db.metadata.tables)
+    scans = []
+    for position, line in enumerate(plan):
+        words = line.strip().split()
+        if words[:1] == ['SCAN'] and len(words) > 1 and words[1] in tables:
+            scans.append(line.strip())
+        elif 'Seq Scan on' in line:
+            scans.append(line.strip())
+        elif 'Index Scan' in line or 'Index Only Scan' in line:
+            # The node's details follow until the next plan node
+            details = []
+            for detail in plan[position + 1:]:
+                if '->' in detail:
+                    break
+                details.append(detail)
+            if not any('Index Cond' in detail for detail in details):
+                scans.append(line.strip())
+    return scans
+
+
+def check_plans(as_of: datetime = None) -> Dict[str, Dict]:
+    """EXPLAIN every hot query; name -> ``{'plan', 'full_scans', 'allowed'}``
+
+    ``allowed`` is the ``ALLOWED_SCANS`` reason, if any, for a query's scans.
+    """
+    results = {}
+    for name, statement in hot_queries(as_of).items():
+        plan = explain(statement)
+        results[name] = {'plan': plan, 'full_scans': full_scans(plan),
+                         'allowed': ALLOWED_SCANS.get(name)}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fail if a hot query falls back to a full scan')
+    parser.add_argument('--verbose', action='store_true', help='Print every plan')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    with create_app().app_context():
+        results = check_plans()
+
+    failures = 0
+    for name, result in results.items():
+        failed = result['full_scans'] and not result['allowed']
+        if failed:
+            failures += 1
+            print(f"❌ {name}: full scan")
+        elif result['full_scans'] and args.verbose:
+            print(f"⚠️  {name}: full scan allowed, {result['allowed']}")
+        elif args.verbose:
+            print(f"✅ {name}")
+        if failed or args.verbose:
+            for line in result['plan']:
+                print(f"      {line}")
+
+    print(f"{len(results) - failures} of {len(results)} hot queries use an index")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,7 +2,9 @@ from datetime import datetime, timedelta, date
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
 from models import db, Order, Customer, Allocation, Inventory, Waitlist
-from sqlalchemy import func, and_, extract
+from streaming import InvalidStreamFormat, stream_format, streamed_response
+from conditional import conditional
+from sqlalchemy import and_, case, func
 try:
     import pandas as pd
     PANDAS_AVAILABLE = True
@@ -13,8 +15,101 @@ import base64
 
 reports = Blueprint('reports', __name__)
 
+
+# Report queries; query_plans.py checks their plans
+
+def daily_waitlist_query(report_date):
+    """Waitlist entries added on the date"""
+    return Waitlist.query.filter(
+        and_(
+            Waitlist.added_date >= datetime.combine(report_date, datetime.min.time()),
+            Waitlist.added_date < datetime.combine(report_date + timedelta(days=1), datetime.min.time())
+        )
+    )
+
+
+def tier_breakdown_query(date_from, date_to):
+    """``(tier, count, total_qty)`` of allocations from ``date_from`` up to ``date_to``"""
+    return db.session.query(
+        Customer.tier,
+        func.count(Allocation.id).label('count'),
+        func.sum(Allocation.allocated_qty).label('total_qty')
+    ).join(Allocation).filter(
+        Allocation.allocation_date >= date_from,
+        Allocation.allocation_date < date_to
+    ).group_by(Customer.tier)
+
+
+def daily_allocations_query(date_from, date_to):
+    """``(allocation_date, count, total_qty)`` per day from ``date_from`` up to ``date_to``"""
+    return db.session.query(
+        Allocation.allocation_date,
+        func.count(Allocation.id).label('count'),
+        func.sum(Allocation.allocated_qty).label('total_qty')
+    ).filter(
+        Allocation.allocation_date >= date_from,
+        Allocation.allocation_date < date_to
+    ).group_by(Allocation.allocation_date)
+
+
+def top_customers_query(start_date):
+    """The 20 customers with the most chicks allocated since ``start_date``"""
+    return db.session.query(
+        Customer.id,
+        Customer.customer_id,
+        Customer.farm_name,
+        Customer.tier,
+        func.count(Allocation.id).label('allocation_count'),
+        func.sum(Allocation.allocated_qty).label('total_qty')
+    ).join(Allocation).filter(
+        Allocation.allocation_date >= start_date
+    ).group_by(Customer.id).order_by(
+        func.sum(Allocation.allocated_qty).desc()
+    ).limit(20)
+
+
+def fulfillment_by_tier_query(start_date):
+    """``(tier, total_orders, fulfilled_orders)`` for orders placed since ``start_date``"""
+    return db.session.query(
+        Customer.tier,
+        func.count(Order.id).label('total_orders'),
+        func.sum(case((Order.status == 'allocated', 1), else_=0)).label('fulfilled_orders')
+    ).join(Order).filter(
+        Order.order_date >= datetime.combine(start_date, datetime.min.time())
+    ).group_by(Customer.tier)
+
+
+def waitlist_since_query(start_date):
+    """Waitlist entries added since ``start_date``"""
+    return Waitlist.query.filter(
+        Waitlist.added_date >= datetime.combine(start_date, datetime.min.time())
+    )
+
+
+def export_allocations_query(start_date=None, end_date=None):
+    """Allocation rows with their customer and order, optionally in a date range"""
+    query = db.session.query(
+        Allocation.allocation_date,
+        Allocation.allocated_qty,
+        Allocation.status,
+        Customer.customer_id,
+        Customer.farm_name,
+        Customer.phone,
+        Customer.zone,
+        Customer.tier,
+        Order.order_number
+    ).select_from(Allocation).join(Customer).join(Order, Allocation.order_id == Order.id)
+    
+    if start_date:
+        query = query.filter(Allocation.allocation_date >= start_date)
+    if end_date:
+        query = query.filter(Allocation.allocation_date <= end_date)
+    return query
+
+
 @reports.route('/reports/daily-summary', methods=['GET'])
 @jwt_required()
+@conditional(Inventory, Allocation, Order, Waitlist, Customer)
 def daily_summary():
     """Get daily allocation summary"""
     report_date = request.args.get('date', date.today().isoformat())
@@ -30,12 +125,7 @@ def daily_summary():
     orders = Order.query.filter_by(requested_delivery_date=report_date).all()
     
     # Waitlist
-    waitlist = Waitlist.query.filter(
-        and_(
-            Waitlist.added_date >= datetime.combine(report_date, datetime.min.time()),
-            Waitlist.added_date < datetime.combine(report_date + timedelta(days=1), datetime.min.time())
-        )
-    ).all()
+    waitlist = daily_waitlist_query(report_date).all()
     
     # Calculate metrics
     total_allocated = sum(a.allocated_qty for a in allocations)
@@ -43,13 +133,7 @@ def daily_summary():
     waitlist_count = len([w for w in waitlist if w.status == 'waiting'])
     
     # By tier breakdown
-    tier_breakdown = db.session.query(
-        Customer.tier,
-        func.count(Allocation.id).label('count'),
-        func.sum(Allocation.allocated_qty).label('total_qty')
-    ).join(Allocation).filter(
-        Allocation.allocation_date == report_date
-    ).group_by(Customer.tier).all()
+    tier_breakdown = tier_breakdown_query(report_date, report_date + timedelta(days=1)).all()
     
     summary = {
         'date': report_date.isoformat(),
@@ -88,6 +172,7 @@ def daily_summary():
 
 @reports.route('/reports/weekly-summary', methods=['GET'])
 @jwt_required()
+@conditional(Inventory, Allocation)
 def weekly_summary():
     """Get weekly summary"""
     end_date = request.args.get('end_date', date.today().isoformat())
@@ -133,25 +218,23 @@ def weekly_summary():
 
 @reports.route('/reports/monthly-summary', methods=['GET'])
 @jwt_required()
+@conditional(Inventory, Allocation, Customer)
 def monthly_summary():
     """Get monthly summary"""
     year = request.args.get('year', type=int, default=date.today().year)
     month = request.args.get('month', type=int, default=date.today().month)
     
+    # Month as a date range, so the date indexes apply
+    month_start = date(year, month, 1)
+    month_end = date(year + month // 12, month % 12 + 1, 1)
+    
     # Get all data for the month
     inventory_data = Inventory.query.filter(
-        extract('year', Inventory.date) == year,
-        extract('month', Inventory.date) == month
+        Inventory.date >= month_start,
+        Inventory.date < month_end
     ).all()
     
-    allocations = db.session.query(
-        Allocation.allocation_date,
-        func.count(Allocation.id).label('count'),
-        func.sum(Allocation.allocated_qty).label('total_qty')
-    ).filter(
-        extract('year', Allocation.allocation_date) == year,
-        extract('month', Allocation.allocation_date) == month
-    ).group_by(Allocation.allocation_date).all()
+    allocations = daily_allocations_query(month_start, month_end).all()
     
     # Calculate totals
     total_supply = sum(inv.actual_supply or inv.expected_supply for inv in inventory_data)
@@ -159,14 +242,7 @@ def monthly_summary():
     total_allocation_count = sum(alloc.count for alloc in allocations)
     
     # Customer tier breakdown
-    tier_stats = db.session.query(
-        Customer.tier,
-        func.count(Allocation.id).label('allocation_count'),
-        func.sum(Allocation.allocated_qty).label('total_qty')
-    ).join(Allocation).filter(
-        extract('year', Allocation.allocation_date) == year,
-        extract('month', Allocation.allocation_date) == month
-    ).group_by(Customer.tier).all()
+    tier_stats = tier_breakdown_query(month_start, month_end).all()
     
     summary = {
         'period': {
@@ -198,6 +274,7 @@ def monthly_summary():
 
 @reports.route('/reports/customer-analytics', methods=['GET'])
 @jwt_required()
+@conditional(Customer, Allocation, Order)
 def customer_analytics():
     """Get customer analytics"""
     days = request.args.get('days', type=int, default=30)
@@ -205,18 +282,7 @@ def customer_analytics():
     start_date = end_date - timedelta(days=days)
     
     # Top customers by volume
-    top_customers = db.session.query(
-        Customer.id,
-        Customer.customer_id,
-        Customer.farm_name,
-        Customer.tier,
-        func.count(Allocation.id).label('allocation_count'),
-        func.sum(Allocation.allocated_qty).label('total_qty')
-    ).join(Allocation).filter(
-        Allocation.allocation_date >= start_date
-    ).group_by(Customer.id).order_by(
-        func.sum(Allocation.allocated_qty).desc()
-    ).limit(20).all()
+    top_customers = top_customers_query(start_date).all()
     
     # Customer tier distribution
     tier_distribution = db.session.query(
@@ -225,13 +291,7 @@ def customer_analytics():
     ).filter(Customer.is_active == True).group_by(Customer.tier).all()
     
     # Fulfillment rate by tier
-    fulfillment_stats = db.session.query(
-        Customer.tier,
-        func.count(Order.id).label('total_orders'),
-        func.sum(func.case((Order.status == 'allocated', 1), else_=0)).label('fulfilled_orders')
-    ).join(Order).filter(
-        Order.order_date >= datetime.combine(start_date, datetime.min.time())
-    ).group_by(Customer.tier).all()
+    fulfillment_stats = fulfillment_by_tier_query(start_date).all()
     
     analytics = {
         'period': {
@@ -267,6 +327,7 @@ def customer_analytics():
 
 @reports.route('/reports/waitlist-analysis', methods=['GET'])
 @jwt_required()
+@conditional(Waitlist, Customer)
 def waitlist_analysis():
     """Analyze waitlist patterns"""
     days = request.args.get('days', type=int, default=30)
@@ -274,23 +335,13 @@ def waitlist_analysis():
     start_date = end_date - timedelta(days=days)
     
     # Waitlist statistics
-    total_waitlist = Waitlist.query.filter(
-        Waitlist.added_date >= datetime.combine(start_date, datetime.min.time())
-    ).count()
-    
-    fulfilled = Waitlist.query.filter(
-        Waitlist.added_date >= datetime.combine(start_date, datetime.min.time()),
-        Waitlist.status == 'fulfilled'
-    ).count()
-    
-    waiting = Waitlist.query.filter(
-        Waitlist.added_date >= datetime.combine(start_date, datetime.min.time()),
-        Waitlist.status == 'waiting'
-    ).count()
+    since = waitlist_since_query(start_date)
+    total_waitlist = since.count()
+    fulfilled = since.filter(Waitlist.status == 'fulfilled').count()
+    waiting = since.filter(Waitlist.status == 'waiting').count()
     
     # Average wait time
-    fulfilled_entries = Waitlist.query.filter(
-        Waitlist.added_date >= datetime.combine(start_date, datetime.min.time()),
+    fulfilled_entries = since.filter(
         Waitlist.status == 'fulfilled',
         Waitlist.actual_fulfillment_date.isnot(None)
     ).all()
@@ -307,7 +358,7 @@ def waitlist_analysis():
     tier_waitlist = db.session.query(
         Customer.tier,
         func.count(Waitlist.id).label('total'),
-        func.sum(func.case((Waitlist.status == 'fulfilled', 1), else_=0)).label('fulfilled')
+        func.sum(case((Waitlist.status == 'fulfilled', 1), else_=0)).label('fulfilled')
     ).join(Customer).filter(
         Waitlist.added_date >= datetime.combine(start_date, datetime.min.time())
     ).group_by(Customer.tier).all()
@@ -340,27 +391,29 @@ def waitlist_analysis():
 
 @reports.route('/reports/export/allocations', methods=['GET'])
 @jwt_required()
+@conditional(Allocation, Customer, Order)
 def export_allocations():
-    """Export allocations to Excel"""
+    """Export allocations to Excel, or stream them with ?stream=ndjson|json"""
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    query = db.session.query(
-        Allocation.allocation_date,
-        Allocation.allocated_qty,
-        Allocation.status,
-        Customer.customer_id,
-        Customer.farm_name,
-        Customer.phone,
-        Customer.zone,
-        Customer.tier,
-        Order.order_number
-    ).join(Customer).join(Order)
-    
-    if start_date:
-        query = query.filter(Allocation.allocation_date >= datetime.fromisoformat(start_date).date())
-    if end_date:
-        query = query.filter(Allocation.allocation_date <= datetime.fromisoformat(end_date).date())
+    query = export_allocations_query(
+        datetime.fromisoformat(start_date).date() if start_date else None,
+        datetime.fromisoformat(end_date).date() if end_date else None
+    )
+    
+    try:
+        fmt = stream_format()
+    except InvalidStreamFormat as e:
+        return jsonify({'error': str(e)}), 400
+    if fmt:
+        def export_row(row):
+            result = row._asdict()
+            result['allocation_date'] = row.allocation_date.isoformat()
+            return result
+        
+        query = query.order_by(Allocation.allocation_date, Allocation.id)
+        return streamed_response(query, export_row, fmt)
     
     data = query.all()
     
@@ -1,24 +1,64 @@
 from datetime import datetime, date
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Order, Customer, Inventory, Allocation, Delivery, Waitlist
-from allocation_engine import AllocationEngine
+from models import db, Order, Customer, Inventory, Allocation, Delivery, Waitlist, Notification
+from allocation_engine import AllocationEngine, AllocationInProgress
+from allocation_preview import AllocationPreview
+from simulation import build_scenarios, simulate_date
 from notifications import NotificationService
+from pagination import InvalidCursor, paginated_response
+from conditional import conditional
+from serialization import InvalidProjection, Projection
+from streaming import InvalidStreamFormat
 import traceback
 
 api = Blueprint('api', __name__)
 allocation_engine = AllocationEngine()
+allocation_preview = AllocationPreview(allocation_engine)
 notification_service = NotificationService()
 
+
+@api.errorhandler(InvalidCursor)
+@api.errorhandler(InvalidProjection)
+@api.errorhandler(InvalidStreamFormat)
+def invalid_list_parameter(error):
+    return jsonify({'error': str(error)}), 400
+
+
+def _allocate_late_order(order):
+    """Place a pending order at once if its date has already been allocated"""
+    inventory = Inventory.query.filter_by(date=order.requested_delivery_date).first()
+    if not inventory or not inventory.allocated_at:
+        return None
+    
+    try:
+        # Never hold the request on another run's lock
+        result = allocation_engine.allocate_incremental(order.requested_delivery_date, [order.id],
+                                                        lock_wait=0)
+        allocation_preview.invalidate()
+        return result
+    except AllocationInProgress:
+        # Stays pending for the next incremental pass (the late-order job)
+        return None
+    except Exception:
+        # The order stays pending and is picked up by the next run
+        db.session.rollback()
+        traceback.print_exc()
+        return None
+
+# List queries are built by the functions below from the request arguments,
+# so query_plans.py checks exactly what the endpoints run
+
 # ============= Customer Routes =============
 
-@api.route('/customers', methods=['GET'])
-@jwt_required()
-def get_customers():
-    """Get all customers with optional filtering"""
-    tier = request.args.get('tier')
-    zone = request.args.get('zone')
-    is_active = request.args.get('is_active', 'true').lower() == 'true'
+CUSTOMER_KEYS = [(Customer.id, False)]
+
+
+def customers_query(args):
+    """Customers matching ``tier``, ``zone`` and ``is_active``"""
+    tier = args.get('tier')
+    zone = args.get('zone')
+    is_active = args.get('is_active', 'true').lower() == 'true'
     
     query = Customer.query.filter_by(is_active=is_active)
     
@@ -26,9 +66,21 @@ def get_customers():
         query = query.filter_by(tier=tier)
     if zone:
         query = query.filter_by(zone=zone)
-    
-    customers = query.all()
-    return jsonify([c.to_dict() for c in customers]), 200
+    return query
+
+
+def customer_recent_orders_query(customer_id):
+    """The customer's latest orders, for the customer detail view"""
+    return Order.query.filter_by(customer_id=customer_id).order_by(Order.order_date.desc()).limit(10)
+
+
+@api.route('/customers', methods=['GET'])
+@jwt_required()
+@conditional(Customer)
+def get_customers():
+    """Get all customers with optional filtering"""
+    projection = Projection.from_request(Customer)
+    return paginated_response(customers_query(request.args), CUSTOMER_KEYS, projection)
 
 
 @api.route('/customers', methods=['POST'])
@@ -65,10 +117,10 @@ def get_customer(customer_id):
     customer = Customer.query.get_or_404(customer_id)
     
     # Include order history
-    orders = Order.query.filter_by(customer_id=customer_id).order_by(Order.order_date.desc()).limit(10).all()
+    orders = customer_recent_orders_query(customer_id).all()
     
     result = customer.to_dict()
-    result['recent_orders'] = [o.to_dict() for o in orders]
+    result['recent_orders'] = [o.to_dict(include_customer=False) for o in orders]
     
     return jsonify(result), 200
 
@@ -86,6 +138,10 @@ def update_customer(customer_id):
                 setattr(customer, key, data[key])
         
         db.session.commit()
+        
+        # Tier changes reorder every previewed date
+        allocation_preview.invalidate()
+        
         return jsonify(customer.to_dict()), 200
     except Exception as e:
         db.session.rollback()
@@ -94,14 +150,15 @@ def update_customer(customer_id):
 
 # ============= Order Routes =============
 
-@api.route('/orders', methods=['GET'])
-@jwt_required()
-def get_orders():
-    """Get all orders with filtering"""
-    status = request.args.get('status')
-    customer_id = request.args.get('customer_id', type=int)
-    date_from = request.args.get('date_from')
-    date_to = request.args.get('date_to')
+ORDER_KEYS = [(Order.order_date, True), (Order.id, True)]
+
+
+def orders_query(args):
+    """Orders matching ``status``, ``customer_id`` and a delivery date range"""
+    status = args.get('status')
+    customer_id = args.get('customer_id', type=int)
+    date_from = args.get('date_from')
+    date_to = args.get('date_to')
     
     query = Order.query
     
@@ -113,9 +170,17 @@ def get_orders():
         query = query.filter(Order.requested_delivery_date >= datetime.fromisoformat(date_from).date())
     if date_to:
         query = query.filter(Order.requested_delivery_date <= datetime.fromisoformat(date_to).date())
-    
-    orders = query.order_by(Order.order_date.desc()).all()
-    return jsonify([o.to_dict() for o in orders]), 200
+    return query
+
+
+@api.route('/orders', methods=['GET'])
+@jwt_required()
+@conditional(Order, Customer)
+def get_orders():
+    """Get all orders with filtering"""
+    projection = Projection.from_request(Order)
+    return paginated_response(projection.apply(orders_query(request.args)), ORDER_KEYS,
+                              projection)
 
 
 @api.route('/orders', methods=['POST'])
@@ -138,12 +203,15 @@ def create_order():
             priority_level=data.get('priority_level', 0)
         )
         
+        # Queue the confirmation in the order's transaction
+        customer = Customer.query.get(data['customer_id'])
         db.session.add(order)
+        notification_service.send_order_confirmation(customer, order)
         db.session.commit()
         
-        # Send confirmation notification
-        customer = Customer.query.get(data['customer_id'])
-        notification_service.send_order_confirmation(customer, order)
+        # Late order for an already-allocated date
+        _allocate_late_order(order)
+        allocation_preview.update_order(order)
         
         return jsonify(order.to_dict()), 201
     except Exception as e:
@@ -151,6 +219,14 @@ def create_order():
         return jsonify({'error': str(e)}), 400
 
 
+def order_allocation_query(order_id):
+    return Allocation.query.filter_by(order_id=order_id)
+
+
+def order_delivery_query(order_id):
+    return Delivery.query.filter_by(order_id=order_id)
+
+
 @api.route('/orders/<int:order_id>', methods=['GET'])
 @jwt_required()
 def get_order(order_id):
@@ -160,12 +236,12 @@ def get_order(order_id):
     result = order.to_dict()
     
     # Include allocation if exists
-    allocation = Allocation.query.filter_by(order_id=order_id).first()
+    allocation = order_allocation_query(order_id).first()
     if allocation:
-        result['allocation'] = allocation.to_dict()
+        result['allocation'] = allocation.to_dict(include_customer=False)
     
     # Include delivery if exists
-    delivery = Delivery.query.filter_by(order_id=order_id).first()
+    delivery = order_delivery_query(order_id).first()
     if delivery:
         result['delivery'] = delivery.to_dict()
     
@@ -188,6 +264,12 @@ def update_order(order_id):
                     setattr(order, key, data[key])
         
         db.session.commit()
+        
+        # Changed order that is pending on an already-allocated date
+        if order.status == 'pending':
+            _allocate_late_order(order)
+        allocation_preview.update_order(order)
+        
         return jsonify(order.to_dict()), 200
     except Exception as e:
         db.session.rollback()
@@ -208,6 +290,7 @@ def cancel_order(order_id):
             alloc.status = 'cancelled'
         
         db.session.commit()
+        allocation_preview.remove_order(order_id)
         return jsonify({'message': 'Order cancelled'}), 200
     except Exception as e:
         db.session.rollback()
@@ -216,12 +299,13 @@ def cancel_order(order_id):
 
 # ============= Inventory Routes =============
 
-@api.route('/inventory', methods=['GET'])
-@jwt_required()
-def get_inventory():
-    """Get inventory records"""
-    date_from = request.args.get('date_from')
-    date_to = request.args.get('date_to')
+INVENTORY_KEYS = [(Inventory.date, True), (Inventory.id, True)]
+
+
+def inventory_query(args):
+    """Inventory records in a date range"""
+    date_from = args.get('date_from')
+    date_to = args.get('date_to')
     
     query = Inventory.query
     
@@ -229,9 +313,16 @@ def get_inventory():
         query = query.filter(Inventory.date >= datetime.fromisoformat(date_from).date())
     if date_to:
         query = query.filter(Inventory.date <= datetime.fromisoformat(date_to).date())
-    
-    inventory = query.order_by(Inventory.date.desc()).all()
-    return jsonify([i.to_dict() for i in inventory]), 200
+    return query
+
+
+@api.route('/inventory', methods=['GET'])
+@jwt_required()
+@conditional(Inventory)
+def get_inventory():
+    """Get inventory records"""
+    projection = Projection.from_request(Inventory)
+    return paginated_response(inventory_query(request.args), INVENTORY_KEYS, projection)
 
 
 @api.route('/inventory', methods=['POST'])
@@ -278,6 +369,7 @@ def update_inventory(inventory_id):
                 setattr(inventory, key, data[key])
         
         db.session.commit()
+        allocation_preview.update_inventory(inventory)
         return jsonify(inventory.to_dict()), 200
     except Exception as e:
         db.session.rollback()
@@ -294,31 +386,72 @@ def run_allocation():
         data = request.get_json()
         allocation_date = datetime.fromisoformat(data['date']).date()
         
-        result = allocation_engine.allocate_for_date(allocation_date)
-        
-        # Send notifications
-        for alloc in result['allocated']:
-            customer = Customer.query.get(alloc['customer_id'])
-            notification_service.send_allocation_notification(customer, alloc)
+        result = allocation_engine.allocate_for_date(
+            allocation_date,
+            strategy=data.get('strategy'),
+            allow_partial=data.get('allow_partial'),
+            idempotency_key=request.headers.get('Idempotency-Key')
+        )
         
-        for waitlist in result['waitlisted']:
-            customer = Customer.query.get(waitlist['customer_id'])
-            notification_service.send_waitlist_notification(customer, waitlist)
+        # Customer notifications were queued in the outbox with the allocation
+        # and go out from the notification worker; a replayed run queues nothing
+        if not result.get('replayed'):
+            # Orders, waitlist counts and fulfilment dates have changed
+            allocation_preview.invalidate()
         
         return jsonify(result), 200
+    except AllocationInProgress as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         traceback.print_exc()
         return jsonify({'error': str(e)}), 400
 
 
-@api.route('/allocations', methods=['GET'])
+@api.route('/allocations/preview', methods=['GET'])
 @jwt_required()
-def get_allocations():
-    """Get allocation records"""
-    date_from = request.args.get('date_from')
-    date_to = request.args.get('date_to')
-    customer_id = request.args.get('customer_id', type=int)
-    status = request.args.get('status')
+def preview_allocation():
+    """Preview what an allocation run would do now, without saving anything"""
+    try:
+        allocation_date = datetime.fromisoformat(request.args['date']).date()
+        return jsonify(allocation_preview.get(allocation_date)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@api.route('/allocations/simulate', methods=['POST'])
+@jwt_required()
+def simulate_allocation():
+    """Evaluate supply / cap / strategy scenarios for a date without saving anything"""
+    try:
+        data = request.get_json()
+        allocation_date = datetime.fromisoformat(data['date']).date()
+        
+        scenarios = data.get('scenarios') or build_scenarios(
+            data.get('supply') or [None],
+            data.get('max_per_customer') or [None],
+            data.get('strategy') or [None],
+            data.get('allow_partial')
+        )
+        if len(scenarios) > allocation_engine.config.SIMULATION_MAX_SCENARIOS:
+            return jsonify({'error': 'Too many scenarios'}), 400
+        
+        result = simulate_date(allocation_engine, allocation_date, scenarios,
+                               allocation_engine.config.SIMULATION_MAX_WORKERS)
+        return jsonify(result), 200
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 400
+
+
+ALLOCATION_KEYS = [(Allocation.allocation_date, True), (Allocation.id, True)]
+
+
+def allocations_query(args):
+    """Allocations matching a date range, ``customer_id`` and ``status``"""
+    date_from = args.get('date_from')
+    date_to = args.get('date_to')
+    customer_id = args.get('customer_id', type=int)
+    status = args.get('status')
     
     query = Allocation.query
     
@@ -330,9 +463,35 @@ def get_allocations():
         query = query.filter_by(customer_id=customer_id)
     if status:
         query = query.filter_by(status=status)
-    
-    allocations = query.order_by(Allocation.allocation_date.desc()).all()
-    return jsonify([a.to_dict() for a in allocations]), 200
+    return query
+
+
+@api.route('/allocations', methods=['GET'])
+@jwt_required()
+@conditional(Allocation, Customer)
+def get_allocations():
+    """Get allocation records"""
+    projection = Projection.from_request(Allocation)
+    return paginated_response(projection.apply(allocations_query(request.args)),
+                              ALLOCATION_KEYS, projection)
+
+
+@api.route('/allocations/expire', methods=['POST'])
+@jwt_required()
+def expire_allocations():
+    """Expire allocations past their pickup deadline and reclaim the chicks now"""
+    try:
+        data = request.get_json(silent=True) or {}
+        result = allocation_engine.expire_overdue_allocations(
+            fulfil_waitlist=data.get('fulfil_waitlist')
+        )
+        allocation_preview.invalidate()
+        return jsonify(result), 200
+    except AllocationInProgress as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
 
 
 @api.route('/allocations/<int:allocation_id>/confirm-pickup', methods=['POST'])
@@ -358,18 +517,27 @@ def confirm_pickup(allocation_id):
 
 # ============= Waitlist Routes =============
 
+# Same order as ix_waitlist_queue_score, so each page reads its entries off
+# the index; queue_score is never NULL, so the cursor comparison holds
+WAITLIST_KEYS = [
+    (Waitlist.queue_score, True),
+    (Waitlist.id, False)
+]
+
+
+def waitlist_query(args):
+    """Waitlist entries with ``status`` (default ``waiting``)"""
+    return Waitlist.query.filter_by(status=args.get('status', 'waiting'))
+
+
 @api.route('/waitlist', methods=['GET'])
 @jwt_required()
+@conditional(Waitlist, Customer)
 def get_waitlist():
     """Get waitlist entries"""
-    status = request.args.get('status', 'waiting')
-    
-    waitlist = Waitlist.query.filter_by(status=status).order_by(
-        Waitlist.priority_score.desc(),
-        Waitlist.added_date.asc()
-    ).all()
-    
-    return jsonify([w.to_dict() for w in waitlist]), 200
+    projection = Projection.from_request(Waitlist)
+    return paginated_response(projection.apply(waitlist_query(request.args)), WAITLIST_KEYS,
+                              projection)
 
 
 @api.route('/waitlist/process', methods=['POST'])
@@ -380,26 +548,54 @@ def process_waitlist():
         data = request.get_json()
         allocation_date = datetime.fromisoformat(data['date']).date()
         
-        result = allocation_engine.process_waitlist_fulfillment(allocation_date)
+        result = allocation_engine.process_waitlist_fulfillment(
+            allocation_date,
+            idempotency_key=request.headers.get('Idempotency-Key')
+        )
+        allocation_preview.invalidate()
         return jsonify(result), 200
+    except AllocationInProgress as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
 
+@api.route('/waitlist/sweep', methods=['POST'])
+@jwt_required()
+def sweep_waitlist():
+    """Merge duplicate and expire stale waitlist entries now"""
+    try:
+        result = allocation_engine.sweep_waitlist()
+        allocation_preview.invalidate()
+        return jsonify(result), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+
 # ============= Delivery Routes =============
 
-@api.route('/deliveries', methods=['GET'])
-@jwt_required()
-def get_deliveries():
-    """Get delivery records"""
-    status = request.args.get('status')
+# Newest first; ids follow creation order
+DELIVERY_KEYS = [(Delivery.id, True)]
+
+
+def deliveries_query(args):
+    """Deliveries with ``status``"""
+    status = args.get('status')
     
     query = Delivery.query
     if status:
         query = query.filter_by(delivery_status=status)
-    
-    deliveries = query.order_by(Delivery.created_at.desc()).all()
-    return jsonify([d.to_dict() for d in deliveries]), 200
+    return query
+
+
+@api.route('/deliveries', methods=['GET'])
+@jwt_required()
+@conditional(Delivery)
+def get_deliveries():
+    """Get delivery records"""
+    projection = Projection.from_request(Delivery)
+    return paginated_response(deliveries_query(request.args), DELIVERY_KEYS, projection)
 
 
 @api.route('/deliveries', methods=['POST'])
@@ -450,23 +646,66 @@ def update_delivery(delivery_id):
         return jsonify({'error': str(e)}), 400
 
 
+# ============= Notification Routes =============
+
+NOTIFICATION_KEYS = [(Notification.id, True)]
+
+
+def notifications_query(args):
+    """Notification log entries matching ``status``, ``recipient_type`` and ``notification_type``"""
+    status = args.get('status')
+    recipient_type = args.get('recipient_type')
+    notification_type = args.get('notification_type')
+    
+    query = Notification.query
+    if status:
+        query = query.filter_by(status=status)
+    if recipient_type:
+        query = query.filter_by(recipient_type=recipient_type)
+    if notification_type:
+        query = query.filter_by(notification_type=notification_type)
+    return query
+
+
+@api.route('/notifications', methods=['GET'])
+@jwt_required()
+def get_notifications():
+    """Get the notification log, newest first"""
+    projection = Projection.from_request(Notification)
+    return paginated_response(notifications_query(request.args), NOTIFICATION_KEYS, projection)
+
+
 # ============= Dashboard/Stats Routes =============
 
+def dashboard_queries(today):
+    """Name -> query for each figure on the dashboard"""
+    return {
+        'inventory': Inventory.query.filter_by(date=today),
+        'allocations': Allocation.query.filter_by(allocation_date=today),
+        'orders': Order.query.filter_by(requested_delivery_date=today),
+        'active_customers': Customer.query.filter_by(is_active=True),
+        'pending_orders': Order.query.filter_by(status='pending'),
+        'waiting': Waitlist.query.filter_by(status='waiting'),
+    }
+
+
 @api.route('/dashboard/stats', methods=['GET'])
 @jwt_required()
+@conditional(Inventory, Allocation, Order, Customer, Waitlist)
 def get_dashboard_stats():
     """Get dashboard statistics"""
     today = date.today()
+    queries = dashboard_queries(today)
     
     # Today's stats
-    today_inventory = Inventory.query.filter_by(date=today).first()
-    today_allocations = Allocation.query.filter_by(allocation_date=today).all()
-    today_orders = Order.query.filter_by(requested_delivery_date=today).all()
+    today_inventory = queries['inventory'].first()
+    today_allocations = queries['allocations'].all()
+    today_orders = queries['orders'].all()
     
     # Overall stats
-    total_customers = Customer.query.filter_by(is_active=True).count()
-    pending_orders = Order.query.filter_by(status='pending').count()
-    waitlist_count = Waitlist.query.filter_by(status='waiting').count()
+    total_customers = queries['active_customers'].count()
+    pending_orders = queries['pending_orders'].count()
+    waitlist_count = queries['waiting'].count()
     
     stats = {
         'today': {
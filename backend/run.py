@@ -1,6 +1,12 @@
+import os
 from app import create_app
 
 app = create_app()
 
 if __name__ == '__main__':
+    from jobs import start_scheduler
+
+    # Only in the reloader's serving child, not its watcher process
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_scheduler(app)
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,62 @@
+"""Additive schema upgrades for databases created by an earlier release
+
+``db.create_all()`` only creates missing tables, so columns added to
+existing models are listed here and added in place, and indexes declared
+on the models but missing from the database are created. Indexes removed
+from the models are listed and dropped. Safe to run repeatedly.
+"""
+from sqlalchemy import inspect, text
+from models import db
+
+# (table, column) pairs added to tables after their first release
+ADDED_COLUMNS = [
+    ('inventory', 'allocated_at'),
+    ('allocation_runs', 'heartbeat_at'),
+]
+
+# (table, index) pairs removed from the models; covered by other indexes
+DROPPED_INDEXES = [
+    ('orders', 'ix_orders_status'),
+    ('allocations', 'ix_allocations_date_id'),
+    ('waitlist', 'ix_waitlist_queue'),
+]
+
+
+def _index_names(conn, inspector, table_name):
+    """Names of a table's indexes, expression indexes included"""
+    if conn.dialect.name == 'sqlite':
+        # SQLite reflection skips indexes on expressions
+        return set(conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"
+        ), {'table': table_name}).scalars())
+    return {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def upgrade_schema():
+    """Create missing tables, columns and indexes; drop removed indexes"""
+    db.create_all()
+    
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table_name, column_name in ADDED_COLUMNS:
+            existing = {c['name'] for c in inspector.get_columns(table_name)}
+            if column_name in existing:
+                continue
+            
+            column = db.metadata.tables[table_name].c[column_name]
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}'))
+            print(f"✅ Added column {table_name}.{column_name}")
+        
+        for table in db.metadata.sorted_tables:
+            existing = _index_names(conn, inspector, table.name)
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
+                    print(f"✅ Created index {index.name}")
+        
+        for table_name, index_name in DROPPED_INDEXES:
+            existing = _index_names(conn, inspector, table_name)
+            if index_name in existing:
+                conn.execute(text(f'DROP INDEX {index_name}'))
+                print(f"✅ Dropped index {index_name}")
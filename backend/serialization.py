@@ -0,0 +1,85 @@
+"""Sparse fieldsets, expansion and side-loading for list responses
+
+List endpoints accept:
+
+- ``?fields=id,status,order_qty``: only these keys of each row
+- ``?expand=customer``: embed each row's customer
+- ``?include=customer``: return ``{"data": [...], "included": {"customers":
+  {id: customer}}}`` with every customer serialized once
+
+Relationships are eager-loaded only when expanded or included, so a page
+costs one query (plus one per relationship) instead of one per row.
+"""
+from typing import Dict, List, Optional, Sequence
+from flask import request
+from sqlalchemy.orm import joinedload
+
+# Relationships that can be expanded or side-loaded -> ``included`` key
+RELATIONSHIPS = {'customer': 'customers'}
+
+
+class InvalidProjection(ValueError):
+    """Raised for a ``fields``/``expand``/``include`` the endpoint cannot serve"""
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+class Projection:
+    """Serializer for one list response"""
+
+    def __init__(self, model, fields: Sequence[str] = (), expand: Sequence[str] = (),
+                 include: Sequence[str] = ()):
+        relationships = model.__mapper__.relationships
+        for name in list(expand) + list(include):
+            if name not in RELATIONSHIPS or name not in relationships:
+                raise InvalidProjection(f"Cannot expand {name} on {model.__tablename__}")
+
+        self.model = model
+        self.fields = set(fields)
+        self.expand = set(expand) - set(include)
+        self.include = set(include)
+        # Only models with a customer take include_customer
+        self._to_dict_kwargs = (
+            {'include_customer': 'customer' in self.expand} if 'customer' in relationships else {}
+        )
+
+    @classmethod
+    def from_request(cls, model):
+        return cls(model, _split(request.args.get('fields')),
+                   _split(request.args.get('expand')), _split(request.args.get('include')))
+
+    def apply(self, query):
+        """Eager-load the relationships this response serializes"""
+        loaded = self.expand | self.include
+        if not loaded:
+            return query
+        return query.options(*[joinedload(getattr(self.model, name)) for name in sorted(loaded)])
+
+    def row(self, row) -> Dict:
+        result = row.to_dict(**self._to_dict_kwargs)
+        if self.fields:
+            keep = self.fields | self.expand
+            result = {key: value for key, value in result.items() if key in keep}
+        return result
+
+    def stream_row(self):
+        """Row serializer for a streamed response, which cannot side-load"""
+        if self.include:
+            raise InvalidProjection("include cannot be combined with stream; use expand")
+        return self.row
+
+    def __call__(self, rows: Sequence):
+        data = [self.row(row) for row in rows]
+        if not self.include:
+            return data
+
+        included = {RELATIONSHIPS[name]: {} for name in self.include}
+        for row in rows:
+            for name in self.include:
+                related = getattr(row, name)
+                bucket = included[RELATIONSHIPS[name]]
+                if related is not None and related.id not in bucket:
+                    bucket[related.id] = related.to_dict()
+        return {'data': data, 'included': included}
@@ -0,0 +1,213 @@
+"""What-if allocation scenarios for a day's order book, without writing anything
+
+The date's pending orders are loaded and scored once into plain tuples.
+Scenarios (supply level, ``MAX_PER_CUSTOMER``, strategy) then run through
+the allocation kernel, in-process unless ``SIMULATION_MAX_WORKERS`` opts
+in to the shared worker processes (see ``process_pool``); each worker then
+gets one batch of scenarios with the order book, rather than the book once
+per scenario.
+
+Command line::
+
+    python simulation.py --date 2025-11-10 --supply 8000 10000 12000 \\
+        --max-per-customer 500 1000 --strategy greedy best_fit
+"""
+import argparse
+import json
+from datetime import date, datetime
+from itertools import product
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy.orm import joinedload
+from models import Order, Inventory
+from allocation_core import TIER_ORDER, OrderRecord
+from allocation_engine import STRATEGIES
+import allocation_core
+import allocation_zones
+import process_pool
+
+# (order_id, customer_id, tier, order_qty, priority_score, zone)
+BookEntry = Tuple[int, int, str, int, float, str]
+
+
+def load_order_book(engine, allocation_date: date) -> Tuple[int, List[BookEntry]]:
+    """``(supply, entries)`` for a date's pending orders, scored as of now"""
+    inventory = Inventory.query.filter_by(date=allocation_date).first()
+    if not inventory:
+        raise ValueError(f"No inventory found for {allocation_date}")
+
+    orders = Order.query.options(joinedload(Order.customer)).filter(
+        Order.requested_delivery_date == allocation_date,
+        Order.status == 'pending'
+    ).order_by(Order.id).all()
+    records = engine._calculate_priority_scores(
+        orders, datetime.utcnow(), engine._waiting_counts_for_date(allocation_date)
+    )
+
+    supply = inventory.actual_supply or inventory.expected_supply
+    return supply, [(r.order_id, r.customer_id, r.tier, r.order_qty, r.priority_score, r.zone)
+                    for r in records]
+
+
+def build_scenarios(supplies: Iterable[int], max_per_customer: Iterable[int],
+                    strategies: Iterable[str], allow_partial: bool = False) -> List[Dict]:
+    """Every combination of the given supply levels, caps and strategies"""
+    return [
+        {'supply': supply, 'max_per_customer': cap, 'strategy': strategy,
+         'allow_partial': allow_partial}
+        for supply, cap, strategy in product(supplies, max_per_customer, strategies)
+    ]
+
+
+def run_scenario(book: List[BookEntry], supply: int, max_per_customer: int,
+                 strategy: str = 'greedy', allow_partial: bool = False,
+                 min_partial_qty: int = 1, remote_zones: Tuple[str, ...] = (),
+                 remote_reserve_pct: int = 0) -> Dict:
+    """Allocate the order book under one scenario and summarise it per tier"""
+    records = [OrderRecord(order_id, customer_id, tier, order_qty, score, zone=zone)
+               for order_id, customer_id, tier, order_qty, score, zone in book]
+    if strategy == allocation_zones.ZONED:
+        # Scenarios already run in parallel, so zones run in-process here
+        allocated, waitlisted, remaining = allocation_zones.allocate_zoned(
+            records, supply, max_per_customer, remote_zones, remote_reserve_pct,
+            allow_partial=allow_partial, min_partial_qty=min_partial_qty
+        )
+    else:
+        allocated, waitlisted, remaining = allocation_core.allocate(
+            records, supply, max_per_customer, strategy, allow_partial, min_partial_qty
+        )
+
+    tiers = {tier: {'orders': 0, 'allocated_orders': 0, 'requested_qty': 0, 'allocated_qty': 0}
+             for tier in TIER_ORDER}
+    for record in records:
+        stats = tiers.get(record.tier)
+        if stats is None:
+            continue
+        stats['orders'] += 1
+        stats['requested_qty'] += record.order_qty
+    for record in allocated:
+        stats = tiers[record.tier]
+        stats['allocated_orders'] += 1
+        stats['allocated_qty'] += record.allocated_qty
+    for stats in tiers.values():
+        requested = stats['requested_qty']
+        stats['fill_rate'] = round(stats['allocated_qty'] / requested * 100, 2) if requested else 0
+
+    return {
+        'supply': supply,
+        'max_per_customer': max_per_customer,
+        'strategy': strategy,
+        'allow_partial': allow_partial,
+        'allocated': len(allocated),
+        'waitlisted': len(waitlisted),
+        'allocated_qty': supply - remaining,
+        'remaining': remaining,
+        'utilization': round((supply - remaining) / supply * 100, 2) if supply else 0,
+        'tiers': tiers
+    }
+
+
+def _run_batch(book: List[BookEntry], scenarios: List[Dict]) -> List[Dict]:
+    return [run_scenario(book, **scenario) for scenario in scenarios]
+
+
+def simulate(book: List[BookEntry], scenarios: List[Dict], max_workers: int = 1) -> List[Dict]:
+    """Run scenarios over the order book, across ``max_workers`` processes if more than 1
+
+    Results come back in scenario order.
+    """
+    for scenario in scenarios:
+        if scenario.get('strategy', 'greedy') not in STRATEGIES:
+            raise ValueError(f"Unknown allocation strategy: {scenario['strategy']}")
+        if int(scenario['supply']) < 0 or int(scenario['max_per_customer']) < 1:
+            raise ValueError("Scenario supply and max_per_customer must be positive")
+
+    workers = min(process_pool.worker_count(max_workers), len(scenarios))
+    if workers < 2:
+        return _run_batch(book, scenarios)
+
+    # One contiguous batch per worker keeps results in scenario order
+    size = -(-len(scenarios) // workers)
+    batches = [(book, scenarios[start:start + size]) for start in range(0, len(scenarios), size)]
+    return [result for batch in process_pool.run_batches(_run_batch, batches) for result in batch]
+
+
+def simulate_date(engine, allocation_date: date, scenarios: List[Dict],
+                  max_workers: int = 1) -> Dict:
+    """Simulate scenarios for a date, filling gaps from the engine's settings
+
+    Scenarios missing ``supply`` use the inventory's supply; missing
+    ``max_per_customer``, ``strategy``, ``allow_partial``,
+    ``min_partial_qty``, ``remote_zones`` and ``remote_reserve_pct`` use the
+    engine's configuration.
+    """
+    supply, book = load_order_book(engine, allocation_date)
+    defaults = {
+        'supply': supply,
+        'max_per_customer': engine.max_per_customer,
+        'strategy': engine.strategy,
+        'allow_partial': engine.allow_partial,
+        'min_partial_qty': engine.min_partial_qty,
+        'remote_zones': tuple(engine.remote_zones),
+        'remote_reserve_pct': engine.remote_reserve_pct
+    }
+    scenarios = [dict(defaults, **{k: v for k, v in s.items() if v is not None})
+                 for s in scenarios]
+
+    return {
+        'allocation_date': allocation_date.isoformat(),
+        'total_orders': len(book),
+        'scenarios': simulate(book, scenarios, max_workers)
+    }
+
+
+def _print_table(result: Dict):
+    print(f"Allocation date: {result['allocation_date']}  "
+          f"Pending orders: {result['total_orders']}")
+    header = f"{'Supply':>8} {'Max':>6} {'Strategy':>9} {'Alloc':>6} {'Wait':>6} {'Left':>7} {'Util%':>7}"
+    header += ''.join(f" {tier + '%':>9}" for tier in TIER_ORDER)
+    print(header)
+    for s in result['scenarios']:
+        line = (f"{s['supply']:>8} {s['max_per_customer']:>6} {s['strategy']:>9} "
+                f"{s['allocated']:>6} {s['waitlisted']:>6} {s['remaining']:>7} {s['utilization']:>7}")
+        line += ''.join(f" {s['tiers'][tier]['fill_rate']:>9}" for tier in TIER_ORDER)
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate allocation scenarios for a date')
+    parser.add_argument('--date', required=True, help='Allocation date (YYYY-MM-DD)')
+    parser.add_argument('--supply', type=int, nargs='+',
+                        help='Supply levels (default: the inventory supply)')
+    parser.add_argument('--max-per-customer', type=int, nargs='+',
+                        help='Per-customer caps (default: MAX_PER_CUSTOMER)')
+    parser.add_argument('--strategy', nargs='+', choices=STRATEGIES,
+                        help='Allocation strategies (default: ALLOCATION_STRATEGY)')
+    parser.add_argument('--allow-partial', action='store_true', help='Allow partial fills')
+    parser.add_argument('--workers', type=int,
+                        help=f'Worker processes (default: SIMULATION_MAX_WORKERS, at most {process_pool.MAX_WORKERS})')
+    parser.add_argument('--json', action='store_true', help='Print the raw JSON result')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+    from allocation_engine import AllocationEngine
+
+    app = create_app()
+    with app.app_context():
+        engine = AllocationEngine()
+        scenarios = build_scenarios(
+            args.supply or [None], args.max_per_customer or [None],
+            args.strategy or [None], args.allow_partial or None
+        )
+        result = simulate_date(
+            engine, datetime.fromisoformat(args.date).date(), scenarios,
+            args.workers or engine.config.SIMULATION_MAX_WORKERS
+        )
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        _print_table(result)
+
+
+if __name__ == '__main__':
+    main()
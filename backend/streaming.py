@@ -0,0 +1,65 @@
+"""Streamed list responses for large listings and exports
+
+With ``?stream=ndjson`` (or ``Accept: application/x-ndjson``) a listing is
+sent as one JSON object per line; with ``?stream=json`` as a single JSON
+array encoded as it goes. Rows are read with ``yield_per`` and written in
+batches of ``STREAM_BATCH_SIZE``, so memory stays flat however many rows
+there are and the first rows go out before the query is exhausted.
+"""
+import json
+from typing import Callable, Dict, Optional
+from flask import Response, current_app, request, stream_with_context
+
+NDJSON = 'ndjson'
+JSON_ARRAY = 'json'
+FORMATS = {NDJSON: 'application/x-ndjson', JSON_ARRAY: 'application/json'}
+
+
+class InvalidStreamFormat(ValueError):
+    """Raised for a ``stream`` format other than ndjson or json"""
+
+
+def stream_format() -> Optional[str]:
+    """Requested stream format, or None for a regular response"""
+    fmt = request.args.get('stream')
+    if fmt is None:
+        if request.accept_mimetypes.best == FORMATS[NDJSON]:
+            return NDJSON
+        return None
+    if fmt not in FORMATS:
+        raise InvalidStreamFormat(f"Unknown stream format: {fmt}")
+    return fmt
+
+
+def _encode(row: Dict) -> str:
+    return json.dumps(row, separators=(',', ':'), default=str)
+
+
+def _chunks(query, serialize_row: Callable, fmt: str, batch_size: int):
+    first = True
+    batch = []
+    if fmt == JSON_ARRAY:
+        yield '['
+    for row in query.yield_per(batch_size):
+        encoded = _encode(serialize_row(row))
+        if fmt == NDJSON:
+            batch.append(encoded + '\n')
+        else:
+            batch.append(encoded if first else ',' + encoded)
+            first = False
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+    if fmt == JSON_ARRAY:
+        yield ']'
+
+
+def streamed_response(query, serialize_row: Callable, fmt: str) -> Response:
+    """Stream an ordered query's rows in ``fmt``"""
+    batch_size = current_app.config['STREAM_BATCH_SIZE']
+    return Response(
+        stream_with_context(_chunks(query, serialize_row, fmt, batch_size)),
+        mimetype=FORMATS[fmt]
+    )
@@ -0,0 +1,201 @@
+"""Concurrent allocation stress test
+
+Seeds a scratch database with one day's orders, then has several threads
+race full runs, retries under an idempotency key, waitlist runs and late
+orders allocated incrementally against that day. Afterwards it checks that
+the run lock held:
+
+- allocations never exceed the day's supply, and inventory totals match the
+  allocation rows
+- no order has more than one allocation for the date
+- no order has more than one waiting waitlist entry, beyond the duplicates
+  seeded on purpose, and none is fulfilled twice from them
+- nothing failed except ``AllocationInProgress`` (a run that waited out
+  ``ALLOCATION_LOCK_WAIT_SECONDS``)
+
+Uses a temporary SQLite file unless ``--database-url`` names another
+scratch database (its tables are dropped). Exits non-zero on a violation::
+
+    python stress_allocation.py --threads 12 --ops 6 --write-mode bulk
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
+
+OPERATIONS = ('run', 'run', 'retry', 'waitlist', 'late')
+
+
+def seed(db, day: date, orders: int, customers: int, supply: int,
+         rnd: random.Random) -> Tuple[List[int], int]:
+    """Fresh tables with a day's pending orders; returns the customer ids and
+    how many orders were given a duplicate waiting entry"""
+    from models import Customer, Inventory, Order, Waitlist
+
+    db.drop_all()
+    db.create_all()
+    rows = [Customer(customer_id=f'S{i:05d}', farm_name=f'Stress Farm {i}',
+                     phone=f'+2547{i:08d}', zone=rnd.choice(['North', 'South', 'East', 'West']),
+                     tier=rnd.choice(['Contract', 'Loyal', 'New']))
+            for i in range(customers)]
+    db.session.add_all(rows)
+    db.session.flush()
+    customer_ids = [customer.id for customer in rows]
+
+    for i in range(orders):
+        db.session.add(Order(
+            order_number=f'S-{i:06d}', customer_id=rnd.choice(customer_ids),
+            order_qty=rnd.choice([100, 200, 500, 800, 1200]), status='pending',
+            order_date=datetime.utcnow() - timedelta(days=rnd.randint(0, 10)),
+            requested_delivery_date=day, priority_level=rnd.randint(0, 2)
+        ))
+    db.session.add(Inventory(date=day, expected_supply=supply))
+    db.session.commit()
+
+    # Carried over from earlier days' runs; some orders were waitlisted twice
+    carried = Order.query.order_by(Order.id).limit(orders // 10).all()
+    duplicated = 0
+    for index, order in enumerate(carried):
+        order.status = 'waitlisted'
+        entries = 2 if index % 5 == 0 else 1
+        duplicated += entries - 1
+        for _ in range(entries):
+            db.session.add(Waitlist(order_id=order.id, customer_id=order.customer_id,
+                                    requested_qty=order.order_qty, status='waiting'))
+    db.session.commit()
+    return customer_ids, duplicated
+
+
+def _worker(app, day: date, customer_ids: List[int], index: int, ops: int, options: Dict,
+            outcomes: Counter, errors: List[str], lock: threading.Lock):
+    from allocation_engine import AllocationEngine, AllocationInProgress
+    from models import Inventory, Order, db
+
+    rnd = random.Random(index)
+    with app.app_context():
+        engine = AllocationEngine()
+        for step in range(ops):
+            op = rnd.choice(OPERATIONS)
+            try:
+                if op == 'run':
+                    engine.allocate_for_date(day, **options)
+                elif op == 'retry':
+                    # Threads share keys, so most of these replay another's run
+                    engine.allocate_for_date(day, idempotency_key=f'stress-{step}', **options)
+                elif op == 'waitlist':
+                    engine.process_waitlist_fulfillment(day)
+                else:
+                    order = Order(order_number=f'S-late-{index}-{step}',
+                                  customer_id=rnd.choice(customer_ids),
+                                  order_qty=rnd.choice([200, 500, 1000]), status='pending',
+                                  requested_delivery_date=day)
+                    db.session.add(order)
+                    db.session.commit()
+                    if Inventory.query.filter_by(date=day).first().allocated_at:
+                        engine.allocate_incremental(day, [order.id],
+                                                    write_mode=options.get('write_mode'))
+                result = op
+            except AllocationInProgress:
+                result = 'busy'
+            except Exception as e:
+                db.session.rollback()
+                result = 'error'
+                with lock:
+                    errors.append(f"{op}: {e!r}")
+            with lock:
+                outcomes[result] += 1
+
+
+def check(db, day: date, duplicated: int = 0) -> List[str]:
+    """Invariant violations for the day, if any"""
+    from sqlalchemy import func
+    from models import Allocation, Inventory, Waitlist
+
+    problems = []
+    inventory = Inventory.query.filter_by(date=day).first()
+    allocated = db.session.query(func.coalesce(func.sum(Allocation.allocated_qty), 0)).filter(
+        Allocation.allocation_date == day
+    ).scalar()
+    if allocated > inventory.expected_supply:
+        problems.append(f"over-allocated: {allocated} of {inventory.expected_supply}")
+    if inventory.allocated_at and (inventory.allocated != allocated or
+                                   inventory.remaining != inventory.expected_supply - allocated):
+        problems.append(f"inventory totals {inventory.allocated}/{inventory.remaining} "
+                        f"do not match {allocated} allocated")
+
+    duplicates = db.session.query(Allocation.order_id).filter(
+        Allocation.allocation_date == day
+    ).group_by(Allocation.order_id).having(func.count() > 1).count()
+    if duplicates:
+        problems.append(f"{duplicates} orders allocated more than once")
+
+    waiting = db.session.query(Waitlist.order_id).filter(
+        Waitlist.status == 'waiting'
+    ).group_by(Waitlist.order_id).having(func.count() > 1).count()
+    if waiting > duplicated:
+        problems.append(f"{waiting - duplicated} orders waitlisted more than once")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Race concurrent allocation runs on one day')
+    parser.add_argument('--threads', type=int, default=12)
+    parser.add_argument('--ops', type=int, default=6, help='Operations per thread')
+    parser.add_argument('--orders', type=int, default=1500)
+    parser.add_argument('--customers', type=int, default=300)
+    # Short of the day's demand, with enough left over for the waitlist
+    parser.add_argument('--supply', type=int, default=900000)
+    parser.add_argument('--write-mode', choices=('orm', 'bulk'))
+    parser.add_argument('--engine', choices=('python', 'numpy', 'sql'))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help='Scratch database (default: a temporary SQLite file)')
+    args = parser.parse_args(argv)
+
+    scratch = None
+    if not args.database_url:
+        scratch = tempfile.mkdtemp(prefix='chickflow-stress-')
+        args.database_url = f"sqlite:///{os.path.join(scratch, 'stress.db')}"
+    # Read by Config when the app is imported
+    os.environ['DATABASE_URL'] = args.database_url
+
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    day = date.today() + timedelta(days=1)
+    options = {key: value for key, value in (('write_mode', args.write_mode),
+                                             ('engine', args.engine)) if value}
+    with app.app_context():
+        customer_ids, duplicated = seed(db, day, args.orders, args.customers, args.supply,
+                            random.Random(args.seed))
+
+    outcomes, errors, lock = Counter(), [], threading.Lock()
+    threads = [threading.Thread(target=_worker, args=(app, day, customer_ids, i, args.ops,
+                                                      options, outcomes, errors, lock))
+               for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        problems = check(db, day, duplicated) + errors
+        db.session.remove()
+        db.engine.dispose()
+
+    print(json.dumps({'database': args.database_url, 'outcomes': dict(outcomes),
+                      'problems': problems}, indent=2))
+    if scratch:
+        os.remove(os.path.join(scratch, 'stress.db'))
+        os.rmdir(scratch)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -37,4 +37,19 @@ api.interceptors.response.use(
   }
 )
 
+// List endpoints return one page per call; follow X-Next-Cursor to get every row
+export const getAll = async (url, config = {}) => {
+  const rows = []
+  let cursor = null
+  do {
+    const response = await api.get(url, {
+      ...config,
+      params: { limit: 1000, ...config.params, ...(cursor && { cursor }) },
+    })
+    rows.push(...response.data)
+    cursor = response.headers['x-next-cursor']
+  } while (cursor)
+  return rows
+}
+
 export default api
@@ -20,7 +20,7 @@ import {
 import { Add as AddIcon } from '@mui/icons-material'
 import { format } from 'date-fns'
 import { toast } from 'react-toastify'
-import api from '../api/client'
+import api, { getAll } from '../api/client'
 
 export default function Orders() {
   const [orders, setOrders] = useState([])
@@ -40,8 +40,7 @@ export default function Orders() {
 
   const fetchOrders = async () => {
     try {
-      const response = await api.get('/orders')
-      setOrders(response.data)
+      setOrders(await getAll('/orders', { params: { expand: 'customer' } }))
     } catch (error) {
       toast.error('Error fetching orders')
     }
@@ -49,8 +48,7 @@ export default function Orders() {
 
   const fetchCustomers = async () => {
     try {
-      const response = await api.get('/customers')
-      setCustomers(response.data)
+      setCustomers(await getAll('/customers'))
     } catch (error) {
       console.error('Error fetching customers:', error)
     }